@@ -1,29 +1,24 @@
 from typing import Dict, Any
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import MessagesState
 from langgraph.prebuilt import ToolNode
 
-from llm.model import get_llm
+from graph import tool_loop
+from graph.prefetch import model_input
+from llm.resilient import unavailable_reply
+from llm.routing import role_llm
+from llm.scheduler import NORMAL
 from tools.mcp_tools import change_pin_tool
 
 TOOLS = [change_pin_tool]
-LLM = get_llm().bind_tools(TOOLS)
+LLM = role_llm("change_pin", NORMAL, tools=TOOLS, fallback=unavailable_reply)
+tool_node = ToolNode(TOOLS, handle_tool_errors=True)
 
-def change_pin_llm_agent(state: MessagesState) -> Dict[str, Any]:
+def change_pin_llm_agent(state: MessagesState, config: RunnableConfig) -> Dict[str, Any]:
     """
     Agent that handles PIN change requests.
     """
     messages = state["messages"]
-    ai_msg = LLM.invoke(messages)
-    return {"messages": messages + [ai_msg]}
-
-tool_node = ToolNode(TOOLS)
-
-def route_after_llm(state: MessagesState) -> str:
-    """
-    Go to tools if the LLM called one, otherwise end.
-    """
-    last = state["messages"][-1]
-    tool_calls = getattr(last, "tool_calls", None)
-    if tool_calls:
-        return "tools"
-    return "end"
+    # client memory and this turn's prefetched lookups spare a listing/lookup round
+    new = tool_loop.run(LLM, tool_node, model_input(state), config)
+    return {"messages": messages + new, "prefetched": None}
@@ -1,25 +1,23 @@
 from typing import Dict, Any
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import MessagesState
 from langgraph.prebuilt import ToolNode
-from llm.model import get_llm
+from graph import tool_loop
+from graph.prefetch import model_input
+from llm.resilient import unavailable_reply
+from llm.routing import role_llm
+from llm.scheduler import NORMAL
 from tools.mcp_tools import create_card_tool
 
 TOOLS = [create_card_tool]
-LLM = get_llm().bind_tools(TOOLS)
+LLM = role_llm("create_card", NORMAL, tools=TOOLS, fallback=unavailable_reply)
+tool_node = ToolNode(TOOLS, handle_tool_errors=True)
 
-def create_card_llm_agent(state: MessagesState) -> Dict[str, Any]:
+def create_card_llm_agent(state: MessagesState, config: RunnableConfig) -> Dict[str, Any]:
     """
     Agent responsible for card creation requests.
     """
     messages = state["messages"]
-    ai_msg = LLM.invoke(messages)
-    return {"messages": messages + [ai_msg]}
-
-tool_node = ToolNode(TOOLS)
-
-def route_after_llm(state: MessagesState) -> str:
-    last = state["messages"][-1]
-    tool_calls = getattr(last, "tool_calls", None)
-    if tool_calls:
-        return "tools"
-    return "end"
+    # client memory and this turn's prefetched lookups spare a listing/lookup round
+    new = tool_loop.run(LLM, tool_node, model_input(state), config)
+    return {"messages": messages + new, "prefetched": None}
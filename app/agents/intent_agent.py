@@ -1,34 +1,67 @@
-from typing import Dict, Any
-from langgraph.graph import MessagesState
-from llm.model import get_llm
+import re
+from typing import Dict, Any, List, Union
+from langgraph.graph import MessagesState, END
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import Send
+from llm.routing import role_llm
+from llm.scheduler import URGENT, LLMOverloaded
+from llm.fallback import classify
+import resilience
+from graph import prefetch
+from graph.state import AgentState
 
-# Initialize model
-LLM = get_llm()
+# Initialize model; classification is on every turn's critical path, so it
+# is hedged against the secondary endpoint when one is configured. A reply
+# with no usable label is retried on the large model.
+LLM = role_llm("intent", URGENT, validate=lambda msg: valid_labels(msg.content), hedge=True)
 
-def intent_llm_agent(state: MessagesState) -> Dict[str, Any]:
+# intent label -> specialist node
+SPECIALISTS = {
+    "change_pin": "change_pin_agent",
+    "view_card": "view_card_agent",
+    "create_card": "create_card_agent",
+    "stop_card": "stop_card_agent",
+}
+
+def intent_llm_agent(state: MessagesState, config: RunnableConfig) -> Dict[str, Any]:
 
     messages = state["messages"]
     user_input = messages[-1].content
+    # lookups the specialist will likely need run while the model classifies
+    pending = prefetch.start(messages, config)
 
     # Ask the model to classify intent
     prompt = (
-        f"Classify the user request into one of the following intents:\n"
+        f"Classify the user request into one or more of the following intents:\n"
         f" - change_pin\n - view_card\n - create_card\n - stop_card\n - end\n\n"
         f"User message: {user_input}\n"
-        f"Answer ONLY with one of these labels."
+        f"Answer ONLY with the matching labels, comma-separated, in the order the user asked."
     )
-    ai_msg = LLM.invoke(prompt)
+    try:
+        ai_msg = LLM.invoke(prompt)
+    except (resilience.CircuitOpen, resilience.DeadlineExceeded, LLMOverloaded):
+        # degraded: keyword match on the user's words
+        ai_msg = AIMessage(content=classify(user_input))
 
     intent = ai_msg.content.strip().lower()
-    state["intent"] = intent
-    return {"messages": messages + [ai_msg], "intent": intent}
+    intents = parse_intents(intent)
+    update = {"messages": messages + [ai_msg], "intent": intent, "intents": intents}
+    if len(intents) > 1:
+        update["branch_results"] = None  # start the fan-out from an empty join
+    if pending is not None:
+        results = pending.collect()
+        if intents:
+            update["prefetched"] = results
+        else:
+            prefetch.discard(results)
+    return update
 
 
-def route_intent(state: MessagesState) -> str:
+def intent_label(intent: str) -> str:
     """
-    Routes based on the detected intent.
+    Maps one model label (possibly loosely worded) to a known intent.
     """
-    intent = state.get("intent", "")
     if "pin" in intent:
         return "change_pin"
     if "view" in intent or "details" in intent:
@@ -38,3 +71,32 @@ def route_intent(state: MessagesState) -> str:
     if "stop" in intent or "block" in intent or "delete" in intent:
         return "stop_card"
     return "end"
+
+
+def parse_intents(text: str) -> List[str]:
+    labels = []
+    for part in re.split(r"[,;\n]|\band\b", text):
+        label = intent_label(part.strip())
+        if label != "end" and label not in labels:
+            labels.append(label)
+    return labels
+
+
+def valid_labels(text: str) -> bool:
+    text = text.strip().lower().rstrip(".")
+    return bool(parse_intents(text)) or text == "end"
+
+
+def route_intent(state: AgentState) -> Union[List[Send], str]:
+    """
+    One intent goes straight to its specialist. Several fan out with one Send
+    per intent: the branches run in the same superstep and join_branches
+    merges their replies.
+    """
+    intents = state.get("intents") or []
+    if not intents:
+        return END
+    if len(intents) == 1:
+        return SPECIALISTS[intents[0]]
+    branch_state = {"messages": state["messages"], "intents": intents, "prefetched": state.get("prefetched")}
+    return [Send(SPECIALISTS[label], {**branch_state, "intent": label}) for label in intents]
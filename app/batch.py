@@ -0,0 +1,166 @@
+"""
+Offline batch runner for non-interactive channels (email, back-office tickets).
+
+Reads a JSONL file of {"thread_id": ..., "message": ...} items, runs each
+through the compiled graph and appends one result line per item to the
+output JSONL. Items of the same thread_id run in input order, one at a time;
+different threads run on a bounded worker pool. The pool is sized above the
+model-call cap so the model server always has --llm-parallel prompts in
+flight (match OLLAMA_NUM_PARALLEL) while other workers are between calls.
+
+The output file is the progress checkpoint: rerunning with the same
+arguments skips every input line already written there (an item that was
+mid-turn during a crash runs again). Failed items go to <output>.errors.jsonl
+instead, so a rerun retries them.
+
+Each turn gets its own budget (BATCH_TURN_BUDGET_MS, long enough for the
+BATCH class's queue deadline), and its model calls are tracked by a separate
+batch breaker (llm/resilient.py): a backlog stuck behind interactive traffic
+never opens the breaker interactive turns depend on.
+
+    python batch.py tickets.jsonl results.jsonl --llm-parallel 4
+    python batch.py tickets.jsonl results.jsonl --checkpointer memory
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Set, Tuple
+
+BATCH_TURN_BUDGET_MS = float(os.getenv("BATCH_TURN_BUDGET_MS", "600000"))
+
+
+def _completed(path: str) -> Set[int]:
+    """
+    Input line numbers already in the output (completed items only; errors
+    are written elsewhere); drops a torn last line left by a crash.
+    """
+    done: Set[int] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                done.add(json.loads(line)["line"])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+
+def _load(path: str, skip: Set[int]) -> Tuple["OrderedDict[str, List[Tuple[int, str]]]", int]:
+    threads: "OrderedDict[str, List[Tuple[int, str]]]" = OrderedDict()
+    total = 0
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            if not line.strip():
+                continue
+            total += 1
+            if n in skip:
+                continue
+            item = json.loads(line)
+            threads.setdefault(str(item["thread_id"]), []).append((n, item["message"]))
+    return threads, total
+
+
+def _reply(messages: List[Any], final_intent: str) -> str:
+    # this turn's messages follow the last human one; the answer is the last AI
+    # text, unless no specialist ran and that is the intent label ("end")
+    start = max((i for i, m in enumerate(messages) if getattr(m, "type", "") == "human"), default=-1) + 1
+    texts = [m.content for m in messages[start:] if getattr(m, "type", "") == "ai" and isinstance(m.content, str)]
+    if texts and texts[-1].strip().lower() == final_intent:
+        texts = texts[:-1]
+    return texts[-1] if texts else ""
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("--llm-parallel", type=int, default=4, help="model calls in flight")
+    ap.add_argument("--workers", type=int, default=0, help="conversations in flight (default 2x --llm-parallel)")
+    ap.add_argument("--checkpointer", choices=["tiered", "redis", "memory"], default=os.getenv("CHECKPOINTER", "tiered"))
+    ap.add_argument("--progress-every", type=float, default=10.0, help="seconds between progress lines")
+    args = ap.parse_args()
+
+    # must be set before the agents import and build their models
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_parallel)
+    os.environ["CHECKPOINTER"] = args.checkpointer
+
+    from graph.build_graph import build_graph
+    import resilience
+    from llm.scheduler import BATCH
+    from memory import lease
+    from memory.checkpoint import get_checkpointer
+    from memory.store import get_store
+
+    errors_path = args.output + ".errors.jsonl"
+    done = _completed(args.output)
+    threads, total = _load(args.input, done)
+    todo = sum(len(items) for items in threads.values())
+    print(f"{total} items, {len(done)} already done, {todo} to run across {len(threads)} threads")
+
+    saver = get_checkpointer()
+    app = build_graph().compile(checkpointer=saver, store=get_store())
+
+    lock = threading.Lock()
+    stats = {"ok": 0, "error": 0}
+    out = open(args.output, "a", encoding="utf-8")
+    errors = open(errors_path, "a", encoding="utf-8")
+
+    def record(result: Dict[str, Any]) -> None:
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        f = out if result["status"] == "ok" else errors
+        with lock:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            stats[result["status"]] += 1
+
+    def run_thread(thread_id: str) -> None:
+        config = {"configurable": {"thread_id": thread_id, "llm_priority": BATCH}}
+        for n, message in threads[thread_id]:
+            t0 = time.perf_counter()
+            try:
+                budget = resilience.with_budget(config, BATCH_TURN_BUDGET_MS)
+                with lease.turn(saver, budget) as turn_config:
+                    state = app.invoke({"messages": [{"role": "user", "content": message}]}, config=turn_config)
+                result = {"line": n, "thread_id": thread_id, "status": "ok",
+                          "reply": _reply(state["messages"], state.get("intent", ""))}
+            except Exception as e:
+                result = {"line": n, "thread_id": thread_id, "status": "error", "error": repr(e)}
+            result["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            record(result)
+
+    t_start = time.perf_counter()
+    stop = threading.Event()
+
+    def progress() -> None:
+        while not stop.wait(args.progress_every):
+            elapsed = time.perf_counter() - t_start
+            n = stats["ok"] + stats["error"]
+            print(f"  {n}/{todo} done, {stats['error']} errors, {60 * n / elapsed:.1f} req/min")
+
+    threading.Thread(target=progress, daemon=True).start()
+    with ThreadPoolExecutor(max_workers=args.workers or 2 * args.llm_parallel) as pool:
+        list(pool.map(run_thread, list(threads)))
+    stop.set()
+    out.close()
+    errors.close()
+
+    wall = time.perf_counter() - t_start
+    n = stats["ok"] + stats["error"]
+    print(f"processed={n} ok={stats['ok']} errors={stats['error']} wall={wall:.1f}s "
+          f"throughput={60 * n / wall if wall else 0:.1f} req/min")
+    if stats["error"]:
+        print(f"failed items written to {errors_path}; rerun to retry them")
+
+
+if __name__ == "__main__":
+    main()
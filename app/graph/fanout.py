@@ -0,0 +1,54 @@
+from typing import Any, Callable, Dict
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END
+
+from graph.state import AgentState
+
+# Multi-intent fan-out. route_intent sends one branch per intent; each
+# specialist runs wrapped by branch() so that, in a fan-out, its new messages
+# land in branch_results instead of interleaving in `messages`, and
+# join_branches turns them into a single reply once every branch of the
+# superstep is done. A single intent skips the join entirely. Either way the
+# turn ends there: the intent node only ever classifies user messages.
+
+
+def _fanned_out(state: AgentState) -> bool:
+    return len(state.get("intents") or []) > 1
+
+
+def branch(agent: Callable[[AgentState, RunnableConfig], Dict[str, Any]]) -> Callable[[AgentState, RunnableConfig], Dict[str, Any]]:
+    def node(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
+        if not _fanned_out(state):
+            return agent(state, config)
+        seen = len(state["messages"])
+        out = agent(state, config)
+        update = {"branch_results": [{
+            "order": state["intents"].index(state["intent"]),
+            "messages": out.get("messages", [])[seen:],
+        }]}
+        if "prefetched" in out:
+            update["prefetched"] = out["prefetched"]
+        return update
+
+    node.__name__ = getattr(agent, "__name__", "branch")
+    return node
+
+
+def after_branch(state: AgentState) -> str:
+    return "join_branches" if _fanned_out(state) else END
+
+
+def join_branches(state: AgentState) -> Dict[str, Any]:
+    # each branch's tool exchanges stay in the history as they happened; the
+    # branch answers become one reply, in the order asked
+    exchanges, contents = [], []
+    for r in sorted(state.get("branch_results") or [], key=lambda r: r["order"]):
+        if not r["messages"]:
+            continue
+        *steps, answer = r["messages"]
+        exchanges.extend(steps)
+        if isinstance(answer.content, str) and answer.content.strip():
+            contents.append(answer.content.strip())
+    return {"messages": exchanges + [AIMessage(content="\n\n".join(contents))]}
@@ -0,0 +1,142 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
+
+import metrics
+from graph.state import AgentState
+from memory.store import client_id_of, recall, with_client_memory
+from tools.mcp_tools import view_card_details_tool
+
+# Speculative prefetch of read-only card lookups.
+#
+# Most specialists start by looking up what the user mentioned: the client's
+# cards (listClientCards) or one card (retrieveCardDetails). The intent node
+# starts those reads for the identifiers in the new user message *before*
+# its own model call. The reads run on a small pool while the model
+# classifies, and the results land in state["prefetched"]. A specialist gets
+# them as a system note (like the client memory) and clears them. If the
+# turn routes nowhere, the results are dropped and counted as waste.
+#
+# Reads run with the turn's config, so they are admitted on the
+# conversation's MCP channel like the specialist's own calls. Only
+# successful results (responseCode "000") are kept. A throttled or failed
+# read is counted as waste and left for the specialist to make itself.
+#
+#   prefetch.issued{tool}  reads started
+#   prefetch.hit{tool}     results a specialist consumed
+#   prefetch.wasted{tool}  results nobody used (or that came back too late)
+#   prefetch.hit_rate / prefetch.waste_rate (gauges, hits or waste per issued read)
+
+PREFETCH = os.getenv("PREFETCH", "1") == "1"
+# extra wait after classification for reads still in flight
+PREFETCH_WAIT_S = float(os.getenv("PREFETCH_WAIT_MS", "200")) / 1000
+PREFETCH_MAX_CARDS = 3
+
+_CARD_TOKEN = re.compile(r"\?A[0-9A-F]{8,}")
+
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("PREFETCH_WORKERS", "8")), thread_name_prefix="prefetch")
+_lock = threading.Lock()
+_totals = {"issued": 0, "hit": 0, "wasted": 0}
+
+
+def _count(kind: str, tool: str, n: int = 1) -> None:
+    metrics.incr(f"prefetch.{kind}", n, tool=tool)
+    with _lock:
+        _totals[kind] += n
+
+
+def _rate(kind: str) -> float:
+    with _lock:
+        return round(_totals[kind] / _totals["issued"], 4) if _totals["issued"] else 0.0
+
+
+metrics.gauge("prefetch.hit_rate", lambda: _rate("hit"))
+metrics.gauge("prefetch.waste_rate", lambda: _rate("wasted"))
+
+
+def _read(args: Dict[str, str], config: Optional[RunnableConfig]) -> Optional[Dict[str, Any]]:
+    t0 = time.perf_counter()
+    content, resp = view_card_details_tool.func(**args, config=config)
+    metrics.observe("prefetch.ms", (time.perf_counter() - t0) * 1000)
+    if resp.get("responseCode") != "000":
+        return None
+    tool = "retrieveCardDetails" if "cardToken" in args else "listClientCards"
+    return {"tool": tool, "args": args, "result": content}
+
+
+class Pending:
+    def __init__(self, futures: List[Future]):
+        self.futures = futures
+
+    def collect(self, wait_s: float = PREFETCH_WAIT_S) -> List[Dict[str, Any]]:
+        """
+        Results that are ready (waiting at most wait_s more); failed,
+        unsuccessful or late reads are dropped as waste.
+        """
+        done, late = wait(self.futures, timeout=wait_s)
+        out = []
+        for f in done:
+            if f.exception() is None and f.result() is not None:
+                out.append(f.result())
+            else:
+                _count("wasted", getattr(f, "tool", "-"))
+        for f in late:
+            _count("wasted", getattr(f, "tool", "-"))
+        return out
+
+
+def start(messages: List[BaseMessage], config: Optional[RunnableConfig] = None) -> Optional[Pending]:
+    """
+    Starts the reads the last user message points at: details of each card
+    token it names, and the client's card list unless it is already in the
+    client memory.
+    """
+    if not PREFETCH or not messages or messages[-1].type != "human" or not isinstance(messages[-1].content, str):
+        return None
+    reads = [{"cardToken": t} for t in dict.fromkeys(_CARD_TOKEN.findall(messages[-1].content))][:PREFETCH_MAX_CARDS]
+    clientId = client_id_of(messages)
+    if clientId and "cards" not in recall(clientId):
+        reads.append({"clientId": clientId})
+    if not reads:
+        return None
+    futures = []
+    for args in reads:
+        f = _pool.submit(contextvars.copy_context().run, _read, args, config)
+        f.tool = "retrieveCardDetails" if "cardToken" in args else "listClientCards"
+        _count("issued", f.tool)
+        futures.append(f)
+    return Pending(futures)
+
+
+def discard(prefetched: Optional[List[Dict[str, Any]]]) -> None:
+    for entry in prefetched or []:
+        _count("wasted", entry["tool"])
+
+
+def model_input(state: AgentState) -> List[BaseMessage]:
+    """
+    A specialist's model input: client memory, then whatever was prefetched
+    for this turn, then the conversation. The specialist clears
+    state["prefetched"] in its update.
+    """
+    messages = with_client_memory(state["messages"])
+    prefetched = state.get("prefetched")
+    if not prefetched:
+        return messages
+    intents = state.get("intents") or []
+    # in a fan-out every branch sees the results; count them once
+    if len(intents) <= 1 or state.get("intent") == intents[0]:
+        for entry in prefetched:
+            _count("hit", entry["tool"])
+    note = "Already looked up this turn (use these results instead of calling the tool again): " + json.dumps(
+        [{"tool": e["tool"], "args": e["args"], "result": e["result"]} for e in prefetched],
+        separators=(",", ":"), ensure_ascii=False)
+    return [SystemMessage(content=note)] + messages
@@ -0,0 +1,26 @@
+from typing import Annotated, Any, Dict, List, Optional
+
+from langgraph.graph import MessagesState
+
+
+def merge_branches(old: List[Dict[str, Any]], new: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # parallel specialist branches append; the intent node resets with None
+    if new is None:
+        return []
+    return (old or []) + new
+
+
+def settle_prefetch(old: Optional[List[Dict[str, Any]]], new: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    # set by the intent node; cleared by every specialist that consumed it (several at once in a fan-out)
+    return new
+
+
+class AgentState(MessagesState):
+    # set by intent_agent, read by route_intent
+    intent: str
+    # every label detected in the last user message, in the order asked
+    intents: List[str]
+    # one entry per specialist branch of the current fan-out, merged by join_branches
+    branch_results: Annotated[List[Dict[str, Any]], merge_branches]
+    # read-only tool results fetched while the intent was classified (graph/prefetch.py)
+    prefetched: Annotated[Optional[List[Dict[str, Any]]], settle_prefetch]
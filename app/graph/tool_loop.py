@@ -0,0 +1,42 @@
+import os
+from typing import List
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from langgraph.prebuilt import ToolNode
+
+# A specialist's model <-> tool loop, run inside the specialist's node.
+#
+# The model's tool calls go through the agent's ToolNode (with the node's
+# config, so the graph runtime and store reach the tools). The ToolMessages,
+# with their content_and_artifact artifacts, are appended, and the model is
+# asked again until it answers without calling a tool. The loop stays inside
+# the node rather than as separate graph nodes because a fanned-out branch
+# (graph/fanout.py) only exists for the node that Send targeted.
+#
+# Agents build their ToolNode with handle_tool_errors=True: a tool that
+# raises (unknown card, bad PIN) becomes an error ToolMessage for the model
+# to explain or correct, not a failed turn.
+
+TOOL_ROUNDS = int(os.getenv("TOOL_ROUNDS", "3"))
+
+UNFINISHED = "Sorry, I couldn't finish that request. Please try again."
+
+
+def run(llm: Runnable, tool_node: ToolNode, messages: List[BaseMessage], config: RunnableConfig,
+        rounds: int = TOOL_ROUNDS) -> List[BaseMessage]:
+    """
+    Returns the new messages: each tool-calling AI message followed by its
+    ToolMessages, then the final answer.
+    """
+    new: List[BaseMessage] = []
+    for i in range(rounds + 1):
+        ai_msg = llm.invoke(messages + new)
+        if not getattr(ai_msg, "tool_calls", None):
+            return new + [ai_msg]
+        if i == rounds:
+            # out of rounds: never leave a tool call without its result in the history
+            return new + [AIMessage(content=ai_msg.content or UNFINISHED)]
+        new.append(ai_msg)
+        new.extend(tool_node.invoke({"messages": [ai_msg]}, config)["messages"])
+    return new
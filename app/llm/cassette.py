@@ -0,0 +1,218 @@
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Cassette = JSONL, one exchange per line:
+#   {"k": <request hash>, "r": <response message dict>, "c": [<streamed text chunks>], "ms": <recorded latency>}
+# The key covers the model, its role and sampling/size params, message
+# types/contents/tool calls, bound tools and stop words, but not message ids,
+# so replays match across runs, and an exchange recorded for one model or role
+# is never served for another (the same prompt can reach several models under
+# per-role routing and escalation).
+
+
+def request_key(messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any],
+                model: str, role: str, params: Dict[str, Any]) -> str:
+    msgs = [
+        [m.type, m.content, [(tc["name"], tc["args"]) for tc in getattr(m, "tool_calls", None) or []]]
+        for m in messages
+    ]
+    tools = [t.get("function", {}).get("name", "") if isinstance(t, dict) else str(t)
+             for t in kwargs.get("tools") or []]
+    raw = json.dumps({"model": model, "role": role, "p": params, "m": msgs, "t": tools, "s": stop or []},
+                     sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+_write_lock = threading.Lock()
+
+
+def _tool_call_chunks(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"name": tc["name"], "args": json.dumps(tc["args"]), "id": tc.get("id"), "index": i}
+        for i, tc in enumerate(tool_calls)
+    ]
+
+
+def _as_chunk(msg: BaseMessage) -> AIMessageChunk:
+    # models without native streaming hand back one whole AIMessage
+    if isinstance(msg, AIMessageChunk):
+        return msg
+    return AIMessageChunk(content=msg.content, tool_call_chunks=_tool_call_chunks(getattr(msg, "tool_calls", None) or []))
+
+
+def _bind_tools(model: BaseChatModel, tools: Any, **kwargs: Any):
+    return model.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+
+class RecordingChatModel(BaseChatModel):
+    """
+    Passes every call through to `inner` (normally ChatOllama) and appends
+    the request key and response to the cassette.
+    """
+
+    inner: Any
+    path: str
+    model: str = ""
+    role: str = ""
+    params: Dict[str, Any] = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording"
+
+    def bind_tools(self, tools: Any, **kwargs: Any):
+        return _bind_tools(self, tools, **kwargs)
+
+    def _key(self, messages, stop, kwargs) -> str:
+        return request_key(messages, stop, kwargs, self.model, self.role, self.params)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+        with _write_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        t0 = time.perf_counter()
+        msg = self.inner.invoke(messages, stop=stop, **kwargs)
+        ms = (time.perf_counter() - t0) * 1000
+        self._append({"k": self._key(messages, stop, kwargs), "r": message_to_dict(msg), "ms": round(ms, 1)})
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        t0 = time.perf_counter()
+        chunks: List[str] = []
+        full: Optional[AIMessageChunk] = None
+        for chunk in self.inner.stream(messages, stop=stop, **kwargs):
+            chunk = _as_chunk(chunk)
+            chunks.append(chunk.content if isinstance(chunk.content, str) else "")
+            full = chunk if full is None else full + chunk
+            yield ChatGenerationChunk(message=chunk)
+        ms = (time.perf_counter() - t0) * 1000
+        msg = AIMessage(
+            content=full.content if full is not None else "",
+            tool_calls=full.tool_calls if full is not None else [],
+        )
+        self._append({"k": self._key(messages, stop, kwargs), "r": message_to_dict(msg),
+                      "c": chunks, "ms": round(ms, 1)})
+
+
+class Cassette:
+    def __init__(self, path: str):
+        self.entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.cursor: Dict[str, int] = defaultdict(int)
+        self.lock = threading.Lock()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    e = json.loads(line)
+                    self.entries[e["k"]].append(e)
+
+    def next(self, key: str) -> Dict[str, Any]:
+        """
+        Same request recorded several times replays in order, then repeats the last.
+        """
+        with self.lock:
+            found = self.entries.get(key)
+            if not found:
+                raise LookupError(f"no cassette entry for request {key}; re-record with LLM_PROVIDER=record")
+            i = self.cursor[key]
+            self.cursor[key] = i + 1
+            return found[min(i, len(found) - 1)]
+
+
+_cassettes: Dict[str, Cassette] = {}
+
+
+def load_cassette(path: str) -> Cassette:
+    # agents build their models at import; share one parsed cassette
+    if path not in _cassettes:
+        _cassettes[path] = Cassette(path)
+    return _cassettes[path]
+
+
+class ReplayChatModel(BaseChatModel):
+    """
+    Serves recorded responses without a model server. `latency` is added
+    before the first token; `tokens_per_sec` (0 = off) paces the rest,
+    estimating ~4 characters per token.
+    """
+
+    path: str
+    model: str = ""
+    role: str = ""
+    params: Dict[str, Any] = {}
+    latency: float = 0.0
+    tokens_per_sec: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def bind_tools(self, tools: Any, **kwargs: Any):
+        return _bind_tools(self, tools, **kwargs)
+
+    def _lookup(self, messages, stop, kwargs) -> Dict[str, Any]:
+        key = request_key(messages, stop, kwargs, self.model, self.role, self.params)
+        return load_cassette(self.path).next(key)
+
+    def _pace(self, text: str) -> None:
+        if self.tokens_per_sec > 0 and text:
+            time.sleep(max(1, len(text) // 4) / self.tokens_per_sec)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        entry = self._lookup(messages, stop, kwargs)
+        msg = messages_from_dict([entry["r"]])[0]
+        if self.latency:
+            time.sleep(self.latency)
+        self._pace(msg.content if isinstance(msg.content, str) else "")
+        return ChatResult(generations=[ChatGeneration(message=msg)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        entry = self._lookup(messages, stop, kwargs)
+        msg = messages_from_dict([entry["r"]])[0]
+        if self.latency:
+            time.sleep(self.latency)
+        chunks = entry.get("c")
+        if chunks is None:
+            chunks = [msg.content] if isinstance(msg.content, str) else []
+        for text in chunks:
+            self._pace(text)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        tool_calls = getattr(msg, "tool_calls", None) or []
+        if tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=_tool_call_chunks(tool_calls)))
@@ -0,0 +1,25 @@
+# Degraded-mode intent classification: when the intent model is unavailable
+# (open breaker, blown deadline, shed call), intent_agent falls back to a
+# keyword match on the user's words. The stub model uses the same matcher.
+
+# Keyword → intent label, mirroring the labels intent_agent asks for.
+_INTENTS = [
+    ("change_pin", ("pin",)),
+    ("stop_card", ("block", "stop", "stolen", "lost", "freeze")),
+    ("create_card", ("new card", "create", "issue", "open a card")),
+    ("view_card", ("show", "view", "details", "balance", "list")),
+]
+
+
+def classify(text: str) -> str:
+    """
+    Every matching label, in the order they appear in the text
+    ("block my card and show my cards" -> "stop_card, view_card").
+    """
+    t = text.lower()
+    found = []
+    for label, words in _INTENTS:
+        hits = [t.find(w) for w in words if w in t]
+        if hits:
+            found.append((min(hits), label))
+    return ", ".join(label for _, label in sorted(found)) or "end"
@@ -1,13 +1,127 @@
+import json
 import os
+from typing import Any, Dict, Optional
+
 from langchain_ollama import ChatOllama
 
-def get_llm():
+# Per-node model routing.
+#
+# Agents ask for a model by role (get_llm("intent")). Each role has its own
+# model, context size (num_ctx), output cap (num_predict) and keep_alive.
+# Cheap steps (a few-token label, one or two tool arguments) run on
+# LLM_SMALL_MODEL. Free-form multi-field extraction stays on LLM_MODEL. A
+# role with "escalate" is retried on the "large" spec when its output fails
+# validation (llm/routing.py).
+#
+# LLM_ROUTING=uniform puts every role on the "large" spec (the old
+# one-model-for-everything behaviour); LLM_ROLES (JSON) overrides fields per
+# role, e.g. {"intent": {"model": "qwen2.5:0.5b", "num_predict": 8}}.
+
+LARGE_MODEL = os.getenv("LLM_MODEL", "gpt-oss:latest")
+SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "llama3.2:3b")
+
+ROLE_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "large": {"model": LARGE_MODEL, "num_ctx": 8192, "num_predict": 1024, "keep_alive": "30m"},
+    # five-way label, a handful of tokens out
+    "intent": {"model": SMALL_MODEL, "num_ctx": 2048, "num_predict": 24, "keep_alive": "30m", "escalate": True},
+    # one tool call with one to three arguments
+    "change_pin": {"model": SMALL_MODEL, "num_ctx": 4096, "num_predict": 256, "keep_alive": "30m", "escalate": True},
+    "view_card": {"model": SMALL_MODEL, "num_ctx": 4096, "num_predict": 512, "keep_alive": "30m", "escalate": True},
+    "stop_card": {"model": SMALL_MODEL, "num_ctx": 4096, "num_predict": 256, "keep_alive": "30m", "escalate": True},
+    # eight required fields pulled out of free text
+    "create_card": {"model": LARGE_MODEL, "num_ctx": 8192, "num_predict": 1024, "keep_alive": "30m"},
+}
+
+
+def model_spec(role: str = "large") -> Dict[str, Any]:
+    """
+    Effective settings for a role (unknown roles get the "large" spec).
+    """
+    overrides = json.loads(os.getenv("LLM_ROLES", "{}"))
+    large = {**ROLE_DEFAULTS["large"], **overrides.get("large", {})}
+    if role == "large" or os.getenv("LLM_ROUTING", "routed").lower() == "uniform":
+        return large
+    spec = {**large, "escalate": False, **ROLE_DEFAULTS.get(role, {}), **overrides.get(role, {})}
+    if spec["model"] == large["model"]:
+        spec["escalate"] = False  # nothing larger to escalate to
+    return spec
 
-    model = os.getenv("LLM_MODEL", "gpt-oss:latest")
-    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+def _ollama(spec: Optional[Dict[str, Any]] = None, base_url=None):
+    spec = spec or model_spec()
+    base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
     return ChatOllama(
-        model=model,
+        model=spec["model"],
         base_url=base_url,
         temperature=0,
+        num_ctx=spec.get("num_ctx"),
+        num_predict=spec.get("num_predict"),
+        keep_alive=spec.get("keep_alive"),
+        # HTTP backstop: a call abandoned on its deadline (llm/resilient.py) still ends here
+        client_kwargs={"timeout": float(os.getenv("LLM_TIMEOUT_MS", "60000")) / 1000},
+    )
+
+def _stub(model: str):
+    from llm.stub import StubChatModel
+
+    # STUB_MODEL_LATENCY_MS / STUB_MODEL_INVALID_RATE: {"<model>": value}, so
+    # small and large models (and the secondary endpoint) differ in cost and
+    # reliability
+    latency = json.loads(os.getenv("STUB_MODEL_LATENCY_MS", "{}"))
+    invalid = json.loads(os.getenv("STUB_MODEL_INVALID_RATE", "{}"))
+    return StubChatModel(
+        model=model,
+        latency=float(latency.get(model, os.getenv("STUB_LLM_LATENCY_MS", "50"))) / 1000,
+        jitter=float(os.getenv("STUB_LLM_JITTER_MS", "0")) / 1000,
+        invalid_rate=float(invalid.get(model, 0)),
     )
+
+def get_llm(role: str = "large"):
+    """
+    Model for a role (see ROLE_DEFAULTS). LLM_PROVIDER selects the backend:
+      ollama (default)  live ChatOllama
+      stub              canned replies for load tests (see llm/stub.py)
+      record            ChatOllama, logging every exchange to LLM_CASSETTE
+      replay            serve LLM_CASSETTE offline, optionally paced
+    """
+    provider = os.getenv("LLM_PROVIDER", "ollama").lower()
+    cassette = os.getenv("LLM_CASSETTE", "llm_cassette.jsonl")
+    spec = model_spec(role)
+
+    if provider == "stub":
+        # offline load testing: no model server needed
+        return _stub(spec["model"])
+    # cassette entries are keyed by model, role and the params that change the reply
+    keyed = {"model": spec["model"], "role": role,
+             "params": {k: spec.get(k) for k in ("num_ctx", "num_predict")}}
+    if provider == "record":
+        from llm.cassette import RecordingChatModel
+
+        return RecordingChatModel(inner=_ollama(spec), path=cassette, **keyed)
+    if provider == "replay":
+        from llm.cassette import ReplayChatModel
+
+        return ReplayChatModel(
+            path=cassette,
+            **keyed,
+            latency=float(os.getenv("REPLAY_LATENCY_MS", "0")) / 1000,
+            tokens_per_sec=float(os.getenv("REPLAY_TOKENS_PER_SEC", "0")),
+        )
+
+    return _ollama(spec)
+
+
+def get_secondary_llm(role: str = "large"):
+    """
+    Model on LLM_SECONDARY_URL used to hedge idempotent calls (intent
+    classification); None when no secondary endpoint is configured.
+    """
+    url = os.getenv("LLM_SECONDARY_URL", "")
+    if not url:
+        return None
+    if os.getenv("LLM_PROVIDER", "ollama").lower() == "stub":
+        # a separate stub ("<model>@secondary"), configured on its own in the
+        # STUB_MODEL_* maps, so hedging compares two different endpoints
+        return _stub(f"{model_spec(role)['model']}@secondary")
+    return _ollama(model_spec(role), url)
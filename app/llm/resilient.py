@@ -0,0 +1,126 @@
+import os
+import time
+from typing import Any, Callable, Optional
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
+
+import metrics
+import resilience
+from llm.scheduler import BATCH, LLMOverloaded, ScheduledLLM
+
+# Deadline + breaker (+ optional hedge) around a scheduled model.
+#
+#   resilient(scheduled(llm, NORMAL), fallback=unavailable_reply)
+#
+# Wraps the ScheduledLLM from the outside, so an open breaker fails the call
+# before it takes a queue position. The call then queues for its scheduler
+# slot in the caller's thread, bounded by the class queue deadline and the
+# turn budget (llm_deadline). Only once it holds the slot does the model
+# call start under LLM_TIMEOUT_MS, cut to what is left of the turn, and only
+# that call's outcome is reported to the breaker. Local congestion (a shed
+# call, a turn budget spent in the queue) never counts against the model
+# server, and a caller that gives up leaves the queue instead of running
+# later for nobody. A call abandoned on its deadline holds its slot until it
+# really ends, since the model server is still busy with it.
+#
+# A hedge is an unscheduled model on the secondary endpoint
+# (LLM_SECONDARY_URL). It is started LLM_HEDGE_MS into the call. It takes
+# over outright while the primary's breaker is open, or when the primary
+# could not get a slot within LLM_HEDGE_MS. With a fallback, an open
+# breaker, a blown deadline or a shed call returns fallback(input) instead
+# of raising.
+#
+# One breaker per model ("ollama:<model>" unless a dependency name is given),
+# so a failing model, e.g. the escalation target, never opens the breaker of
+# another. Calls at BATCH priority (config "llm_priority", see batch.py) are
+# tracked by their own "<dependency>:batch" breaker, so a backlog never opens
+# the breaker that interactive turns depend on.
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_MS", "60000")) / 1000
+LLM_HEDGE_S = float(os.getenv("LLM_HEDGE_MS", "2000")) / 1000
+
+UNAVAILABLE = "Sorry, I can't complete this right now. Please try again in a few minutes."
+
+
+def _is_failure(e: BaseException) -> bool:
+    # a call shed by our own scheduler says nothing about the model server
+    return not isinstance(e, LLMOverloaded)
+
+
+def unavailable_reply(input: Any) -> AIMessage:
+    return AIMessage(content=UNAVAILABLE)
+
+
+class ResilientLLM(Runnable):
+    def __init__(self, llm: Runnable, dependency: Optional[str] = None, hedge: Optional[Runnable] = None,
+                 fallback: Optional[Callable[[Any], Any]] = None, timeout: float = LLM_TIMEOUT_S,
+                 hedge_after: float = LLM_HEDGE_S):
+        self.llm = llm
+        self.dependency = dependency or f"ollama:{getattr(llm, 'model', 'llm')}"
+        self.hedge = hedge
+        self.fallback = fallback
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+
+    def _breaker(self, config: Optional[RunnableConfig]) -> resilience.Breaker:
+        batch = int(ensure_config(config).get("configurable", {}).get("llm_priority", 0)) >= BATCH
+        name = f"{self.dependency}:batch" if batch else self.dependency
+        return resilience.get_breaker(name, is_failure=_is_failure)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        breaker = self._breaker(config)
+        hedge = None
+        if self.hedge is not None:
+            hedge = lambda: self.hedge.invoke(input, config, **kwargs)  # noqa: E731
+        try:
+            resilience.remaining(self.timeout, config)  # budget already spent: don't queue
+            if breaker.allow():
+                return self._call(input, config, kwargs, breaker, hedge)
+            if hedge is None:
+                raise resilience.CircuitOpen(f"{self.dependency} circuit open")
+            return self._failover(hedge, config)
+        except (resilience.CircuitOpen, resilience.DeadlineExceeded, LLMOverloaded) as e:
+            if self.fallback is None:
+                raise
+            metrics.incr("llm.degraded", reason=type(e).__name__)
+            return self.fallback(input)
+
+    def _failover(self, hedge: Callable[[], Any], config: Optional[RunnableConfig]) -> Any:
+        metrics.incr("llm.failover", dependency=self.dependency)
+        return resilience.run(hedge, resilience.remaining(self.timeout, config))
+
+    def _call(self, input: Any, config: Optional[RunnableConfig], kwargs: Any,
+              breaker: resilience.Breaker, hedge: Optional[Callable[[], Any]]) -> Any:
+        llm, release = self.llm, None
+        try:
+            if isinstance(llm, ScheduledLLM):
+                # with a hedge, queue no longer than it takes to start it
+                deadline = time.monotonic() + self.hedge_after if hedge is not None else None
+                release = llm.acquire(config, deadline)
+                llm = llm.llm
+            timeout = resilience.remaining(self.timeout, config)
+        except (LLMOverloaded, resilience.DeadlineExceeded) as e:
+            # never reached the model server: nothing to tell the breaker
+            breaker.abandon()
+            if release is not None:
+                release()
+            if hedge is None or isinstance(e, resilience.DeadlineExceeded):
+                raise
+            return self._failover(hedge, config)
+
+        def call() -> Any:
+            try:
+                return llm.invoke(input, config, **kwargs)
+            finally:
+                if release is not None:
+                    release()
+
+        return resilience.run(call, timeout, hedge=hedge, hedge_after=self.hedge_after, breaker=breaker,
+                              charge_timeout=timeout >= self.timeout)
+
+
+def resilient(llm: Runnable, dependency: Optional[str] = None, hedge: Optional[Runnable] = None,
+              fallback: Optional[Callable[[Any], Any]] = None) -> ResilientLLM:
+    return ResilientLLM(llm, dependency, hedge, fallback)
@@ -0,0 +1,142 @@
+"""
+Role-routed model stacks with escalation to the large model.
+
+    LLM = role_llm("view_card", NORMAL, tools=TOOLS, fallback=unavailable_reply)
+
+builds resilient(scheduled(get_llm(role)...)) for the role's spec. For a role
+with "escalate", a second stack on the "large" spec is used whenever the
+small model's reply fails validation: unknown tool, invalid tool call,
+missing required arguments, or (intent) no usable label.
+
+The effective spec of every role built so far is in ROLES (exported as the
+llm.roles gauge); describe() formats it for a startup log line.
+
+Benchmark, uniform vs routed models, end to end through loadtest.py:
+
+    python -m llm.routing --sessions 300
+    LLM_PROVIDER=ollama python -m llm.routing --sessions 50   # real models
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+import metrics
+from llm.model import get_llm, get_secondary_llm, model_spec
+from llm.resilient import resilient
+from llm.scheduler import scheduled
+
+# role -> effective spec, filled by role_llm()
+ROLES: Dict[str, Dict[str, Any]] = {}
+metrics.gauge("llm.roles", lambda: {role: spec["model"] for role, spec in ROLES.items()})
+
+
+def describe() -> str:
+    return "\n".join(
+        f"[llm] {role}: {spec['model']} num_ctx={spec['num_ctx']} num_predict={spec['num_predict']}"
+        f"{' (escalates)' if spec.get('escalate') else ''}"
+        for role, spec in ROLES.items()
+    )
+
+
+def tool_calls_valid(tools: Sequence[Any]) -> Callable[[Any], bool]:
+    """
+    A reply is usable if every tool call names a bound tool and carries all
+    of its required arguments (a plain text reply is fine).
+    """
+    required = {t.name: t.tool_call_schema.model_json_schema().get("required", []) for t in tools}
+
+    def validate(msg: Any) -> bool:
+        if getattr(msg, "invalid_tool_calls", None):
+            return False
+        for call in getattr(msg, "tool_calls", None) or []:
+            if call["name"] not in required:
+                return False
+            args = call.get("args") or {}
+            if any(args.get(name) in (None, "") for name in required[call["name"]]):
+                return False
+        return True
+
+    return validate
+
+
+class EscalatingLLM(Runnable):
+    def __init__(self, first: Runnable, second: Runnable, validate: Callable[[Any], bool], role: str):
+        self.first = first
+        self.second = second
+        self.validate = validate
+        self.role = role
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        out = self.first.invoke(input, config, **kwargs)
+        if self.validate(out):
+            return out
+        metrics.incr("llm.escalated", role=self.role)
+        return self.second.invoke(input, config, **kwargs)
+
+
+def role_llm(role: str, priority: int, tools: Optional[List[Any]] = None,
+             validate: Optional[Callable[[Any], bool]] = None, fallback: Optional[Callable[[Any], Any]] = None,
+             hedge: bool = False) -> Runnable:
+    """
+    The model for one agent role. Every call waits its turn in the shared
+    scheduler at `priority`; on an open breaker, a blown deadline or a shed
+    call, `fallback` answers instead (agents pass unavailable_reply).
+    """
+    def stack(spec_role: str) -> Runnable:
+        llm = get_llm(spec_role)
+        if tools:
+            llm = llm.bind_tools(tools)
+        secondary = get_secondary_llm(spec_role) if hedge else None
+        return resilient(scheduled(llm, priority), hedge=secondary, fallback=fallback)
+
+    spec = ROLES[role] = model_spec(role)
+    if not spec.get("escalate"):
+        return stack(role)
+    return EscalatingLLM(stack(role), stack("large"), validate or tool_calls_valid(tools or []), role)
+
+
+# ---------- benchmark ----------
+
+def _run_loadtest(routing: str, argv: List[str], env: Dict[str, str]) -> Dict[str, float]:
+    script = os.path.join(os.path.dirname(__file__), "..", "loadtest.py")
+    out = subprocess.run([sys.executable, script, *argv], env={**env, "LLM_ROUTING": routing},
+                         capture_output=True, text=True, check=True).stdout
+    nums = {}
+    for key in ("turns/sec", "p50", "p90", "p99"):
+        m = re.search(re.escape(key) + r"=([\d.]+)", out)
+        nums[key] = float(m.group(1)) if m else float("nan")
+    return nums
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--small-ms", type=float, default=40.0, help="stub latency of the small model")
+    ap.add_argument("--large-ms", type=float, default=120.0, help="stub latency of the large model")
+    ap.add_argument("--small-invalid", type=float, default=0.05, help="stub: share of small-model intent replies to escalate")
+    args = ap.parse_args()
+
+    env = dict(os.environ)
+    if env.setdefault("LLM_PROVIDER", "stub") == "stub":
+        large, small = model_spec("large")["model"], os.getenv("LLM_SMALL_MODEL", "llama3.2:3b")
+        env.setdefault("STUB_MODEL_LATENCY_MS", json.dumps({large: args.large_ms, small: args.small_ms}))
+        env.setdefault("STUB_MODEL_INVALID_RATE", json.dumps({small: args.small_invalid}))
+    argv = ["--sessions", str(args.sessions), "--concurrency", str(args.concurrency)]
+
+    results = {mode: _run_loadtest(mode, argv, env) for mode in ("uniform", "routed")}
+    print(f"{'':<9}{'turns/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<9}{r['turns/sec']:>9.1f}{r['p50']:>9.1f}{r['p90']:>9.1f}{r['p99']:>9.1f}")
+    u, r = results["uniform"], results["routed"]
+    print(f"routed vs uniform: p50 {100 * (r['p50'] / u['p50'] - 1):+.1f}%, p99 {100 * (r['p99'] / u['p99'] - 1):+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
+
+import metrics
+
+# Priority classes (lower runs first)
+URGENT = 0   # intent classification, stop-card
+NORMAL = 1   # interactive specialist agents
+BATCH = 2    # offline / bulk work
+
+_CLASS_NAMES = {URGENT: "urgent", NORMAL: "normal", BATCH: "batch"}
+
+# max time a call may wait for a slot before it is shed, per class
+QUEUE_DEADLINES = {
+    URGENT: float(os.getenv("LLM_QUEUE_DEADLINE_URGENT_MS", "30000")) / 1000,
+    NORMAL: float(os.getenv("LLM_QUEUE_DEADLINE_NORMAL_MS", "20000")) / 1000,
+    BATCH: float(os.getenv("LLM_QUEUE_DEADLINE_BATCH_MS", "300000")) / 1000,
+}
+
+
+class LLMOverloaded(RuntimeError):
+    """
+    Raised when a call is shed because it could not start before its deadline.
+    """
+
+
+class _Waiter:
+    __slots__ = ("model", "event", "state")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.event = threading.Event()
+        self.state = "queued"  # queued | granted | shed
+
+
+class LLMScheduler:
+    """
+    Admits model calls under a global and a per-model concurrency cap.
+    Waiters are ordered by (priority, virtual finish time): each thread_id
+    advances its own virtual clock per call, so within a class one busy
+    conversation cannot starve the others (start-time fair queuing).
+    """
+
+    def __init__(self, max_concurrency: int, per_model: Optional[Dict[str, int]] = None,
+                 default_per_model: int = 0):
+        self.max_concurrency = max_concurrency
+        self.per_model = per_model or {}
+        self.default_per_model = default_per_model or max_concurrency
+        self.lock = threading.Lock()
+        self.running = 0
+        self.running_by_model: Dict[str, int] = {}
+        self.heap: list = []
+        self.seq = itertools.count()
+        self.vtime = 0.0
+        self.thread_vtime: Dict[str, float] = {}
+
+    def _model_cap(self, model: str) -> int:
+        return self.per_model.get(model, self.default_per_model)
+
+    def _can_run(self, model: str) -> bool:
+        return (self.running < self.max_concurrency
+                and self.running_by_model.get(model, 0) < self._model_cap(model))
+
+    def _start(self, w: _Waiter) -> None:
+        w.state = "granted"
+        self.running += 1
+        self.running_by_model[w.model] = self.running_by_model.get(w.model, 0) + 1
+        w.event.set()
+
+    def _dispatch(self) -> None:
+        # caller holds the lock
+        skipped = []
+        while self.heap and self.running < self.max_concurrency:
+            entry = heapq.heappop(self.heap)
+            w = entry[-1]
+            if w.state != "queued":
+                continue
+            if not self._can_run(w.model):
+                skipped.append(entry)
+                continue
+            self.vtime = entry[1]
+            self._start(w)
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+
+    @contextmanager
+    def slot(self, model: str, priority: int = NORMAL, thread_id: str = "",
+             deadline: Optional[float] = None) -> Iterator[None]:
+        """
+        Hold one model slot for the duration of the block. `deadline` is an
+        absolute time.monotonic(); default is the class queue deadline.
+        """
+        release = self.acquire(model, priority, thread_id, deadline)
+        try:
+            yield
+        finally:
+            release()
+
+    def acquire(self, model: str, priority: int = NORMAL, thread_id: str = "",
+                deadline: Optional[float] = None) -> Callable[[], None]:
+        """
+        Waits for a slot (see slot()) and returns the function that frees it,
+        for a call that may end on another thread. A waiter that reaches its
+        deadline leaves the queue and raises LLMOverloaded.
+        """
+        t0 = time.monotonic()
+        if deadline is None:
+            deadline = t0 + QUEUE_DEADLINES.get(priority, QUEUE_DEADLINES[NORMAL])
+        cls = _CLASS_NAMES.get(priority, str(priority))
+        w = _Waiter(model)
+        with self.lock:
+            start = max(self.vtime, self.thread_vtime.get(thread_id, 0.0))
+            self.thread_vtime[thread_id] = start + 1
+            heapq.heappush(self.heap, (priority, start + 1, next(self.seq), w))
+            self._dispatch()
+        if w.state != "granted":
+            w.event.wait(max(0.0, deadline - time.monotonic()))
+            with self.lock:
+                if w.state != "granted":
+                    w.state = "shed"
+            if w.state == "shed":
+                metrics.incr("llm.shed", priority=cls, model=model)
+                raise LLMOverloaded(f"LLM queue deadline exceeded ({cls}, model {model})")
+        metrics.observe("llm.queue_ms", (time.monotonic() - t0) * 1000, priority=cls)
+        released = []
+
+        def release() -> None:
+            with self.lock:
+                if released:
+                    return
+                released.append(True)
+                self.running -= 1
+                self.running_by_model[model] -= 1
+                # a thread at or behind the global clock needs no entry
+                if self.thread_vtime.get(thread_id, 0.0) <= self.vtime:
+                    self.thread_vtime.pop(thread_id, None)
+                self._dispatch()
+        return release
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            queued = sum(1 for e in self.heap if e[-1].state == "queued")
+            return {"running": self.running, "queued": queued, "byModel": dict(self.running_by_model)}
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """
+    LLM_MAX_CONCURRENCY caps all calls; LLM_MODEL_CONCURRENCY is a JSON map
+    of per-model caps (default: the global cap).
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+                json.loads(os.getenv("LLM_MODEL_CONCURRENCY", "{}")),
+            )
+            metrics.gauge("llm.scheduler", _scheduler.stats)
+        return _scheduler
+
+
+def _model_name(runnable: Any) -> str:
+    inner = getattr(runnable, "bound", runnable)
+    return str(getattr(inner, "model", None) or getattr(inner, "_llm_type", "llm"))
+
+
+class ScheduledLLM(Runnable):
+    """
+    Wraps a chat model (or a bind_tools() binding) so every call first takes
+    a scheduler slot. thread_id, an optional absolute "llm_deadline"
+    (time.monotonic()) and an optional "llm_priority" come from the LangGraph
+    config of the running node; llm_priority can only demote (e.g. BATCH).
+    """
+
+    def __init__(self, llm: Runnable, priority: int = NORMAL, model: Optional[str] = None):
+        self.llm = llm
+        self.priority = priority
+        self.model = model or _model_name(llm)
+
+    def acquire(self, config: Optional[RunnableConfig] = None,
+                deadline: Optional[float] = None) -> Callable[[], None]:
+        """
+        Takes a slot for one call of self.llm and returns its release; the
+        queue wait ends at the earlier of `deadline` and the config's
+        llm_deadline. Used by ResilientLLM, which times only the call itself.
+        """
+        conf = ensure_config(config).get("configurable", {})
+        limits = [d for d in (deadline, conf.get("llm_deadline")) if d is not None]
+        return get_scheduler().acquire(
+            self.model, max(self.priority, int(conf.get("llm_priority", self.priority))),
+            thread_id=str(conf.get("thread_id", "")),
+            deadline=min(limits) if limits else None,
+        )
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        release = self.acquire(config)
+        try:
+            return self.llm.invoke(input, config, **kwargs)
+        finally:
+            release()
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        release = self.acquire(config)
+        try:
+            yield from self.llm.stream(input, config, **kwargs)
+        finally:
+            release()
+
+
+def scheduled(llm: Runnable, priority: int = NORMAL, model: Optional[str] = None) -> ScheduledLLM:
+    return ScheduledLLM(llm, priority, model)
@@ -0,0 +1,109 @@
+import random
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from llm.fallback import classify
+
+# Tool argument -> pattern that pulls it out of the user's words.
+_ARGS = {
+    "clientId": re.compile(r"\bclient\s*(?:id\s*)?(\d+)", re.I),
+    "cardToken": re.compile(r"(\?A[0-9A-F]{8,})"),
+    "new_pin": re.compile(r"\bPIN\s*(?:to\s*|is\s*)?(\d{4,6})\b", re.I),
+    "Mobile": re.compile(r"(?<!\w)(\+?\d{8,15})\b"),
+    "email": re.compile(r"([\w.+-]+@[\w-]+\.[\w.]+)"),
+    "dateOfBirth": re.compile(r"(\d{4}-\d{2}-\d{2})"),
+}
+
+
+def extract_args(text: str) -> Dict[str, str]:
+    """
+    Tool arguments found in a user message. Comma-separated parts that match
+    no pattern fill the free-text fields: "First Last" -> names, words and a
+    number -> address1, one capitalized word -> city.
+    """
+    args = {name: m.group(1) for name, rx in _ARGS.items() if (m := rx.search(text))}
+    for part in (p.strip() for p in text.split(",")):
+        if not part or any(rx.search(part) for rx in _ARGS.values()) or part.lower().startswith("born"):
+            continue
+        if re.fullmatch(r"[A-Za-z .'-]+ \d+|\d+ [A-Za-z .'-]+", part):
+            args.setdefault("address1", part)
+        elif re.fullmatch(r"[A-Z][a-z]+ [A-Z][a-z]+", part) and "firstName" not in args:
+            args["firstName"], args["lastName"] = part.split(" ", 1)
+        elif re.fullmatch(r"[A-Z][a-z]+", part):
+            args.setdefault("city", part)
+    return args
+
+
+def _tool_call(tools: List[Any], text: str) -> Optional[Dict[str, Any]]:
+    # the first bound tool whose required arguments are all in the message
+    found = extract_args(text)
+    for t in tools:
+        schema = t.tool_call_schema.model_json_schema()
+        required = schema.get("required", [])
+        args = {k: v for k, v in found.items() if k in schema.get("properties", {})}
+        if args and all(k in args for k in required):
+            return {"name": t.name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}
+    return None
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOllama, after a configurable delay: answers
+    intent prompts by keyword; with tools bound, calls the first tool whose
+    arguments the user gave, then answers with a short canned reply.
+    """
+
+    model: str = "stub"
+    latency: float = 0.05
+    jitter: float = 0.0
+    # share of intent replies that come back unusable (exercises escalation)
+    invalid_rate: float = 0.0
+    seed: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools: Any, **kwargs: Any):
+        return self.bind(tools=tools, **kwargs)
+
+    def _sleep(self) -> None:
+        delay = self.latency
+        if self.jitter:
+            delay += random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _reply(self, messages: List[BaseMessage], tools: Optional[List[Any]] = None) -> AIMessage:
+        last = messages[-1] if messages else None
+        content = last.content if last is not None else ""
+        if isinstance(content, str) and "Classify the user request" in content:
+            m = re.search(r"User message: (.*)\n", content)
+            if self.invalid_rate and random.random() < self.invalid_rate:
+                return AIMessage(content="I am not sure what you mean.")
+            return AIMessage(content=classify(m.group(1)) if m else "end")
+        if last is not None and last.type == "tool":
+            return AIMessage(content=f"[stub] done: {str(content)[:60]}")
+        human = next((m.content for m in reversed(messages) if m.type == "human"), "")
+        call = _tool_call(tools or [], str(human))
+        if call is not None:
+            return AIMessage(content="", tool_calls=[call])
+        return AIMessage(content=f"[stub] handled: {str(human)[:60]}")
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._sleep()
+        msg = self._reply(messages, kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=msg)])
@@ -0,0 +1,200 @@
+"""
+Concurrent multi-session load harness for the compiled graph.
+
+Runs many scripted conversations (each on its own thread_id) against the
+graph from build_graph(), with a stub LLM of configurable latency and an
+in-process Mongo/checkpoint stand-in, then reports throughput, per-turn
+latency percentiles and checkpoint store growth. The stub calls the
+specialists' tools with the arguments in the scripts, so every turn takes
+the production path through the ToolNode, the MCP tools and Mongo (seeded
+with a client and card per session when MONGO_URI=mongomock://).
+
+    python loadtest.py --sessions 2000 --concurrency 500 --latency-ms 50
+    python loadtest.py --checkpointer redis     # measure real Redis growth
+    python loadtest.py --checkpointer tiered    # hot tier + write-behind to Redis
+    PROFILE_SAMPLE_RATE=0.01 python loadtest.py # profile ~1% of turns into ./profiles
+    python loadtest.py --routing uniform        # every node on LLM_MODEL (see llm/model.py)
+"""
+import argparse
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+# {client} and {card} are filled in per session (each session has its own seeded client and card)
+SCENARIOS: Dict[str, List[str]] = {
+    "change_pin": [
+        "I want to change my PIN",
+        "Client {client}, card {card}, new PIN 4321",
+    ],
+    "view_card": [
+        "Show me my cards, client {client}",
+        "Show the details of card {card}",
+    ],
+    "create_card": [
+        "I want to create a new card",
+        "Client {client}, Rami Khoury, Hamra Street 12, Beirut, +96170123456, born 1990-01-10, rami.k@example.com",
+    ],
+    "stop_card": [
+        "Block my card {card}, it was stolen",
+    ],
+}
+
+
+def _session_ids(i: int) -> Dict[str, str]:
+    return {"client": str(100000 + i), "card": f"?A{i:016X}"}
+
+
+def _seed_mongomock(sessions: int) -> None:
+    # one client with one card per session, as the scripts expect
+    from mcp_2.fransa_mcp import cards, users
+
+    ids = [_session_ids(i) for i in range(sessions)]
+    users.insert_many([{"clientId": x["client"], "accounts": {"840": 1000.0}, "wallets": {"840": 1000.0}}
+                       for x in ids])
+    cards.insert_many([{
+        "clientId": x["client"], "cardToken": x["card"], "cardNumber": "5000000000001234",
+        "type": "DEBIT", "productType": "CLASSIC", "currency": "840", "limitProfile": "ICCSLIMIT",
+        "status": "A", "expiryDate": "31122030", "availableBalance": 250.0, "cashback": 0.0,
+        "transactions": [], "version": 0,
+    } for x in ids])
+
+
+def _pct(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def _nbytes(obj: Any) -> int:
+    # approximate size of MemorySaver storage (serialized blobs dominate)
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(k) + _nbytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(v) for v in obj)
+    return 8
+
+
+class CheckpointProbe:
+    def __init__(self, saver, redis_url: str = ""):
+        self.saver = saver
+        self.redis = None
+        if redis_url:
+            import redis
+
+            self.redis = redis.Redis.from_url(redis_url)
+
+    def sample(self) -> Dict[str, int]:
+        if self.redis is not None:
+            return {"keys": self.redis.dbsize(), "bytes": self.redis.info("memory")["used_memory"]}
+        storage = getattr(self.saver, "storage", {})
+        writes = getattr(self.saver, "writes", {})
+        n = sum(len(ns) for thread in storage.values() for ns in thread.values())
+        return {"keys": n, "bytes": _nbytes(dict(storage)) + _nbytes(dict(writes))}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=1000)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="stub LLM latency per call")
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset")
+    ap.add_argument("--checkpointer", choices=["memory", "redis", "tiered"], default="memory")
+    ap.add_argument("--llm-concurrency", type=int, default=64, help="scheduler cap on model calls in flight")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--routing", choices=["uniform", "routed"], default=None,
+                    help="per-node models (default: LLM_ROUTING, else routed)")
+    args = ap.parse_args()
+
+    # must be set before the agents import and build their models
+    os.environ.setdefault("LLM_PROVIDER", "stub")
+    os.environ["STUB_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["STUB_LLM_JITTER_MS"] = str(args.jitter_ms)
+    os.environ.setdefault("MONGO_URI", "mongomock://")
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+    if args.routing:
+        os.environ["LLM_ROUTING"] = args.routing
+
+    from graph.build_graph import build_graph
+    from memory import lease
+    from memory.checkpoint import get_checkpointer
+    from memory.store import get_store
+    import profiling
+    import resilience
+
+    if args.checkpointer in ("redis", "tiered"):
+        os.environ["CHECKPOINTER"] = args.checkpointer
+        saver = get_checkpointer()
+        probe = CheckpointProbe(saver, os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    else:
+        from langgraph.checkpoint.memory import MemorySaver
+
+        saver = MemorySaver()
+        probe = CheckpointProbe(saver)
+
+    if os.environ["MONGO_URI"].startswith("mongomock://"):
+        _seed_mongomock(args.sessions)
+    app = build_graph().compile(checkpointer=saver, store=get_store())
+
+    rnd = random.Random(args.seed)
+    names = [s for s in args.scenarios.split(",") if s in SCENARIOS]
+    plan = [rnd.choice(names) for _ in range(args.sessions)]
+    run_id = uuid.uuid4().hex[:8]
+
+    lock = threading.Lock()
+    latencies: List[float] = []
+    per_scenario: Dict[str, List[float]] = {n: [] for n in names}
+    errors: List[str] = []
+
+    def converse(i: int) -> None:
+        scenario = plan[i]
+        config = {"configurable": {"thread_id": f"load-{run_id}-{i}"}}
+        for text in SCENARIOS[scenario]:
+            text = text.format(**_session_ids(i))
+            t0 = time.perf_counter()
+            try:
+                turn_config = resilience.with_budget(config)
+                with lease.turn(saver, turn_config) as turn_config, profiling.turn(turn_config) as turn_config:
+                    app.invoke({"messages": [{"role": "user", "content": text}]}, config=turn_config)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{scenario}: {e!r}")
+                return
+            dt = time.perf_counter() - t0
+            with lock:
+                latencies.append(dt)
+                per_scenario[scenario].append(dt)
+
+    before = probe.sample()
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(converse, range(args.sessions)))
+    wall = time.perf_counter() - t_start
+    after = probe.sample()
+
+    latencies.sort()
+    turns = len(latencies)
+    print(f"sessions={args.sessions} concurrency={args.concurrency} stub_latency={args.latency_ms}ms "
+          f"routing={os.getenv('LLM_ROUTING', 'routed')}")
+    print(f"turns={turns} errors={len(errors)} wall={wall:.2f}s turns/sec={turns / wall:.1f}")
+    print("latency ms: p50={:.1f} p90={:.1f} p99={:.1f} max={:.1f}".format(
+        *(1000 * _pct(latencies, q) for q in (0.5, 0.9, 0.99, 1.0))))
+    for name, xs in per_scenario.items():
+        xs.sort()
+        print(f"  {name:<12} turns={len(xs):<6} p50={1000 * _pct(xs, 0.5):.1f}ms p99={1000 * _pct(xs, 0.99):.1f}ms")
+    grown_keys = after["keys"] - before["keys"]
+    grown_bytes = after["bytes"] - before["bytes"]
+    print(f"checkpoint store: +{grown_keys} checkpoints/keys, +{grown_bytes / 1024:.1f} KiB "
+          f"({grown_bytes / max(args.sessions, 1) / 1024:.1f} KiB/session)")
+    for e in errors[:5]:
+        print("error:", e)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
 
 from graph.build_graph import build_graph
+from memory import lease
 from memory.checkpoint import get_checkpointer
+from memory.store import get_store
+import profiling
+import resilience
+from llm import routing
 
 def main():
     builder = build_graph()
+    print(routing.describe())
     checkpointer = get_checkpointer()
 
-    app = builder.compile(checkpointer=checkpointer)
+    app = builder.compile(checkpointer=checkpointer, store=get_store())
 
-    config = {"configurable": {"thread_id": "user_123"}}
+    config = resilience.with_budget({"configurable": {"thread_id": "user_123"}})
 
     inputs = {
         "messages": [
@@ -16,8 +22,10 @@ def main():
         ]
     }
 
-    for event in app.stream(inputs, config=config, stream_mode="values"):
-        print("STEP:", event)
+    # one turn per thread at a time, across all workers
+    with lease.turn(checkpointer, config) as config, profiling.turn(config) as config:
+        for event in app.stream(inputs, config=config, stream_mode="values"):
+            print("STEP:", event)
 
 
 
@@ -0,0 +1,213 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import metrics
+
+# Admission control in front of the @mcp.tool handlers:
+#  - token buckets per (tool, channelId) and per (tool, clientId), or per
+#    (tool, cardToken) for tools that take no clientId
+#  - a per-tool cap on calls in flight
+# Anything over budget is rejected immediately with a distinct response code
+# instead of queueing behind Mongo.
+#
+# Policy fields (0 = unlimited): channel_rate/channel_burst, client_rate/client_burst
+# (tokens per second / bucket size) and concurrency. ADMISSION_POLICIES (JSON)
+# overrides entries by tool name; "*" is the default.
+#
+# In-memory buckets are swept once idle long enough to be full again (a full
+# bucket and a missing one behave the same); past ADMISSION_MAX_BUCKETS the
+# least recently used half goes too. Redis buckets expire on their own.
+
+RATE_LIMITED = {"responseCode": "429", "responseDescription": "Too many requests, retry later"}
+BUSY = {"responseCode": "503", "responseDescription": "Service busy, retry later"}
+
+ADMISSION_MAX_BUCKETS = int(os.getenv("ADMISSION_MAX_BUCKETS", "100000"))
+
+DEFAULT_POLICIES: Dict[str, Dict[str, float]] = {
+    "*": {"channel_rate": 50, "channel_burst": 100, "client_rate": 5, "client_burst": 20, "concurrency": 32},
+    "getTransactionsHistory": {"channel_rate": 10, "channel_burst": 20, "client_rate": 0.5, "client_burst": 5, "concurrency": 4},
+    "exportStatement": {"channel_rate": 2, "channel_burst": 5, "client_rate": 0.05, "client_burst": 2, "concurrency": 2},
+    "createNewCard": {"channel_rate": 5, "channel_burst": 10, "client_rate": 0.1, "client_burst": 2, "concurrency": 4},
+    "setPin": {"channel_rate": 20, "channel_burst": 40, "client_rate": 0.2, "client_burst": 3, "concurrency": 8},
+}
+
+
+def load_policies() -> Dict[str, Dict[str, float]]:
+    policies = {k: dict(v) for k, v in DEFAULT_POLICIES.items()}
+    raw = os.getenv("ADMISSION_POLICIES", "")
+    if raw:
+        for tool, override in json.loads(raw).items():
+            policies.setdefault(tool, dict(policies["*"])).update(override)
+    return policies
+
+
+class InMemoryBuckets:
+    def __init__(self, max_buckets: int = ADMISSION_MAX_BUCKETS, sweep_every: float = 10.0):
+        self.lock = threading.Lock()
+        self.max_buckets = max_buckets
+        self.sweep_every = sweep_every
+        self.next_sweep = time.monotonic() + sweep_every
+        self.buckets: Dict[str, list] = {}  # key -> [tokens, last_refill, rate, burst]
+
+    def take(self, key: str, rate: float, burst: float) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            b = self.buckets.get(key)
+            if b is None:
+                # only a new key grows the map, so that is when to sweep
+                if now >= self.next_sweep or len(self.buckets) >= self.max_buckets:
+                    self._sweep(now)
+                self.buckets[key] = [burst - 1, now, rate, burst]
+                return True
+            tokens = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+            if tokens < 1:
+                b[0] = tokens
+                return False
+            b[0] = tokens - 1
+            return True
+
+    def _sweep(self, now: float) -> None:
+        self.next_sweep = now + self.sweep_every
+        before = len(self.buckets)
+        self.buckets = {k: b for k, b in self.buckets.items() if b[0] + (now - b[1]) * b[2] < b[3]}
+        if len(self.buckets) >= self.max_buckets:
+            # still full of active buckets: keep the most recently used half
+            recent = sorted(self.buckets.items(), key=lambda kv: kv[1][1])[len(self.buckets) // 2:]
+            self.buckets = dict(recent)
+        metrics.incr("admission.buckets_evicted", before - len(self.buckets))
+
+
+# KEYS[1] bucket hash; ARGV: rate, burst. Uses the Redis clock so nodes agree.
+_LUA_TAKE = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tk', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local ok = 0
+if tokens >= 1 then tokens = tokens - 1; ok = 1 end
+redis.call('HSET', KEYS[1], 'tk', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return ok
+"""
+
+
+class RedisBuckets:
+    def __init__(self, client, prefix: str = "fransa:admit"):
+        self.prefix = prefix
+        self.script = client.register_script(_LUA_TAKE)
+
+    def take(self, key: str, rate: float, burst: float) -> bool:
+        return bool(self.script(keys=[f"{self.prefix}:{key}"], args=[rate, burst]))
+
+
+def _arg_getter(fn: Callable, *names: str) -> Callable[[tuple, dict], str]:
+    params = list(inspect.signature(fn).parameters)
+    for name in names:
+        if name in params:
+            idx = params.index(name)
+
+            def get(args, kwargs, name=name, idx=idx):
+                if name in kwargs:
+                    return str(kwargs[name])
+                return str(args[idx]) if idx < len(args) else ""
+            return get
+    return lambda args, kwargs: ""
+
+
+class Admission:
+    def __init__(self, buckets, policies: Optional[Dict[str, Dict[str, float]]] = None):
+        self.buckets = buckets
+        self.policies = policies or load_policies()
+        self.inflight: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def policy(self, tool: str) -> Dict[str, float]:
+        return self.policies.get(tool, self.policies["*"])
+
+    def guard(self, tool: str) -> Callable[[Callable], Callable]:
+        """
+        Decorator for a tool handler; keeps the signature so FastMCP's schema is unchanged.
+        """
+        def deco(fn: Callable) -> Callable:
+            get_channel = _arg_getter(fn, "channelId", "channel")
+            get_client = _arg_getter(fn, "clientId", "cardToken")
+            p = self.policy(tool)
+            ch_rate, ch_burst = float(p.get("channel_rate", 0)), float(p.get("channel_burst", 0))
+            cl_rate, cl_burst = float(p.get("client_rate", 0)), float(p.get("client_burst", 0))
+            cap = int(p.get("concurrency", 0))
+            self.inflight.setdefault(tool, 0)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if ch_rate:
+                    channel = get_channel(args, kwargs)
+                    if not self.buckets.take(f"{tool}:ch:{channel}", ch_rate, ch_burst or ch_rate):
+                        metrics.incr("admission.rejected", tool=tool, reason="channel_rate")
+                        return dict(RATE_LIMITED)
+                if cl_rate:
+                    client = get_client(args, kwargs)
+                    if client and not self.buckets.take(f"{tool}:cl:{client}", cl_rate, cl_burst or cl_rate):
+                        metrics.incr("admission.rejected", tool=tool, reason="client_rate")
+                        return dict(RATE_LIMITED)
+                if cap:
+                    with self.lock:
+                        if self.inflight[tool] >= cap:
+                            busy = True
+                        else:
+                            busy = False
+                            self.inflight[tool] += 1
+                    if busy:
+                        metrics.incr("admission.rejected", tool=tool, reason="concurrency")
+                        return dict(BUSY)
+                    try:
+                        return fn(*args, **kwargs)
+                    finally:
+                        with self.lock:
+                            self.inflight[tool] -= 1
+                return fn(*args, **kwargs)
+
+            return wrapper
+        return deco
+
+
+def build_admission() -> Admission:
+    """
+    ADMISSION_BACKEND=redis shares buckets across server processes via REDIS_URL.
+    Concurrency caps are always per process.
+    """
+    if os.getenv("ADMISSION_BACKEND", "memory").lower() == "redis":
+        import redis
+
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return Admission(RedisBuckets(client))
+    return Admission(InMemoryBuckets())
+
+
+if __name__ == "__main__":
+    # python -m mcp_2.admission  -> per-call overhead of the guard (in-memory backend)
+    adm = Admission(InMemoryBuckets(), {"*": {"channel_rate": 1e9, "channel_burst": 1e9,
+                                              "client_rate": 1e9, "client_burst": 1e9, "concurrency": 1000}})
+
+    def handler(channelId: str, clientId: str, cardToken: str) -> dict:
+        return {}
+
+    guarded = adm.guard("bench")(handler)
+    n = 200_000
+    t0 = time.perf_counter()
+    for i in range(n):
+        handler(channelId="MOB", clientId="1001", cardToken="?A1")
+    base = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(n):
+        guarded(channelId="MOB", clientId=str(i % 500), cardToken="?A1")
+    dt = time.perf_counter() - t0
+    print(f"admission overhead: {(dt - base) / n * 1e6:.2f} us per call")
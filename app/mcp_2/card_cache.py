@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+CARD_CACHE_SIZE = int(os.getenv("CARD_CACHE_SIZE", "1024"))
+CARD_CACHE_TTL = float(os.getenv("CARD_CACHE_TTL", "30"))
+# backoff between invalidation subscriber reconnects (seconds)
+RECONNECT_MIN = 0.5
+RECONNECT_MAX = 30.0
+
+
+class CardCache:
+    """
+    Bounded LRU + TTL cache of card documents keyed by cardToken.
+
+    Every card write bumps the document's `version`. Invalidations carry that
+    version so a peer only drops entries older than the write, and a fill
+    whose read started before an invalidation is discarded (it may predate
+    the write). Invalidations are only counted for tokens with a load in
+    flight, so that bookkeeping is bounded by concurrent misses.
+    """
+
+    def __init__(self, maxsize: int = CARD_CACHE_SIZE, ttl: float = CARD_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (doc, loaded_at)
+        self.loads: Dict[str, List[int]] = {}  # token -> [loads in flight, invalidations since]
+        self.hits = 0
+        self.misses = 0
+        self.publisher: Optional["RedisInvalidator"] = None
+
+    def get(self, cardToken: str, load: Callable[[str], Optional[Dict[str, Any]]],
+            fill: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Cached doc, or load(cardToken). fill=False for loads that may return
+        an older doc than the primary has (e.g. a hedged read that a lagging
+        secondary answered): it is returned to the caller but not cached.
+        """
+        now = time.monotonic()
+        with self.lock:
+            hit = self.entries.get(cardToken)
+            if hit is not None and now - hit[1] < self.ttl:
+                self.entries.move_to_end(cardToken)
+                self.hits += 1
+                return hit[0]
+            self.misses += 1
+            if fill:
+                inflight = self.loads.setdefault(cardToken, [0, 0])
+                inflight[0] += 1
+                epoch = inflight[1]
+        if not fill:
+            return load(cardToken)
+        doc = None
+        try:
+            doc = load(cardToken)
+        finally:
+            with self.lock:
+                inflight = self.loads[cardToken]
+                fresh = inflight[1] == epoch
+                inflight[0] -= 1
+                if not inflight[0]:
+                    del self.loads[cardToken]
+                if doc is not None and fresh:
+                    self.entries[cardToken] = (doc, now)
+                    self.entries.move_to_end(cardToken)
+                    while len(self.entries) > self.maxsize:
+                        self.entries.popitem(last=False)
+        return doc
+
+    def invalidate(self, cardToken: str, version: Optional[int] = None, broadcast: bool = False) -> None:
+        with self.lock:
+            hit = self.entries.get(cardToken)
+            if hit is not None and version is not None and hit[0].get("version", 0) >= version:
+                stale = False  # already holds this write or a newer one
+            else:
+                stale = True
+                self.entries.pop(cardToken, None)
+                inflight = self.loads.get(cardToken)
+                if inflight is not None:
+                    inflight[1] += 1
+        if stale:
+            metrics.incr("card_cache.invalidations")
+        if broadcast and self.publisher is not None:
+            self.publisher.publish(cardToken, version)
+
+    def clear(self) -> None:
+        """
+        Drops everything, including fills still in flight (invalidations may
+        have been missed).
+        """
+        with self.lock:
+            self.entries.clear()
+            for inflight in self.loads.values():
+                inflight[1] += 1
+        metrics.incr("card_cache.clears")
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "hitRatio": self.hit_ratio()}
+
+
+class RedisInvalidator:
+    """
+    Fans card invalidations out to the other MCP server processes.
+    """
+
+    def __init__(self, cache: CardCache, client, channel: str = "fransa:card-invalidate"):
+        self.cache = cache
+        self.client = client
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        cache.publisher = self
+
+    def publish(self, cardToken: str, version: Optional[int]) -> None:
+        try:
+            self.client.publish(self.channel, json.dumps({"t": cardToken, "v": version, "o": self.origin}))
+        except Exception as e:
+            # peers fall back to TTL expiry
+            print(f"[card_cache] invalidation publish failed: {e}")
+
+    def _listen(self) -> None:
+        # resubscribes after a Redis disconnect; invalidations sent meanwhile
+        # are lost, so the local cache is dropped on every (re)subscribe
+        delay = RECONNECT_MIN
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.cache.clear()
+                delay = RECONNECT_MIN
+                for msg in pubsub.listen():
+                    try:
+                        body = json.loads(msg["data"])
+                    except (TypeError, ValueError):
+                        continue
+                    if body.get("o") != self.origin:
+                        self.cache.invalidate(body["t"], body.get("v"))
+            except Exception as e:
+                print(f"[card_cache] invalidation subscriber lost ({e}); reconnecting in {delay:.1f}s")
+                metrics.incr("card_cache.resubscribes")
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX)
+
+    def start(self) -> "RedisInvalidator":
+        threading.Thread(target=self._listen, name="card-cache-invalidator", daemon=True).start()
+        return self
+
+
+def build_cache() -> CardCache:
+    """
+    CARD_CACHE_PUBSUB=1 subscribes to Redis invalidations (multi-process deployments).
+    """
+    cache = CardCache()
+    if os.getenv("CARD_CACHE_PUBSUB", "0") == "1":
+        import redis
+
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        RedisInvalidator(cache, client).start()
+    metrics.gauge("card_cache.hit_ratio", cache.hit_ratio)
+    metrics.gauge("card_cache.size", lambda: len(cache.entries))
+    return cache
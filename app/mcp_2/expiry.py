@@ -0,0 +1,182 @@
+import calendar
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+import metrics
+from mcp_2.outbox import make_event
+
+# Card expiry as a native date.
+#
+# `expiryDate` stays the ddmmyyyy string the API returns; `expiresAt` holds the
+# same day as a UTC datetime so expiring cards can be found with an index
+# range scan instead of parsing every card. Every writer of expiryDate sets
+# both (expiry_fields()); migrate() backfills cards written before this.
+#
+# The sweeper renews active cards expiring inside a window, oldest first, in
+# bulk_write batches. After each batch it saves a checkpoint (last expiresAt,
+# _id) in `sweeper_checkpoints`, so an interrupted run resumes where it stopped
+# and a run costs O(expiring cards).
+#
+# A batch (read, renewals, their outbox events, checkpoint) runs through
+# transact(fn), which calls fn(session) in one transaction (fransa_mcp's
+# in_transaction). Renewals are guarded on the card's expiresAt and version,
+# and the batch is re-read afterwards: only cards this batch changed get a
+# card.renewed event and a cache invalidation.
+
+SWEEP_WINDOW_DAYS = int(os.getenv("EXPIRY_SWEEP_WINDOW_DAYS", "30"))
+SWEEP_BATCH = int(os.getenv("EXPIRY_SWEEP_BATCH", "500"))
+RENEW_YEARS = 5
+
+
+def parse_expiry(ddmmyyyy: str) -> datetime:
+    return datetime.strptime(ddmmyyyy, "%d%m%Y").replace(tzinfo=timezone.utc)
+
+
+def month_end_expiry(year: int, month: int) -> str:
+    last_day = calendar.monthrange(year, month)[1]
+    return f"{last_day:02d}{month:02d}{year}"
+
+
+def expiry_fields(ddmmyyyy: str) -> Dict[str, Any]:
+    return {"expiryDate": ddmmyyyy, "expiresAt": parse_expiry(ddmmyyyy)}
+
+
+def ensure_indexes(cards) -> None:
+    # sweeper scans (expiresAt, _id) in order within a window
+    cards.create_index([("expiresAt", 1), ("_id", 1)])
+
+
+def migrate(cards, batch_size: int = SWEEP_BATCH) -> int:
+    """
+    Backfill expiresAt on cards that only have the ddmmyyyy string.
+    """
+    done = 0
+    ops = []
+    for doc in cards.find({"expiresAt": {"$exists": False}, "expiryDate": {"$type": "string"}},
+                          {"expiryDate": 1}):
+        try:
+            at = parse_expiry(doc["expiryDate"])
+        except ValueError:
+            print(f"[expiry] skipping card {doc['_id']}: bad expiryDate {doc['expiryDate']!r}")
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"], "expiresAt": {"$exists": False}}, {"$set": {"expiresAt": at}}))
+        if len(ops) >= batch_size:
+            done += cards.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        done += cards.bulk_write(ops, ordered=False).modified_count
+    return done
+
+
+def _renewal(doc: Dict[str, Any]) -> Dict[str, Any]:
+    old = doc["expiresAt"]
+    return expiry_fields(month_end_expiry(old.year + RENEW_YEARS, old.month))
+
+
+def _no_transaction(fn: Callable[[Any], Any]) -> Any:
+    return fn(None)
+
+
+def sweep(cards, checkpoints, outbox=None, on_renewed=None, transact=_no_transaction,
+          window_days: int = SWEEP_WINDOW_DAYS, batch_size: int = SWEEP_BATCH,
+          now: Optional[datetime] = None, name: str = "expiry") -> int:
+    """
+    Renew active cards with expiresAt in [now, now + window_days). Resumes from
+    the checkpoint of an unfinished run over the same window. on_renewed(token,
+    version) is called per renewed card once its batch is committed (cache
+    invalidation).
+    """
+    now = now or datetime.now(timezone.utc)
+    start = datetime(now.year, now.month, now.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=window_days)
+    cp = checkpoints.find_one({"_id": name}) or {}
+    # pymongo hands datetimes back naive (UTC)
+    if cp.get("windowEnd") == end.replace(tzinfo=None) and not cp.get("finished"):
+        after = (cp["lastExpiresAt"], cp["lastId"])
+        renewed = cp.get("renewed", 0)
+        print(f"[expiry] resuming window ending {end:%Y-%m-%d} after {renewed} renewals")
+    else:
+        after = None
+        renewed = 0
+    while True:
+        query: Dict[str, Any] = {"expiresAt": {"$gte": start, "$lt": end}, "status": "A"}
+        if after is not None:
+            query["$or"] = [
+                {"expiresAt": {"$gt": after[0]}},
+                {"expiresAt": after[0], "_id": {"$gt": after[1]}},
+            ]
+
+        def renew_batch(session) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+            batch = list(cards.find(query, {"cardToken": 1, "expiresAt": 1, "version": 1}, session=session)
+                         .sort([("expiresAt", 1), ("_id", 1)]).limit(batch_size))
+            if not batch:
+                return None
+            ops, expected = [], {}
+            for doc in batch:
+                fields = _renewal(doc)
+                version = doc.get("version")
+                # guarded on the read: a card renewed or changed meanwhile is left alone
+                ops.append(UpdateOne(
+                    {"_id": doc["_id"], "expiresAt": doc["expiresAt"], "version": version},
+                    {"$set": {**fields, "reissue": "N"}, "$inc": {"version": 1}},
+                ))
+                expected[doc["_id"]] = ((version or 0) + 1, fields["expiryDate"])
+            cards.bulk_write(ops, ordered=False, session=session)
+            done = [d for d in cards.find({"_id": {"$in": list(expected)}},
+                                          {"cardToken": 1, "version": 1, "expiryDate": 1}, session=session)
+                    if (d.get("version"), d.get("expiryDate")) == expected[d["_id"]]]
+            if outbox is not None and done:
+                outbox.insert_many([make_event("card.renewed", d["cardToken"], {"expiryDate": d["expiryDate"]})
+                                    for d in done], ordered=False, session=session)
+            last = batch[-1]
+            checkpoints.update_one({"_id": name}, {"$set": {
+                "windowEnd": end, "lastExpiresAt": last["expiresAt"], "lastId": last["_id"],
+                "renewed": renewed + len(done), "finished": False, "updatedAt": datetime.now(timezone.utc),
+            }}, upsert=True, session=session)
+            return last, done
+
+        t0 = time.perf_counter()
+        result = transact(renew_batch)
+        if result is None:
+            break
+        metrics.observe("expiry.batch_ms", (time.perf_counter() - t0) * 1000)
+        last, done = result
+        if on_renewed is not None:
+            for d in done:
+                on_renewed(d["cardToken"], d["version"])
+        renewed += len(done)
+        metrics.incr("expiry.renewed", len(done))
+        after = (last["expiresAt"], last["_id"])
+    checkpoints.update_one({"_id": name}, {"$set": {
+        "windowEnd": end, "renewed": renewed, "finished": True, "updatedAt": datetime.now(timezone.utc),
+    }}, upsert=True)
+    return renewed
+
+
+if __name__ == "__main__":
+    # python -m mcp_2.expiry migrate          -> index + backfill expiresAt
+    # python -m mcp_2.expiry sweep [--every S] -> renew cards expiring in the window (once, or every S seconds)
+    import sys
+    from mcp_2.fransa_mcp import card_cache, cards, in_transaction, mongo, outbox
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("migrate", "sweep"):
+        sys.exit("usage: python -m mcp_2.expiry migrate | sweep [--every SECONDS]")
+    ensure_indexes(cards)
+    if sys.argv[1] == "migrate":
+        print(f"Backfilled expiresAt on {migrate(cards)} cards")
+        sys.exit(0)
+    every = float(sys.argv[sys.argv.index("--every") + 1]) if "--every" in sys.argv else 0
+
+    def invalidate(token: str, version: int) -> None:
+        card_cache.invalidate(token, version, broadcast=True)
+
+    while True:
+        n = sweep(cards, mongo["sweeper_checkpoints"], outbox, invalidate, in_transaction)
+        print(f"Renewed {n} cards expiring in the next {SWEEP_WINDOW_DAYS} days")
+        if not every:
+            break
+        time.sleep(every)
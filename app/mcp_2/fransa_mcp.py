@@ -2,27 +2,120 @@ import os
 import json
 import base64
 import calendar
+import functools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import PyMongoError
 from fastmcp import FastMCP
 import bcrypt
 
+from mcp_2.stan import build_allocator
+from mcp_2 import rollups, qr, statements, expiry
+from mcp_2.limits import build_engine
+from mcp_2.outbox import make_event
+from mcp_2.card_cache import build_cache
+from mcp_2.admission import build_admission
+from mcp_2.mongo_monitor import CommandMonitor, attributed
+from mcp_2.mongo_guard import client_options, guarded, hedged_find_one
+from memory.store import forget_cards
+import metrics
+import profiling
+
 load_dotenv()
 MONGODB_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("MONGO_DB", "fransa_demo")
 
-mongo = MongoClient(MONGODB_URI)[DB_NAME]
+if MONGODB_URI.startswith("mongomock://"):
+    # in-process stand-in for load tests / offline runs
+    import mongomock
+    mongo = mongomock.MongoClient()[DB_NAME]
+else:
+    mongo = MongoClient(MONGODB_URI, event_listeners=[CommandMonitor(), profiling.MongoSpanListener()],
+                        **client_options())[DB_NAME]
 users = mongo["users"]
 cards = mongo["cards"]
 limit_profiles = mongo["limit_profiles"]
+spending_rollups = mongo["spending_rollups"]
+outbox = mongo["outbox"]
+qr_withdrawals = mongo["qr_withdrawals"]
+qr.ensure_indexes(qr_withdrawals)
+expiry.ensure_indexes(cards)
+
+# A tool's writes and its outbox event commit in one transaction, which needs
+# a replica set (or mongos). Whether the server can do that is checked on the
+# first mutation, not at import: on a standalone mongod (the default
+# MONGO_URI) a warning is logged and writes go without a transaction, the
+# event right after the change, so a crash in between loses it.
+# OUTBOX_TRANSACTIONS=0 opts out explicitly. mongomock has no transactions.
+#
+# Concurrent transactions on the same card abort with a WriteConflict
+# (TransientTransactionError); the tool is then run again, up to TXN_ATTEMPTS
+# times. A commit whose outcome is unknown (UnknownTransactionCommitResult)
+# is retried on its own.
+OUTBOX_TRANSACTIONS = (os.getenv("OUTBOX_TRANSACTIONS", "1") == "1"
+                       and not MONGODB_URI.startswith("mongomock://"))
+TXN_ATTEMPTS = int(os.getenv("TXN_ATTEMPTS", "3"))
+_txn_supported: Optional[bool] = None
+
+def _transactions() -> bool:
+    global _txn_supported
+    if not OUTBOX_TRANSACTIONS:
+        return False
+    if _txn_supported is None:
+        hello = mongo.client.admin.command("hello")
+        _txn_supported = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+        if not _txn_supported:
+            print("[fransa_mcp] WARNING: Mongo is a standalone server, transactions need a replica set; "
+                  "outbox events are written outside them (set OUTBOX_TRANSACTIONS=0 to silence)")
+    return _txn_supported
+
+def _retry_transient(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, TXN_ATTEMPTS + 1):
+            try:
+                return fn(*args, **kwargs)
+            except PyMongoError as e:
+                if attempt == TXN_ATTEMPTS or not e.has_error_label("TransientTransactionError"):
+                    raise
+                metrics.incr("mongo.txn_retries", tool=fn.__name__)
+                time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+    return wrapper
 
 mcp = FastMCP(name="fransa-mcp")
-
-def _ensure_card(cardToken: str) -> Dict[str, Any]:
-    doc = cards.find_one({"cardToken": cardToken})
+_admission = build_admission()
+
+def admit(tool: str):
+    # admission first, so rejected calls are not booked against the tool's Mongo budget;
+    # then deadline + breaker, so an open breaker answers before touching Mongo
+    guard = _admission.guard(tool)
+    return lambda fn: guard(guarded(tool)(attributed(tool)(_retry_transient(fn))))
+
+limit_engine = build_engine(lambda name: limit_profiles.find_one({"limitProfile": name}, {"_id": 0}))
+
+card_cache = build_cache()
+# cached card docs leave out the transaction history, which grows without
+# bound; getTransactionsHistory reads it from Mongo per request
+CARD_PROJECTION = {"transactions": 0}
+# cards written inside the current _mutation() transaction, invalidated on commit
+_dirty_cards: ContextVar[Optional[list]] = ContextVar("_dirty_cards", default=None)
+
+def _ensure_card(cardToken: str, hedged: bool = False) -> Dict[str, Any]:
+    # shared cached doc: read it, never mutate it
+    if hedged:
+        # the hedge may be answered by a lagging secondary: serve a cached
+        # doc if there is one, but never cache what the hedged read returns
+        doc = card_cache.get(cardToken, lambda t: hedged_find_one(cards, {"cardToken": t}, CARD_PROJECTION),
+                             fill=False)
+    else:
+        doc = card_cache.get(cardToken, lambda t: cards.find_one({"cardToken": t}, CARD_PROJECTION))
     if not doc:
         raise ValueError("cardToken not found")
     return doc
@@ -33,9 +126,8 @@ def _ensure_client(clientId: str) -> Dict[str, Any]:
         raise ValueError("clientId not found")
     return doc
 
-def _stan() -> str:
-    # 12 digits, pseudo-unique per call
-    return datetime.utcnow().strftime("%H%M%S%f")[-12:]
+# 12 digits, unique across processes (block-leased from the shared counter)
+_stan = build_allocator(mongo)
 
 def _now_ddmmyyyy_time():
     now = datetime.now(timezone.utc)
@@ -58,32 +150,160 @@ def _month_end_expiry(year: int, month: int) -> str:
     last_day = calendar.monthrange(year, month)[1]
     return f"{last_day:02d}{month:02d}{year}"
 
-def _get_user_wallet(clientId: str, currency: str) -> float:
-    doc = _ensure_client(clientId)
-    wallets = doc.get("wallets", {})
-    return float(wallets.get(currency, 0.0))
-
-def _set_user_wallet(clientId: str, currency: str, new_balance: float) -> None:
-    users.update_one(
-        {"clientId": clientId},
-        {"$set": {f"wallets.{currency}": float(new_balance)}},
-        upsert=False,
+# Balances only ever move by an atomic $inc whose filter carries the funds
+# check, never by writing back a value computed from an earlier read (the card
+# doc may come from card_cache and be stale). A debit that would overdraw
+# matches nothing and is declined.
+
+def _move_client_funds(clientId: str, pocket: str, currency: str, delta: float, session=None) -> float:
+    """
+    Adds `delta` to the client's wallets/accounts balance in `currency` and
+    returns the new balance; raises _Declined("051") if a debit exceeds it.
+    """
+    field = f"{pocket}.{currency}"
+    where: Dict[str, Any] = {"clientId": clientId}
+    if delta < 0:
+        where[field] = {"$gte": -delta}
+    doc = users.find_one_and_update(
+        where, {"$inc": {field: float(delta)}},
+        projection={pocket: 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
     )
-
-def _get_user_account(clientId: str, currency: str) -> float:
-    doc = _ensure_client(clientId)
-    accts = doc.get("accounts", {})
-    return float(accts.get(currency, 0.0))
-
-def _set_user_account(clientId: str, currency: str, new_balance: float) -> None:
-    users.update_one(
-        {"clientId": clientId},
-        {"$set": {f"accounts.{currency}": float(new_balance)}},
-        upsert=False,
+    if doc is None:
+        if delta < 0 and users.count_documents({"clientId": clientId}, limit=1, session=session):
+            raise _Declined("051", f"Insufficient {pocket[:-1]} funds")
+        raise ValueError("clientId not found")
+    return float(doc[pocket][currency])
+
+def _move_card_funds(cardToken: str, delta: float, session=None) -> float:
+    """
+    Adds `delta` to the card's availableBalance and returns the new balance;
+    raises _Declined("051") if a debit exceeds it.
+    """
+    where = {"availableBalance": {"$gte": -delta}} if delta < 0 else None
+    doc = _update_card(cardToken, {"$inc": {"availableBalance": float(delta)}}, session,
+                       where=where, fields=("availableBalance",))
+    if doc is None:
+        raise _Declined("051", "Insufficient card funds")
+    return float(doc["availableBalance"])
+
+def _append_card_txn(cardToken: str, txn: Dict[str, Any], session=None) -> None:
+    _update_card(cardToken, {"$push": {"transactions": txn}}, session)
+    rollups.record_txn(spending_rollups, cardToken, txn, session=session)
+
+def _update_card(cardToken: str, update: Dict[str, Any], session=None,
+                 where: Optional[Dict[str, Any]] = None, fields=()) -> Optional[Dict[str, Any]]:
+    """
+    Every card write goes through here: bumps `version` and invalidates the
+    cached copy locally and on peer processes. `where` adds conditions to the
+    filter; returns the updated `fields` (and version), or None when nothing
+    matched.
+    """
+    update = {**update, "$inc": {**update.get("$inc", {}), "version": 1}}
+    doc = cards.find_one_and_update(
+        {**(where or {}), "cardToken": cardToken}, update,
+        projection={"version": 1, **{f: 1 for f in fields}},
+        return_document=ReturnDocument.AFTER,
+        session=session,
     )
+    if doc is None and where is not None:
+        return None
+    version = doc.get("version") if doc else None
+    pending = _dirty_cards.get()
+    if pending is not None:
+        pending.append((cardToken, version))
+    else:
+        card_cache.invalidate(cardToken, version, broadcast=True)
+    return doc
 
-def _append_card_txn(cardToken: str, txn: Dict[str, Any]) -> None:
-    cards.update_one({"cardToken": cardToken}, {"$push": {"transactions": txn}})
+@contextmanager
+def _mutation():
+    """
+    Yields the session that a tool's writes and its outbox event share.
+    """
+    if not _transactions():
+        yield None
+        return
+    pending: list = []
+    reset = _dirty_cards.set(pending)
+    try:
+        with mongo.client.start_session() as s:
+            s.start_transaction()
+            try:
+                yield s
+            except BaseException:
+                s.abort_transaction()
+                raise
+            _commit(s)
+    finally:
+        _dirty_cards.reset(reset)
+    # only after commit: earlier, a concurrent read could re-cache the old doc
+    for token, version in pending:
+        card_cache.invalidate(token, version, broadcast=True)
+
+def in_transaction(fn: Callable[[Any], Any]) -> Any:
+    """
+    fn(session) inside one _mutation(), re-run on transient transaction
+    errors. For writers outside a tool (e.g. the expiry sweeper).
+    """
+    def once():
+        with _mutation() as s:
+            return fn(s)
+    return _retry_transient(functools.wraps(fn)(once))()
+
+def _commit(s) -> None:
+    for attempt in range(1, TXN_ATTEMPTS + 1):
+        try:
+            s.commit_transaction()
+            return
+        except PyMongoError as e:
+            if attempt == TXN_ATTEMPTS or not e.has_error_label("UnknownTransactionCommitResult"):
+                raise
+            metrics.incr("mongo.txn_commit_retries")
+
+class _Declined(Exception):
+    """
+    A business decline (limit hit, insufficient funds) raised inside a
+    transfer: aborts its transaction and gives the limit allowance back.
+    """
+
+    def __init__(self, code: str, description: str):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+@contextmanager
+def _limit_hold(card: Dict[str, Any], amount: float, currency: str):
+    """
+    Consumes the card's limit allowance for a transfer; released again if
+    the transfer's writes fail, so failed attempts do not use up the limit.
+    """
+    now = time.time()
+    blocked = limit_engine.check_and_consume(card, amount, currency, now)
+    if blocked:
+        raise _Declined(*blocked)
+    try:
+        yield
+    except BaseException:
+        limit_engine.release(card, amount, currency, now)
+        raise
+
+def _emit(kind: str, cardToken: str, data: Optional[Dict[str, Any]] = None, session=None) -> None:
+    outbox.insert_one(make_event(kind, cardToken, data), session=session)
+
+def _cards_changed(clientId: str) -> None:
+    # the client's remembered card summary (memory/store.py) no longer matches
+    forget_cards(str(clientId))
+
+def _txn_event(txn: Dict[str, Any], new_avail: float) -> Dict[str, Any]:
+    return {
+        "stan": txn["stanNumber"],
+        "type": txn["transactionType"],
+        "amount": txn["transactionAmount"],
+        "currency": txn["currency"],
+        "availableBalance": _fmt(new_avail),
+    }
 
 def _require_card_belongs_to_client(card: Dict[str, Any], clientId: str):
     if str(card.get("clientId")) != str(clientId):
@@ -97,6 +317,7 @@ def _mask_card_number(num: Optional[str]) -> str:
     return f"**** **** **** {last4}"
 
 @mcp.tool("listClientCards", description="List all cards for a client with masked numbers (only last 4 visible)")
+@admit("listClientCards")
 def list_client_cards(channelId: str, clientId: str) -> dict:
     _ensure_client(clientId)
     docs = list(cards.find({"clientId": str(clientId)}, {"_id": 0}))
@@ -137,9 +358,21 @@ def resource_cards() -> list:
 def resource_limits() -> list:
     return list(limit_profiles.find({}, {"_id": 0}))
 
+@mcp.resource("statement://{statementId}/{part}")
+def resource_statement_part(statementId: str, part: str) -> str:
+    text = statements.read_part(statementId, int(part))
+    if text is None:
+        raise ValueError("statement part not found (or expired)")
+    return text
+
+@mcp.resource("metrics://server")
+def resource_metrics() -> dict:
+    return {**metrics.snapshot(), "cardCache": card_cache.stats()}
+
 
 
 @mcp.tool("createNewCard", description="Create a new card for an existing client")
+@admit("createNewCard")
 def create_new_card(clientId: str, firstName: str, lastName: str, embossingName1: str, address1: str, city: str,
                     Mobile: str, dateOfBirth: str, MaritalStatus: str, gender: str, email: str, channelId: str,
                     type: str, productType: str, currency: str, embossingName2: str = "", cardLimit: str = "0",
@@ -148,7 +381,7 @@ def create_new_card(clientId: str, firstName: str, lastName: str, embossingName1
     token = f"?A{base64.b16encode(os.urandom(7)).decode()}"
     number = str(5_0000_0000_0000_000 + int.from_bytes(os.urandom(7), "big") % 10**15).zfill(16)
     now = datetime.utcnow()
-    expiry = _month_end_expiry(now.year, now.month)
+    expiry_date = _month_end_expiry(now.year, now.month)
     card_doc = {
         "clientId": str(clientId),
         "cardToken": token,
@@ -158,7 +391,7 @@ def create_new_card(clientId: str, firstName: str, lastName: str, embossingName1
         "currency": _norm_currency(currency),
         "limitProfile": "ICCSLIMIT",
         "status": "A",
-        "expiryDate": expiry,
+        **expiry.expiry_fields(expiry_date),
         "cvv2": f"{int.from_bytes(os.urandom(2), 'big') % 1000:03d}",
         "pinHash": bcrypt.hashpw(b"0000", bcrypt.gensalt()).decode(),
         "availableBalance": 0.0,
@@ -182,18 +415,23 @@ def create_new_card(clientId: str, firstName: str, lastName: str, embossingName1
         "cardLimit": cardLimit,
         "design": design,
     }
-    cards.insert_one(card_doc)
+    with _mutation() as s:
+        cards.insert_one(card_doc, session=s)
+        _emit("card.created", token, {"clientId": str(clientId), "status": "A", "expiryDate": expiry_date}, s)
+    _cards_changed(clientId)
     return {
         "responseCode": "000",
         "responseDescription": "Success",
         "cardNumber": number,
         "cardToken": token,
-        "cardExpiryDate": expiry
+        "cardExpiryDate": expiry_date
     }
 
 @mcp.tool("retrieveCardDetails", description="Retrieve card details by cardToken")
+@admit("retrieveCardDetails")
 def retrieve_card_details(channel: str, cardToken: str) -> dict:
-    card = _ensure_card(cardToken)
+    # read-only: a slow primary read may be hedged (MONGO_HEDGE_MS)
+    card = _ensure_card(cardToken, hedged=True)
     details = {
         "paymentPercentage": str(card.get("paymentPercentage", 10)),
         "availableBalance": _fmt(float(card.get('availableBalance', 0.0))),
@@ -206,27 +444,66 @@ def retrieve_card_details(channel: str, cardToken: str) -> dict:
     return {"responseCode": "000", "responseDescription": "Success", "cardDetails": details}
 
 @mcp.tool("setPin", description="Set new PIN for a card (base64 encoded)")
+@admit("setPin")
 def set_pin(channelId: str, clientId: str, cardToken: str, pin: str) -> dict:
     _ensure_client(clientId)
     _ensure_card(cardToken)
     raw = base64.b64decode(pin).decode()
     if not raw.isdigit() or not (4 <= len(raw) <= 6):
         raise ValueError("PIN must be 4-6 digits")
-    cards.update_one({"cardToken": cardToken}, {"$set": {"pinHash": bcrypt.hashpw(raw.encode(), bcrypt.gensalt()).decode()}})
+    pin_hash = bcrypt.hashpw(raw.encode(), bcrypt.gensalt()).decode()
+    with _mutation() as s:
+        _update_card(cardToken, {"$set": {"pinHash": pin_hash}}, s)
+        _emit("card.pin_changed", cardToken, session=s)
     return {"responseCode": "000", "responseDescription": "PIN updated successfully"}
 
 @mcp.tool("getTransactionsHistory", description="Get transactions for a card within date range (ddmmyyyy)")
+@admit("getTransactionsHistory")
 def get_transactions_history(channelId: str, cardToken: str, fromDate: str, toDate: str) -> dict:
-    card = _ensure_card(cardToken)
+    _ensure_card(cardToken)
     def as_dt(s: str) -> datetime:
         return datetime.strptime(s, "%d%m%Y")
     start, end = as_dt(fromDate), as_dt(toDate)
-    txns = [t for t in card.get("transactions", []) if start <= as_dt(t["date"]) <= end]
+    doc = cards.find_one({"cardToken": cardToken}, {"_id": 0, "transactions": 1}) or {}
+    txns = [t for t in doc.get("transactions", []) if start <= as_dt(t["date"]) <= end]
     return {"responseCode": "000", "responseDescription": "Success", "transactions": txns}
 
+@mcp.tool("getSpendingSummary", description="Totals per transaction type and currency for a card within date range (ddmmyyyy)")
+@admit("getSpendingSummary")
+def get_spending_summary(channelId: str, cardToken: str, fromDate: str, toDate: str) -> dict:
+    _ensure_card(cardToken)
+    start = datetime.strptime(fromDate, "%d%m%Y").date()
+    end = datetime.strptime(toDate, "%d%m%Y").date()
+    if end < start:
+        raise ValueError("toDate is before fromDate")
+    summary = rollups.summarize(spending_rollups, cardToken, start, end)
+    totals = []
+    for ttype, by_cur in sorted(summary["totals"].items()):
+        for cur, agg in sorted(by_cur.items()):
+            totals.append({
+                "transactionType": ttype,
+                "transactionTypeDescription": summary["types"].get(ttype, ""),
+                "currency": cur,
+                "totalAmount": _fmt(agg["amount"]),
+                "transactionCount": str(agg["count"]),
+            })
+    return {"responseCode": "000", "responseDescription": "Success", "totals": totals}
+
+@mcp.tool("exportStatement", description="Export a card statement for a date range (ddmmyyyy) as ndjson or csv; returns a statementId, read parts via statement://{statementId}/{part} until expiresAt")
+@admit("exportStatement")
+def export_statement(channelId: str, cardToken: str, fromDate: str, toDate: str, format: str = "ndjson") -> dict:
+    card = _ensure_card(cardToken)
+    start = datetime.strptime(fromDate, "%d%m%Y").date()
+    end = datetime.strptime(toDate, "%d%m%Y").date()
+    if end < start:
+        raise ValueError("toDate is before fromDate")
+    summary = statements.export(cards, spending_rollups, card, start, end, format.lower())
+    return {"responseCode": "000", "responseDescription": "Success", **summary}
+
 
 
 @mcp.tool("retrieveCvv2", description="Return CVV2 for a given cardToken")
+@admit("retrieveCvv2")
 def retrieve_cvv2(channelId: str, cardToken: str) -> dict:
     card = _ensure_card(cardToken)
     cvv = card.get("cvv2")
@@ -235,19 +512,34 @@ def retrieve_cvv2(channelId: str, cardToken: str) -> dict:
     return {"responseCode": "000", "responseDescription": "Success", "cvv2": str(cvv)}
 
 @mcp.tool("qrCodeWithdrawal", description="Generate a QR withdrawal payload")
+@admit("qrCodeWithdrawal")
 def qr_code_withdrawal(channelId: str, transactionId: str, amount: str, currency: str, mobile: str) -> dict:
     cur = _norm_currency(currency)
     d, t = _now_ddmmyyyy_time()
     payload = f"{transactionId}|{_fmt(float(amount))}|{cur}|{mobile}|{d}{t}"
     qr_b64 = base64.b64encode(payload.encode()).decode()
-    users.update_one(
-        {"Mobile": mobile},
-        {"$push": {"qr_withdrawals": {"tx": transactionId, "amount": _fmt(float(amount)), "currency": cur, "createdAt": f"{d}{t}"}}},
-        upsert=False,
-    )
-    return {"responseCode": "000", "responseDescription": "Success", "qrCode": qr_b64, "expiresInSeconds": 300}
+    failed = qr.issue(qr_withdrawals, transactionId, _fmt(float(amount)), cur, mobile, channelId)
+    if failed:
+        return {"responseCode": failed[0], "responseDescription": failed[1]}
+    return {"responseCode": "000", "responseDescription": "Success", "qrCode": qr_b64, "expiresInSeconds": qr.QR_TTL_SECONDS}
+
+@mcp.tool("redeemQrWithdrawal", description="Validate and consume a QR withdrawal code (single use)")
+@admit("redeemQrWithdrawal")
+def redeem_qr_withdrawal(channelId: str, qrCode: str) -> dict:
+    try:
+        transactionId, amount, cur, mobile, _ = base64.b64decode(qrCode, validate=True).decode().split("|")
+    except ValueError:
+        return {"responseCode": qr.INVALID[0], "responseDescription": qr.INVALID[1]}
+    failed, doc = qr.redeem(qr_withdrawals, transactionId, amount, cur, mobile, channelId)
+    if failed:
+        return {"responseCode": failed[0], "responseDescription": failed[1]}
+    return {
+        "responseCode": "000", "responseDescription": "Success",
+        "transactionId": transactionId, "amount": amount, "currency": cur, "mobile": mobile,
+    }
 
 @mcp.tool("transferFundsFromAccount", description="Move funds from client account to card balance")
+@admit("transferFundsFromAccount")
 def transfer_funds_from_account(channelId: str, clientId: str, cardToken: str,
                                 amount: str, transferMode: str, currency: str) -> dict:
     card = _ensure_card(cardToken)
@@ -255,14 +547,6 @@ def transfer_funds_from_account(channelId: str, clientId: str, cardToken: str,
     cur = _norm_currency(currency)
     amt = float(amount)
 
-    acct_bal = _get_user_account(clientId, cur)
-    if acct_bal < amt:
-        return {"responseCode": "051", "responseDescription": "Insufficient account funds"}
-
-    _set_user_account(clientId, cur, acct_bal - amt)
-    new_avail = float(card.get("availableBalance", 0.0)) + amt
-    cards.update_one({"cardToken": cardToken}, {"$set": {"availableBalance": new_avail}})
-
     stan = _stan()
     d, t = _now_ddmmyyyy_time()
     txn = {
@@ -280,7 +564,14 @@ def transfer_funds_from_account(channelId: str, clientId: str, cardToken: str,
         "time": t,
         "transactionTypeDescription": "ACCOUNT TO CARD",
     }
-    _append_card_txn(cardToken, txn)
+    try:
+        with _limit_hold(card, amt, cur), _mutation() as s:
+            _move_client_funds(clientId, "accounts", cur, -amt, session=s)
+            new_avail = _move_card_funds(cardToken, amt, s)
+            _append_card_txn(cardToken, txn, session=s)
+            _emit("card.transfer", cardToken, _txn_event(txn, new_avail), s)
+    except _Declined as e:
+        return {"responseCode": e.code, "responseDescription": e.description}
 
     return {
         "responseCode": "000", "responseDescription": "Success",
@@ -290,6 +581,7 @@ def transfer_funds_from_account(channelId: str, clientId: str, cardToken: str,
     }
 
 @mcp.tool("transferFundsFromWallet", description="Move funds from client wallet to card balance")
+@admit("transferFundsFromWallet")
 def transfer_funds_from_wallet(channelId: str, clientId: str, cardToken: str,
                                amount: str, transferMode: str, currency: str, name: str = "") -> dict:
     card = _ensure_card(cardToken)
@@ -297,14 +589,6 @@ def transfer_funds_from_wallet(channelId: str, clientId: str, cardToken: str,
     cur = _norm_currency(currency)
     amt = float(amount)
 
-    wal_bal = _get_user_wallet(clientId, cur)
-    if wal_bal < amt:
-        return {"responseCode": "051", "responseDescription": "Insufficient wallet funds"}
-
-    _set_user_wallet(clientId, cur, wal_bal - amt)
-    new_avail = float(card.get("availableBalance", 0.0)) + amt
-    cards.update_one({"cardToken": cardToken}, {"$set": {"availableBalance": new_avail}})
-
     stan = _stan()
     d, t = _now_ddmmyyyy_time()
     txn = {
@@ -322,7 +606,14 @@ def transfer_funds_from_wallet(channelId: str, clientId: str, cardToken: str,
         "time": t,
         "transactionTypeDescription": "WALLET TO CARD",
     }
-    _append_card_txn(cardToken, txn)
+    try:
+        with _limit_hold(card, amt, cur), _mutation() as s:
+            _move_client_funds(clientId, "wallets", cur, -amt, session=s)
+            new_avail = _move_card_funds(cardToken, amt, s)
+            _append_card_txn(cardToken, txn, session=s)
+            _emit("card.transfer", cardToken, _txn_event(txn, new_avail), s)
+    except _Declined as e:
+        return {"responseCode": e.code, "responseDescription": e.description}
 
     return {
         "responseCode": "000", "responseDescription": "Success",
@@ -332,17 +623,21 @@ def transfer_funds_from_wallet(channelId: str, clientId: str, cardToken: str,
     }
 
 @mcp.tool("updateClientMobileNumber", description="Update client's mobile number")
+@admit("updateClientMobileNumber")
 def update_client_mobile_number(channelId: str, clientId: str, cardToken: str, Mobile: str) -> dict:
     card = _ensure_card(cardToken)
     _require_card_belongs_to_client(card, clientId)
-    res = users.update_one({"clientId": clientId}, {"$set": {"Mobile": Mobile}})
-    if res.matched_count == 0:
-        raise ValueError("clientId not found")
-    # also mirror on card doc for convenience
-    cards.update_one({"cardToken": cardToken}, {"$set": {"mobile": Mobile}})
+    with _mutation() as s:
+        res = users.update_one({"clientId": clientId}, {"$set": {"Mobile": Mobile}}, session=s)
+        if res.matched_count == 0:
+            raise ValueError("clientId not found")
+        # also mirror on card doc for convenience
+        _update_card(cardToken, {"$set": {"mobile": Mobile}}, s)
+        _emit("card.mobile_changed", cardToken, {"clientId": str(clientId)}, s)
     return {"responseCode": "000", "responseDescription": "Success"}
 
 @mcp.tool("getLimitDetails", description="Return limit details for a given limitProfile from Mongo mirror")
+@admit("getLimitDetails")
 def get_limit_details(channelId: str, limitProfile: str) -> dict:
     docs = list(limit_profiles.find({"limitProfile": limitProfile}, {"_id": 0}))
     limits = []
@@ -365,24 +660,22 @@ def get_limit_details(channelId: str, limitProfile: str) -> dict:
     return {"responseCode": "000", "responseDescription": "Success", "limits": limits}
 
 @mcp.tool("getLimitProfile", description="List available limit profiles (short/long descriptions)")
+@admit("getLimitProfile")
 def get_limit_profile(channelId: str, cardToken: str) -> dict:
     profiles = sorted({d["limitProfile"] for d in limit_profiles.find({}, {"limitProfile": 1, "_id": 0})})
     limits = [{"longDescription": p, "limitProfile": p, "shortDescription": p} for p in profiles]
     return {"responseCode": "000", "responseDescription": "Success", "limits": limits}
 
 @mcp.tool("redeemPoints", description="Redeem cashback points into card available balance as a memo credit")
+@admit("redeemPoints")
 def redeem_points(channelId: str, cardToken: str) -> dict:
     card = _ensure_card(cardToken)
-    cashback = float(card.get("cashback", 0.0))
+    # the amount comes from Mongo, not the cached doc; the write below only
+    # applies while it is still the card's cashback
+    fresh = cards.find_one({"cardToken": cardToken}, {"cashback": 1})
+    cashback = float((fresh or {}).get("cashback", 0.0))
     if cashback <= 0.0:
         return {"responseCode": "340", "responseDescription": "No points to redeem"}
-    new_cashback = 0.0
-    new_avail = float(card.get("availableBalance", 0.0)) + cashback
-
-    cards.update_one({"cardToken": cardToken}, {"$set": {
-        "cashback": new_cashback,
-        "availableBalance": new_avail
-    }})
 
     stan = _stan()
     d, t = _now_ddmmyyyy_time()
@@ -401,40 +694,64 @@ def redeem_points(channelId: str, cardToken: str) -> dict:
         "time": t,
         "transactionTypeDescription": "MEMO-CREDIT ADJUSTMENT"
     }
-    _append_card_txn(cardToken, txn)
+    try:
+        with _mutation() as s:
+            doc = _update_card(cardToken, {"$set": {"cashback": 0.0}, "$inc": {"availableBalance": cashback}}, s,
+                               where={"cashback": cashback}, fields=("availableBalance",))
+            if doc is None:
+                # redeemed (or earned more) concurrently
+                raise _Declined("340", "No points to redeem")
+            new_avail = float(doc["availableBalance"])
+            _append_card_txn(cardToken, txn, session=s)
+            _emit("card.points_redeemed", cardToken, _txn_event(txn, new_avail), s)
+    except _Declined as e:
+        return {"responseCode": e.code, "responseDescription": e.description}
 
     return {"responseCode": "000", "responseDescription": "Success"}
 
 @mcp.tool("updateLimitProfile", description="Assign a new limit profile to a card")
+@admit("updateLimitProfile")
 def update_limit_profile(channelId: str, cardToken: str, Limit: str = "") -> dict:
-    _ensure_card(cardToken)
+    card = _ensure_card(cardToken)
     if Limit:
         # validate it exists
         exists = limit_profiles.find_one({"limitProfile": Limit})
         if not exists:
             return {"responseCode": "404", "responseDescription": "Limit profile not found"}
-        cards.update_one({"cardToken": cardToken}, {"$set": {"limitProfile": Limit}})
+        with _mutation() as s:
+            _update_card(cardToken, {"$set": {"limitProfile": Limit}}, s)
+            _emit("card.limit_profile", cardToken, {"limitProfile": Limit}, s)
+        _cards_changed(card["clientId"])
     # If empty Limit, no-op but mirror MI behavior: still success
     return {"responseCode": "000", "responseDescription": "Success"}
 
 @mcp.tool("updateCardStatus", description="Update card status code and optional reason")
+@admit("updateCardStatus")
 def update_card_status(channelId: str, cardToken: str, status: str, reason: str = "") -> dict:
-    _ensure_card(cardToken)
-    cards.update_one({"cardToken": cardToken}, {"$set": {"status": status, "statusReason": reason}})
+    card = _ensure_card(cardToken)
+    with _mutation() as s:
+        _update_card(cardToken, {"$set": {"status": status, "statusReason": reason}}, s)
+        _emit("card.status", cardToken, {"status": status, "reason": reason}, s)
+    _cards_changed(card["clientId"])
     return {"responseCode": "000", "responseDescription": "Success"}
 
 @mcp.tool("updateCardRenewal", description="Renew the card expiry date to month-end, 5 years ahead")
+@admit("updateCardRenewal")
 def update_card_renewal(channelId: str, cardToken: str) -> dict:
-    _ensure_card(cardToken)
+    card = _ensure_card(cardToken)
     now = datetime.utcnow()
     new_year = now.year + 5
     new_expiry = _month_end_expiry(new_year, now.month)
-    cards.update_one({"cardToken": cardToken}, {"$set": {"expiryDate": new_expiry, "reissue": "N"}})
+    with _mutation() as s:
+        _update_card(cardToken, {"$set": {**expiry.expiry_fields(new_expiry), "reissue": "N"}}, s)
+        _emit("card.renewed", cardToken, {"expiryDate": new_expiry}, s)
+    _cards_changed(card["clientId"])
     return {"responseCode": "000", "responseDescription": "Success", "expiryDate": new_expiry}
 
 
 
 @mcp.tool("transferFundsCardToWallet", description="Move funds from card to client wallet (not in MI list; convenience)")
+@admit("transferFundsCardToWallet")
 def transfer_funds_card_to_wallet(channelId: str, clientId: str, cardToken: str,
                                   amount: str, currency: str) -> dict:
     card = _ensure_card(cardToken)
@@ -442,16 +759,6 @@ def transfer_funds_card_to_wallet(channelId: str, clientId: str, cardToken: str,
     cur = _norm_currency(currency)
     amt = float(amount)
 
-    avail = float(card.get("availableBalance", 0.0))
-    if avail < amt:
-        return {"responseCode": '051', "responseDescription": "Insufficient card funds"}
-
-    new_avail = avail - amt
-    cards.update_one({"cardToken": cardToken}, {"$set": {"availableBalance": new_avail}})
-
-    wal_bal = _get_user_wallet(clientId, cur)
-    _set_user_wallet(clientId, cur, wal_bal + amt)
-
     stan = _stan()
     d, t = _now_ddmmyyyy_time()
     txn = {
@@ -469,7 +776,14 @@ def transfer_funds_card_to_wallet(channelId: str, clientId: str, cardToken: str,
         "time": t,
         "transactionTypeDescription": "CARD TO WALLET",
     }
-    _append_card_txn(cardToken, txn)
+    try:
+        with _limit_hold(card, amt, cur), _mutation() as s:
+            new_avail = _move_card_funds(cardToken, -amt, s)
+            _move_client_funds(clientId, "wallets", cur, amt, session=s)
+            _append_card_txn(cardToken, txn, session=s)
+            _emit("card.transfer", cardToken, _txn_event(txn, new_avail), s)
+    except _Declined as e:
+        return {"responseCode": e.code, "responseDescription": e.description}
 
     return {
         "responseCode": "000", "responseDescription": "Success",
@@ -0,0 +1,286 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Sliding-window limit counters. Each (card, window) keeps two fixed buckets,
+# the current and the previous one; usage is estimated as
+#   prev * (1 - elapsed_fraction) + cur
+# which is O(1) in memory and work per check (the classic sliding-window counter).
+
+WEEK = 7 * 86400
+MONTH = 30 * 86400
+PROFILE_TTL = float(os.getenv("LIMIT_PROFILE_TTL", "60"))
+
+# (code, description) returned by the transfer tools when a limit is hit
+EXCEEDS_AMOUNT = ("061", "Exceeds amount limit")
+EXCEEDS_COUNT = ("065", "Exceeds transaction count limit")
+
+
+def _window(now: float, size: int) -> Tuple[int, float]:
+    idx, off = divmod(now, size)
+    return int(idx), off / size
+
+
+def _limits(profile: Dict[str, Any]) -> Tuple[float, float, int, int, float, str]:
+    # 0 means "no limit", as in the seeded profiles
+    return (
+        float(profile.get("amountWeekly", 0) or 0),
+        float(profile.get("amountMonthly", 0) or 0),
+        int(profile.get("txnNumberWeek", 0) or 0),
+        int(profile.get("txnNumberMonth", 0) or 0),
+        float(profile.get("transactionAccountLimit", 0) or 0),
+        str(profile.get("txnCurrency", "")),
+    )
+
+
+class InMemoryLimitBackend:
+    """
+    Single-node backend: counters live in a dict guarded by one lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (card, size) -> [idx, cur_amount, cur_count, prev_amount, prev_count]
+        self.buckets: Dict[Tuple[str, int], list] = {}
+
+    def _bucket(self, card: str, size: int, idx: int) -> list:
+        b = self.buckets.get((card, size))
+        if b is None:
+            b = self.buckets[(card, size)] = [idx, 0.0, 0, 0.0, 0]
+        elif b[0] != idx:
+            if b[0] == idx - 1:
+                b[3], b[4] = b[1], b[2]
+            else:
+                b[3], b[4] = 0.0, 0
+            b[0], b[1], b[2] = idx, 0.0, 0
+        return b
+
+    def check_and_add(self, card: str, amount: float, count_amount: bool,
+                      max_amt_w: float, max_amt_m: float, max_n_w: int, max_n_m: int,
+                      now: float) -> Optional[Tuple[str, str]]:
+        wi, wf = _window(now, WEEK)
+        mi, mf = _window(now, MONTH)
+        add_amt = amount if count_amount else 0.0
+        with self.lock:
+            w = self._bucket(card, WEEK, wi)
+            m = self._bucket(card, MONTH, mi)
+            if max_n_w and w[4] * (1 - wf) + w[2] + 1 > max_n_w:
+                return EXCEEDS_COUNT
+            if max_n_m and m[4] * (1 - mf) + m[2] + 1 > max_n_m:
+                return EXCEEDS_COUNT
+            if max_amt_w and w[3] * (1 - wf) + w[1] + add_amt > max_amt_w:
+                return EXCEEDS_AMOUNT
+            if max_amt_m and m[3] * (1 - mf) + m[1] + add_amt > max_amt_m:
+                return EXCEEDS_AMOUNT
+            w[1] += add_amt
+            w[2] += 1
+            m[1] += add_amt
+            m[2] += 1
+        return None
+
+    def release(self, card: str, amount: float, count_amount: bool, now: float) -> None:
+        sub_amt = amount if count_amount else 0.0
+        with self.lock:
+            for size in (WEEK, MONTH):
+                b = self.buckets.get((card, size))
+                idx = _window(now, size)[0]
+                if b is None or b[0] - idx > 1:
+                    continue  # the consumed bucket has already rolled off
+                i = 1 if b[0] == idx else 3
+                b[i] = max(b[i] - sub_amt, 0.0)
+                b[i + 1] = max(b[i + 1] - 1, 0)
+
+
+# KEYS: week_cur, week_prev, month_cur, month_prev (hashes with fields a, n)
+# ARGV: amount, week_frac, month_frac, max_amt_w, max_amt_m, max_n_w, max_n_m, ttl_w, ttl_m
+_LUA_CHECK_AND_ADD = """
+local amt = tonumber(ARGV[1])
+local wf, mf = tonumber(ARGV[2]), tonumber(ARGV[3])
+local maw, mam = tonumber(ARGV[4]), tonumber(ARGV[5])
+local mnw, mnm = tonumber(ARGV[6]), tonumber(ARGV[7])
+local function get(k)
+  local v = redis.call('HMGET', k, 'a', 'n')
+  return tonumber(v[1]) or 0, tonumber(v[2]) or 0
+end
+local wa, wn = get(KEYS[1])
+local wpa, wpn = get(KEYS[2])
+local ma, mn = get(KEYS[3])
+local mpa, mpn = get(KEYS[4])
+if mnw > 0 and wpn * (1 - wf) + wn + 1 > mnw then return 2 end
+if mnm > 0 and mpn * (1 - mf) + mn + 1 > mnm then return 2 end
+if maw > 0 and wpa * (1 - wf) + wa + amt > maw then return 1 end
+if mam > 0 and mpa * (1 - mf) + ma + amt > mam then return 1 end
+redis.call('HINCRBYFLOAT', KEYS[1], 'a', amt)
+redis.call('HINCRBY', KEYS[1], 'n', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[8])
+redis.call('HINCRBYFLOAT', KEYS[3], 'a', amt)
+redis.call('HINCRBY', KEYS[3], 'n', 1)
+redis.call('EXPIRE', KEYS[3], ARGV[9])
+return 0
+"""
+
+
+# KEYS: the week and month buckets the consume incremented
+# ARGV: amount
+_LUA_RELEASE = """
+for _, k in ipairs(KEYS) do
+  if redis.call('EXISTS', k) == 1 then
+    redis.call('HINCRBYFLOAT', k, 'a', -tonumber(ARGV[1]))
+    redis.call('HINCRBY', k, 'n', -1)
+  end
+end
+return 0
+"""
+
+
+class RedisLimitBackend:
+    """
+    Multi-node backend: the check and the increment run atomically in one
+    Lua call (one round trip per transfer).
+    """
+
+    def __init__(self, client, prefix: str = "fransa:limits"):
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(_LUA_CHECK_AND_ADD)
+        self.release_script = client.register_script(_LUA_RELEASE)
+
+    def check_and_add(self, card: str, amount: float, count_amount: bool,
+                      max_amt_w: float, max_amt_m: float, max_n_w: int, max_n_m: int,
+                      now: float) -> Optional[Tuple[str, str]]:
+        wi, wf = _window(now, WEEK)
+        mi, mf = _window(now, MONTH)
+        # hash tag keeps all of a card's keys on one cluster slot
+        base = f"{self.prefix}:{{{card}}}"
+        keys = [f"{base}:w:{wi}", f"{base}:w:{wi - 1}", f"{base}:m:{mi}", f"{base}:m:{mi - 1}"]
+        args = [amount if count_amount else 0.0, wf, mf, max_amt_w, max_amt_m, max_n_w, max_n_m,
+                2 * WEEK, 2 * MONTH]
+        rc = int(self.script(keys=keys, args=args))
+        if rc == 1:
+            return EXCEEDS_AMOUNT
+        if rc == 2:
+            return EXCEEDS_COUNT
+        return None
+
+    def release(self, card: str, amount: float, count_amount: bool, now: float) -> None:
+        base = f"{self.prefix}:{{{card}}}"
+        keys = [f"{base}:w:{_window(now, WEEK)[0]}", f"{base}:m:{_window(now, MONTH)[0]}"]
+        self.release_script(keys=keys, args=[amount if count_amount else 0.0])
+
+
+class LimitEngine:
+    """
+    Enforces a card's limit profile before a transfer is debited.
+    Profiles are cached in-process so the check never waits on Mongo.
+    """
+
+    def __init__(self, backend, load_profile: Callable[[str], Optional[Dict[str, Any]]]):
+        self.backend = backend
+        self.load_profile = load_profile
+        self.profiles: Dict[str, Tuple[float, Optional[tuple]]] = {}
+
+    def _profile(self, name: str, now: float) -> Optional[tuple]:
+        hit = self.profiles.get(name)
+        if hit is not None and now - hit[0] < PROFILE_TTL:
+            return hit[1]
+        doc = self.load_profile(name)
+        limits = _limits(doc) if doc else None
+        self.profiles[name] = (now, limits)
+        return limits
+
+    def _windowed(self, card: Dict[str, Any], currency: str, now: float) -> Optional[tuple]:
+        limits = self._profile(card.get("limitProfile", ""), now)
+        if limits is None:
+            return None
+        amt_w, amt_m, n_w, n_m, per_txn, txn_cur = limits
+        same_cur = not txn_cur or txn_cur == currency
+        if not same_cur:
+            amt_w = amt_m = 0.0
+        return amt_w, amt_m, n_w, n_m, per_txn, same_cur
+
+    def check_and_consume(self, card: Dict[str, Any], amount: float, currency: str,
+                          now: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        """
+        Returns None if the transfer fits, otherwise (responseCode, description).
+        Counters are only incremented when the transfer is allowed; if the
+        debit then fails, release() with the same `now` gives them back.
+        Amount limits apply in the profile's txnCurrency; count limits always apply.
+        """
+        now = time.time() if now is None else now
+        limits = self._windowed(card, currency, now)
+        if limits is None:
+            return None
+        amt_w, amt_m, n_w, n_m, per_txn, same_cur = limits
+        if per_txn and same_cur and amount > per_txn:
+            return EXCEEDS_AMOUNT
+        if not (amt_w or amt_m or n_w or n_m):
+            return None
+        return self.backend.check_and_add(
+            card["cardToken"], amount, same_cur, amt_w, amt_m, n_w, n_m, now
+        )
+
+    def release(self, card: Dict[str, Any], amount: float, currency: str, now: float) -> None:
+        """
+        Undoes a successful check_and_consume(card, amount, currency, now).
+        """
+        limits = self._windowed(card, currency, now)
+        if limits is None:
+            return
+        amt_w, amt_m, n_w, n_m, _, same_cur = limits
+        if amt_w or amt_m or n_w or n_m:
+            self.backend.release(card["cardToken"], amount, same_cur, now)
+
+
+def build_engine(load_profile: Callable[[str], Optional[Dict[str, Any]]]) -> LimitEngine:
+    """
+    LIMITS_BACKEND=redis uses REDIS_URL; anything else keeps counters in memory.
+    """
+    if os.getenv("LIMITS_BACKEND", "memory").lower() == "redis":
+        import redis
+
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return LimitEngine(RedisLimitBackend(client), load_profile)
+    return LimitEngine(InMemoryLimitBackend(), load_profile)
+
+
+if __name__ == "__main__":
+    # python -m mcp_2.limits [memory|redis]  -> per-check latency (consume + release)
+    # redis uses REDIS_URL; REDIS_URL=fakeredis:// runs the Lua in-process (needs lupa)
+    import sys
+
+    which = sys.argv[1] if len(sys.argv) > 1 else "memory"
+    if which == "redis":
+        url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        if url.startswith("fakeredis://"):
+            import fakeredis
+
+            client = fakeredis.FakeRedis()
+        else:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        backend = RedisLimitBackend(client, prefix="fransa:limits:bench")
+        n = 20_000
+    else:
+        backend = InMemoryLimitBackend()
+        n = 200_000
+    profile = {"limitProfile": "BENCH", "amountWeekly": 1e12, "amountMonthly": 1e12,
+               "txnNumberWeek": 10**9, "txnNumberMonth": 10**9,
+               "transactionAccountLimit": 10000, "txnCurrency": "840"}
+    engine = LimitEngine(backend, lambda name: profile)
+    cards = [{"cardToken": f"?A{i:014X}", "limitProfile": "BENCH"} for i in range(1000)]
+    lat = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        engine.check_and_consume(cards[i % 1000], 12.5, "840")
+        lat.append(time.perf_counter() - t)
+    dt = time.perf_counter() - t0
+    lat.sort()
+    print(f"{which}: {dt / n * 1e6:.2f} us per limits check ({n / dt:,.0f} checks/sec), "
+          f"p50={lat[n // 2] * 1e6:.1f}us p99={lat[int(n * 0.99)] * 1e6:.1f}us")
+    t0 = time.perf_counter()
+    for i in range(n):
+        engine.release(cards[i % 1000], 12.5, "840", time.time())
+    print(f"{which}: {(time.perf_counter() - t0) / n * 1e6:.2f} us per release")
@@ -0,0 +1,93 @@
+import functools
+import os
+from typing import Any, Callable, Dict, Optional
+
+import pymongo
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, PyMongoError, WTimeoutError
+
+import metrics
+import resilience
+
+# Deadline + circuit breaker around every MCP tool's Mongo work.
+#
+# Each tool call runs under pymongo.timeout(): MONGO_TIMEOUT_MS, cut to what
+# is left of the calling turn's budget when the tool runs inside a graph
+# turn. Connection failures and timeouts count against the "mongo" breaker.
+# While it is open, tools answer UNAVAILABLE at once instead of queueing
+# behind a primary election. Business errors (ValueError, ...) propagate as
+# before and say nothing about Mongo's health.
+#
+# hedged_find_one() is for idempotent single-document reads. If the primary
+# read has not answered after MONGO_HEDGE_MS (0 = off), it reissues the read
+# with read preference "nearest".
+
+MONGO_TIMEOUT_MS = float(os.getenv("MONGO_TIMEOUT_MS", "3000"))
+MONGO_HEDGE_MS = float(os.getenv("MONGO_HEDGE_MS", "0"))
+
+UNAVAILABLE = {"responseCode": "503", "responseDescription": "Card service unavailable, retry later"}
+TIMED_OUT = {"responseCode": "504", "responseDescription": "Card service timed out, retry later"}
+
+
+def client_options() -> Dict[str, Any]:
+    """
+    MongoClient timeouts; the defaults (none / 20-30 s) let one stuck call hang a conversation.
+    """
+    return {
+        "timeoutMS": int(MONGO_TIMEOUT_MS),
+        "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "2000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", str(int(MONGO_TIMEOUT_MS)))),
+    }
+
+
+def _timed_out(e: BaseException) -> bool:
+    return (isinstance(e, (ExecutionTimeout, WTimeoutError, resilience.DeadlineExceeded))
+            or (isinstance(e, PyMongoError) and e.timeout))
+
+
+def _is_outage(e: BaseException) -> bool:
+    return _timed_out(e) or isinstance(e, ConnectionFailure)
+
+
+breaker = resilience.get_breaker("mongo", is_failure=_is_outage)
+
+
+def guarded(tool: str) -> Callable[[Callable], Callable]:
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                budget = resilience.remaining(MONGO_TIMEOUT_MS / 1000)
+            except resilience.DeadlineExceeded:
+                metrics.incr("mongo.degraded", tool=tool, reason="deadline")
+                return dict(TIMED_OUT)
+            if not breaker.allow():
+                metrics.incr("mongo.degraded", tool=tool, reason="breaker")
+                return dict(UNAVAILABLE)
+            try:
+                with pymongo.timeout(budget):
+                    out = fn(*args, **kwargs)
+            except Exception as e:
+                breaker.record(e)
+                if not _is_outage(e):
+                    raise
+                metrics.incr("mongo.degraded", tool=tool, reason=type(e).__name__)
+                print(f"[mongo] {tool} failed fast: {e!r}")
+                return dict(TIMED_OUT if _timed_out(e) else UNAVAILABLE)
+            breaker.success()
+            return out
+
+        return wrapper
+    return deco
+
+
+def hedged_find_one(collection, filter: Dict[str, Any], projection: Optional[Dict[str, Any]] = None,
+                    hedge_after_ms: float = MONGO_HEDGE_MS) -> Optional[Dict[str, Any]]:
+    if not hedge_after_ms:
+        return collection.find_one(filter, projection)
+    nearest = collection.with_options(read_preference=pymongo.ReadPreference.NEAREST)
+    return resilience.run(
+        lambda: collection.find_one(filter, projection),
+        resilience.remaining(MONGO_TIMEOUT_MS / 1000),
+        hedge=lambda: nearest.find_one(filter, projection),
+        hedge_after=hedge_after_ms / 1000,
+    )
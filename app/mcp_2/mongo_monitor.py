@@ -0,0 +1,157 @@
+import functools
+import json
+import os
+import threading
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+import bson
+from pymongo import monitoring
+
+import metrics
+import profiling
+
+# Per-tool MongoDB accounting. Every command is attributed to the MCP tool
+# running in the current context (set by attributed()); commands outside a
+# tool (startup, background jobs) are booked under "-".
+#
+#   mongo.commands{cmd,tool}      count
+#   mongo.ms{cmd,tool}            server round-trip time
+#   mongo.reply_bytes{tool}       BSON size of replies (MONGO_REPLY_BYTES=1 or profiled turns)
+#   mongo.round_trips{tool}       commands per tool call
+#   mongo.slow{cmd,tool}          commands over MONGO_SLOW_MS (also logged with their filter shape)
+#   mongo.over_budget{tool}       tool calls over their round-trip budget (N+1 suspects)
+#
+# Reply size is off by default: the event carries the decoded reply, not its
+# wire size, and re-encoding every reply costs about as much as decoding it.
+#
+# Budgets are measured commands per call with a cold card cache, plus one
+# for headroom. Writes are 3-7 (a transfer: card, client, limits, balance
+# moves, history, outbox event, commitTransaction), hence the default;
+# read-only tools get their own tighter budget. MONGO_ROUND_TRIP_BUDGET
+# replaces the default and MONGO_ROUND_TRIP_BUDGETS (JSON) overrides single
+# tools, e.g. {"transferFundsFromAccount": 6}.
+
+MONGO_SLOW_MS = float(os.getenv("MONGO_SLOW_MS", "100"))
+MONGO_REPLY_BYTES = os.getenv("MONGO_REPLY_BYTES", "0") == "1"
+ROUND_TRIP_BUDGET = int(os.getenv("MONGO_ROUND_TRIP_BUDGET", "8"))
+ROUND_TRIP_BUDGETS: Dict[str, int] = {
+    "listClientCards": 3,
+    "retrieveCardDetails": 2,
+    "retrieveCvv2": 2,
+    "getTransactionsHistory": 3,
+    "getSpendingSummary": 3,
+    "getLimitDetails": 2,
+    "getLimitProfile": 3,
+    "exportStatement": 5,
+    **json.loads(os.getenv("MONGO_ROUND_TRIP_BUDGETS", "{}")),
+}
+
+# where each command keeps its filter
+_FILTER_FIELDS = {
+    "find": ("filter",),
+    "findAndModify": ("query",),
+    "count": ("query",),
+    "distinct": ("query",),
+    "update": ("updates", 0, "q"),
+    "delete": ("deletes", 0, "q"),
+    "aggregate": ("pipeline", 0, "$match"),
+}
+
+
+class _ToolCall:
+    __slots__ = ("tool", "round_trips")
+
+    def __init__(self, tool: str):
+        self.tool = tool
+        self.round_trips = 0
+
+
+_current: ContextVar[Optional[_ToolCall]] = ContextVar("mongo_tool_call", default=None)
+
+
+def shape(value: Any) -> Any:
+    """
+    Filter with the values blanked out: {"cardToken": "?", "amount": {"$gt": "?"}}.
+    """
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [shape(v) for v in value[:1]]
+    return "?"
+
+
+def filter_shape(command_name: str, command: Dict[str, Any]) -> Any:
+    node: Any = command
+    for step in _FILTER_FIELDS.get(command_name, ()):
+        try:
+            node = node[step]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return shape(node) if node is not command else None
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Register with MongoClient(event_listeners=[CommandMonitor()]).
+    Listener callbacks run on the thread issuing the command, so the
+    current tool is read from the context.
+    """
+
+    def __init__(self, slow_ms: float = MONGO_SLOW_MS):
+        self.slow_ms = slow_ms
+        self.lock = threading.Lock()
+        # (connection, request_id) -> (tool, command) while in flight
+        self.inflight: Dict[Any, tuple] = {}
+
+    def started(self, event) -> None:
+        call = _current.get()
+        if call is not None:
+            call.round_trips += 1
+        with self.lock:
+            self.inflight[(event.connection_id, event.request_id)] = (call.tool if call else "-", event.command)
+
+    def _finish(self, event, reply: Optional[Dict[str, Any]]) -> None:
+        with self.lock:
+            tool, command = self.inflight.pop((event.connection_id, event.request_id), ("-", None))
+        cmd = event.command_name
+        ms = event.duration_micros / 1000
+        metrics.incr("mongo.commands", tool=tool, cmd=cmd)
+        metrics.observe("mongo.ms", ms, tool=tool, cmd=cmd)
+        if reply is not None and (MONGO_REPLY_BYTES or profiling.active()):
+            metrics.observe("mongo.reply_bytes", len(bson.encode(reply)), tool=tool)
+        if ms >= self.slow_ms:
+            metrics.incr("mongo.slow", tool=tool, cmd=cmd)
+            coll = command.get(cmd) if command else None
+            print(f"[mongo] slow {cmd} on {coll} ({ms:.1f} ms, tool {tool}): "
+                  f"{json.dumps(filter_shape(cmd, command or {}), default=str)}")
+
+    def succeeded(self, event) -> None:
+        self._finish(event, event.reply)
+
+    def failed(self, event) -> None:
+        self._finish(event, None)
+
+
+def attributed(tool: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator for a tool handler: books its Mongo commands under `tool` and
+    checks the per-call round-trip budget.
+    """
+    budget = ROUND_TRIP_BUDGETS.get(tool, ROUND_TRIP_BUDGET)
+
+    def deco(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            call = _ToolCall(tool)
+            token = _current.set(call)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current.reset(token)
+                metrics.observe("mongo.round_trips", call.round_trips, tool=tool)
+                if budget and call.round_trips > budget:
+                    metrics.incr("mongo.over_budget", tool=tool)
+                    print(f"[mongo] {tool} made {call.round_trips} round trips (budget {budget})")
+        return wrapper
+    return deco
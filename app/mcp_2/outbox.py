@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+
+# Transactional outbox for card mutations.
+#
+# Mutating tools insert one compact record per change into the `outbox`
+# collection, in the same Mongo transaction as the change (see
+# OUTBOX_TRANSACTIONS in fransa_mcp). Every record starts with p=False. A
+# publisher reads the unpublished records in _id order, hands them to a sink
+# in batches, then sets p=True on the batch. Delivery is at-least-once: a
+# crash between publish and the update re-sends the batch. Consumers dedupe
+# on the event "id".
+#
+# The flag, not an _id watermark, is what marks progress. An event whose
+# transaction commits long after its ObjectId was generated (slow commit,
+# retry, paused worker) is still picked up; it is just delivered out of
+# _id order.
+#
+# Retention runs from the publish time ("pts"), and only published events
+# expire: an event stuck while the publisher or the sink is down is kept
+# until it has been delivered.
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
+
+def make_event(kind: str, cardToken: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {
+        "_id": ObjectId(),
+        "t": kind,
+        "k": cardToken,
+        "d": data or {},
+        "ts": datetime.now(timezone.utc),
+        "p": False,
+    }
+
+
+def ensure_indexes(outbox) -> None:
+    outbox.create_index("pts", expireAfterSeconds=RETENTION_DAYS * 86400,
+                        partialFilterExpression={"p": True})
+    # only unpublished events are indexed, so the publisher's scan stays small
+    outbox.create_index([("p", 1), ("_id", 1)], name="unpublished", partialFilterExpression={"p": False})
+
+
+def _wire(ev: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": str(ev["_id"]),
+        "type": ev["t"],
+        "cardToken": ev["k"],
+        "data": ev.get("d", {}),
+        "ts": ev["ts"].isoformat(),
+    }
+
+
+# ---------- sinks ----------
+
+class CallbackSink:
+    def __init__(self, fn: Callable[[List[Dict[str, Any]]], None]):
+        self.fn = fn
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        self.fn(events)
+
+
+class FileSink:
+    """
+    Appends NDJSON; fsyncs once per batch.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, separators=(",", ":")) + "\n" for e in events))
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class RedisStreamSink:
+    """
+    XADDs every event of a batch in one pipelined round trip.
+    """
+
+    def __init__(self, client, stream: str = "fransa:card-events", maxlen: int = 100_000):
+        self.client = client
+        self.stream = stream
+        self.maxlen = maxlen
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for e in events:
+            pipe.xadd(self.stream, {"event": json.dumps(e, separators=(",", ":"))},
+                      maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+
+# ---------- publisher ----------
+
+class OutboxPublisher:
+    def __init__(self, outbox, sink, name: str = "default", batch_size: int = BATCH_SIZE):
+        self.outbox = outbox
+        self.sink = sink
+        self.name = name
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> int:
+        """
+        Publish one batch; returns the number of events delivered.
+        """
+        batch = list(self.outbox.find({"p": False}).sort("_id", 1).limit(self.batch_size))
+        if not batch:
+            return 0
+        self.sink.publish([_wire(e) for e in batch])
+        self.outbox.update_many({"_id": {"$in": [e["_id"] for e in batch]}},
+                                {"$set": {"p": True, "pts": datetime.now(timezone.utc)}})
+        return len(batch)
+
+    def run_forever(self, poll: float = POLL_SECONDS) -> None:
+        while not self._stop.is_set():
+            try:
+                n = self.run_once()
+            except Exception as e:  # sink or Mongo down: events stay unpublished, retry
+                print(f"[outbox:{self.name}] publish failed: {e}")
+                n = 0
+            # drain back-to-back while there is a backlog
+            if n < self.batch_size:
+                self._stop.wait(poll)
+
+    def start(self) -> "OutboxPublisher":
+        self._thread = threading.Thread(target=self.run_forever, name=f"outbox-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def build_sink(spec: str):
+    """
+    file:<path> | redis[:<stream>]
+    """
+    kind, _, arg = spec.partition(":")
+    if kind == "file":
+        return FileSink(arg or "card-events.ndjson")
+    if kind == "redis":
+        import redis
+
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisStreamSink(client, arg or "fransa:card-events")
+    raise ValueError(f"unknown outbox sink: {spec}")
+
+
+if __name__ == "__main__":
+    # python -m mcp_2.outbox file:/var/log/card-events.ndjson
+    # python -m mcp_2.outbox redis:fransa:card-events
+    import sys
+    from mcp_2.fransa_mcp import outbox
+
+    spec = sys.argv[1] if len(sys.argv) > 1 else os.getenv("OUTBOX_SINK", "file:card-events.ndjson")
+    ensure_indexes(outbox)
+    pub = OutboxPublisher(outbox, build_sink(spec), name=spec)
+    print(f"Publishing outbox to {spec}")
+    try:
+        pub.run_forever()
+    except KeyboardInterrupt:
+        pass
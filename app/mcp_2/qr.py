@@ -0,0 +1,87 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+# QR cash withdrawals, one document per request in `qr_withdrawals`:
+#   _id:       transactionId (the default _id index serves redemption lookups)
+#   amount, currency, mobile, channelId
+#   createdAt, expiresAt (datetime; TTL index removes the document after expiresAt)
+#   status:    "issued" | "redeemed", plus redeemedAt / redeemChannel
+#
+# The TTL monitor only runs about once a minute, so redeem() also checks
+# expiresAt itself; expiry is exact, cleanup is eventual.
+
+QR_TTL_SECONDS = int(os.getenv("QR_TTL_SECONDS", "300"))
+
+INVALID = ("014", "Invalid QR code")
+DUPLICATE = ("094", "Duplicate transaction")
+NOT_FOUND = ("025", "QR code not found")
+EXPIRED = ("054", "QR code expired")
+ALREADY_REDEEMED = ("094", "QR code already redeemed")
+MISMATCH = ("014", "QR code does not match the withdrawal request")
+
+
+def ensure_indexes(qr_withdrawals) -> None:
+    qr_withdrawals.create_index("expiresAt", expireAfterSeconds=0)
+
+
+def issue(qr_withdrawals, transactionId: str, amount: str, currency: str, mobile: str,
+          channelId: str, now: Optional[datetime] = None) -> Optional[Tuple[str, str]]:
+    """
+    Store a new withdrawal; returns an error (code, description) if the
+    transactionId was already used.
+    """
+    now = now or datetime.now(timezone.utc)
+    try:
+        qr_withdrawals.insert_one({
+            "_id": transactionId,
+            "amount": amount,
+            "currency": currency,
+            "mobile": mobile,
+            "channelId": channelId,
+            "createdAt": now,
+            "expiresAt": now + timedelta(seconds=QR_TTL_SECONDS),
+            "status": "issued",
+        })
+    except DuplicateKeyError:
+        return DUPLICATE
+    return None
+
+
+def redeem(qr_withdrawals, transactionId: str, amount: str, currency: str, mobile: str,
+           channelId: str, now: Optional[datetime] = None) -> Tuple[Optional[Tuple[str, str]], Optional[Dict[str, Any]]]:
+    """
+    Consume a QR code exactly once. The status flip is a single conditional
+    update, so of two concurrent redemptions only one gets the document.
+    Returns (error, None) or (None, withdrawal).
+    """
+    now = now or datetime.now(timezone.utc)
+    doc = qr_withdrawals.find_one_and_update(
+        {
+            "_id": transactionId, "status": "issued", "expiresAt": {"$gt": now},
+            "amount": amount, "currency": currency, "mobile": mobile,
+        },
+        {"$set": {"status": "redeemed", "redeemedAt": now, "redeemChannel": channelId}},
+    )
+    if doc is not None:
+        return None, doc
+    # lost: explain why (one extra read, only on the failure path)
+    current = qr_withdrawals.find_one({"_id": transactionId})
+    if current is None:
+        return NOT_FOUND, None
+    if current.get("status") == "redeemed":
+        return ALREADY_REDEEMED, None
+    if (current.get("amount"), current.get("currency"), current.get("mobile")) != (amount, currency, mobile):
+        return MISMATCH, None
+    return EXPIRED, None
+
+
+if __name__ == "__main__":
+    # python -m mcp_2.qr   -> create the TTL index and drop the legacy per-user arrays
+    from mcp_2.fransa_mcp import qr_withdrawals, users
+
+    ensure_indexes(qr_withdrawals)
+    res = users.update_many({"qr_withdrawals": {"$exists": True}}, {"$unset": {"qr_withdrawals": ""}})
+    print(f"TTL index ready; removed qr_withdrawals from {res.modified_count} user documents")
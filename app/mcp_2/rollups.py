@@ -0,0 +1,208 @@
+from datetime import date, timedelta
+from typing import Any, Dict, List, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# Per-card spending rollups, one document per (card, day) and (card, month):
+#   _id:    "<cardToken>|D|yyyymmdd"  or  "<cardToken>|M|yyyymm"
+#   totals: {<transactionType>: {<currency>: {"amount": float, "count": int}}}
+#   types:  {<transactionType>: <transactionTypeDescription>}
+# The _id layout makes every range query a prefix scan on the default _id index.
+
+
+def _rid(cardToken: str, period: str, key: str) -> str:
+    return f"{cardToken}|{period}|{key}"
+
+
+def _day_key(ddmmyyyy: str) -> str:
+    return ddmmyyyy[4:8] + ddmmyyyy[2:4] + ddmmyyyy[0:2]
+
+
+def _txn_ops(cardToken: str, txn: Dict[str, Any]) -> List[UpdateOne]:
+    day = _day_key(txn["date"])
+    ttype = str(txn.get("transactionType", ""))
+    cur = str(txn.get("currency", ""))
+    inc = {
+        f"totals.{ttype}.{cur}.amount": float(txn.get("transactionAmount", 0.0)),
+        f"totals.{ttype}.{cur}.count": 1,
+    }
+    ops = []
+    for period, key in (("D", day), ("M", day[:6])):
+        ops.append(UpdateOne(
+            {"_id": _rid(cardToken, period, key)},
+            {
+                "$inc": inc,
+                "$set": {
+                    "cardToken": cardToken, "period": period, "key": key,
+                    f"types.{ttype}": txn.get("transactionTypeDescription", ""),
+                },
+            },
+            upsert=True,
+        ))
+    return ops
+
+
+def record_txn(rollups, cardToken: str, txn: Dict[str, Any], session=None) -> None:
+    """
+    Fold one transaction into its daily and monthly rollups (single round trip).
+    """
+    rollups.bulk_write(_txn_ops(cardToken, txn), ordered=False, session=session)
+
+
+def _merge(out: Dict[str, Dict[str, Dict[str, float]]], types: Dict[str, str], doc: Dict[str, Any]) -> None:
+    types.update(doc.get("types", {}))
+    for ttype, by_cur in doc.get("totals", {}).items():
+        for cur, agg in by_cur.items():
+            slot = out.setdefault(ttype, {}).setdefault(cur, {"amount": 0.0, "count": 0})
+            slot["amount"] += agg.get("amount", 0.0)
+            slot["count"] += agg.get("count", 0)
+
+
+def _ranges(start: date, end: date) -> Tuple[List[Tuple[str, str, str]], int]:
+    """
+    Split [start, end] into id ranges: whole months go to monthly docs,
+    partial edge months to daily docs. Returns (ranges, months_covered).
+    """
+    ranges = []
+    months = 0
+    cur = start.replace(day=1)
+    while cur <= end:
+        nxt = (cur + timedelta(days=32)).replace(day=1)
+        last = nxt - timedelta(days=1)
+        lo, hi = max(cur, start), min(last, end)
+        if lo == cur and hi == last:
+            key = cur.strftime("%Y%m")
+            if ranges and ranges[-1][0] == "M":
+                # consecutive whole months collapse into one _id range
+                ranges[-1] = ("M", ranges[-1][1], key)
+            else:
+                ranges.append(("M", key, key))
+        else:
+            ranges.append(("D", lo.strftime("%Y%m%d"), hi.strftime("%Y%m%d")))
+        months += 1
+        cur = nxt
+    return ranges, months
+
+
+def summarize(rollups, cardToken: str, start: date, end: date) -> Dict[str, Any]:
+    """
+    Totals per transactionType and currency over [start, end]. Reads at most
+    one monthly doc per whole month plus the daily docs of the two edge months.
+    """
+    ranges, months = _ranges(start, end)
+    clauses = [
+        {"_id": {"$gte": _rid(cardToken, p, lo), "$lte": _rid(cardToken, p, hi)}}
+        for p, lo, hi in ranges
+    ]
+    totals: Dict[str, Dict[str, Dict[str, float]]] = {}
+    types: Dict[str, str] = {}
+    if clauses:
+        for doc in rollups.find({"$or": clauses}, {"totals": 1, "types": 1}):
+            _merge(totals, types, doc)
+    return {"months": months, "totals": totals, "types": types}
+
+
+# ---------- rebuild ----------
+
+def _rebuild_pipeline(cardToken: str = "") -> List[Dict[str, Any]]:
+    match = {"cardToken": cardToken} if cardToken else {}
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "cardToken": 1, "transactions": 1}},
+        {"$unwind": "$transactions"},
+        {"$project": {
+            "cardToken": 1,
+            "day": {"$concat": [
+                {"$substrBytes": ["$transactions.date", 4, 4]},
+                {"$substrBytes": ["$transactions.date", 2, 2]},
+                {"$substrBytes": ["$transactions.date", 0, 2]},
+            ]},
+            "ttype": {"$toString": "$transactions.transactionType"},
+            "currency": {"$toString": "$transactions.currency"},
+            "desc": "$transactions.transactionTypeDescription",
+            "amount": {"$convert": {"input": "$transactions.transactionAmount", "to": "double", "onError": 0.0, "onNull": 0.0}},
+        }},
+        {"$group": {
+            "_id": {"card": "$cardToken", "day": "$day", "ttype": "$ttype", "currency": "$currency"},
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "desc": {"$last": "$desc"},
+        }},
+    ]
+
+
+def _rollup_stages(stamp: str) -> List[Dict[str, Any]]:
+    """
+    Folds the (card, day, type, currency) groups into finished rollup docs on
+    the server: one row per day and per month, nested into totals/types.
+    """
+    k = "$_id"
+    return [
+        {"$project": {
+            "_id": 0, "card": "$_id.card", "ttype": "$_id.ttype", "currency": "$_id.currency",
+            "amount": 1, "count": 1, "desc": 1,
+            "periods": [
+                {"period": "D", "key": "$_id.day"},
+                {"period": "M", "key": {"$substrBytes": ["$_id.day", 0, 6]}},
+            ],
+        }},
+        {"$unwind": "$periods"},
+        {"$group": {
+            "_id": {"card": "$card", "period": "$periods.period", "key": "$periods.key",
+                    "ttype": "$ttype", "currency": "$currency"},
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": "$count"},
+            "desc": {"$last": "$desc"},
+        }},
+        {"$group": {
+            "_id": {"card": f"{k}.card", "period": f"{k}.period", "key": f"{k}.key", "ttype": f"{k}.ttype"},
+            "currencies": {"$push": {"k": f"{k}.currency", "v": {"amount": "$amount", "count": "$count"}}},
+            "desc": {"$last": "$desc"},
+        }},
+        {"$group": {
+            "_id": {"card": f"{k}.card", "period": f"{k}.period", "key": f"{k}.key"},
+            "totals": {"$push": {"k": f"{k}.ttype", "v": {"$arrayToObject": "$currencies"}}},
+            "types": {"$push": {"k": f"{k}.ttype", "v": {"$ifNull": ["$desc", ""]}}},
+        }},
+        {"$project": {
+            "_id": {"$concat": [f"{k}.card", "|", f"{k}.period", "|", f"{k}.key"]},
+            "cardToken": f"{k}.card", "period": f"{k}.period", "key": f"{k}.key",
+            "totals": {"$arrayToObject": "$totals"},
+            "types": {"$arrayToObject": "$types"},
+            "rebuild": stamp,
+        }},
+    ]
+
+
+def rebuild(cards, rollups, cardToken: str = "") -> int:
+    """
+    Recompute rollups from the raw card transactions (all cards, or one).
+
+    Runs entirely on the server: the aggregation $merges finished docs into
+    the live collection, replacing each rollup in place, so readers never see
+    it empty and nothing is held in memory here. Docs the run did not write
+    (cards or periods with no transactions left) are deleted afterwards.
+    A transaction recorded for a card while that card is being rebuilt can
+    still be overwritten by its replaced rollup; rebuild the card again once
+    it is quiet.
+    """
+    stamp = ObjectId()
+    pipeline = _rebuild_pipeline(cardToken) + _rollup_stages(str(stamp)) + [
+        {"$merge": {"into": rollups.name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    cards.aggregate(pipeline, allowDiskUse=True)
+    scope = {"cardToken": cardToken} if cardToken else {}
+    rollups.delete_many({**scope, "rebuild": {"$ne": str(stamp)}})
+    return rollups.count_documents(scope)
+
+
+if __name__ == "__main__":
+    # python -m mcp_2.rollups rebuild [cardToken]
+    import sys
+    from mcp_2.fransa_mcp import cards, spending_rollups
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        sys.exit("usage: python -m mcp_2.rollups rebuild [cardToken]")
+    n = rebuild(cards, spending_rollups, sys.argv[2] if len(sys.argv) > 2 else "")
+    print(f"Rebuilt {n} rollup documents")
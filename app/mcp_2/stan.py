@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+# STAN / reference numbers are 12 decimal digits.
+STAN_SPACE = 10**12
+DEFAULT_BLOCK = int(os.getenv("STAN_BLOCK_SIZE", "10000"))
+
+
+class MongoBlockLease:
+    """
+    Lease blocks of sequence numbers from a shared Mongo counter document.
+    One round trip per block, so the per-call path never touches the network.
+    """
+
+    def __init__(self, collection, key: str = "stan"):
+        self.collection = collection
+        self.key = key
+
+    def __call__(self, size: int) -> int:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        while True:
+            try:
+                doc = self.collection.find_one_and_update(
+                    {"_id": self.key},
+                    {"$inc": {"seq": size}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                return int(doc["seq"]) - size
+            except DuplicateKeyError:
+                # two first-ever leases raced to insert the counter; the loser
+                # retries and finds the document to $inc
+                continue
+
+
+class RedisBlockLease:
+    """
+    Same as MongoBlockLease but backed by an atomic Redis INCRBY.
+    """
+
+    def __init__(self, client, key: str = "fransa:stan"):
+        self.client = client
+        self.key = key
+
+    def __call__(self, size: int) -> int:
+        return int(self.client.incrby(self.key, size)) - size
+
+
+class LocalBlockLease:
+    """
+    No shared store: 2-digit node id + 10-digit sequence seeded from the clock
+    (microseconds). Only unique if every process has its own STAN_NODE_ID and
+    does not issue more than one id per microsecond on average since startup.
+
+    The 10-digit sequence is ~2.8 h of that clock. A process started a
+    multiple of ~2.8 h after another one on the same node id lands on the
+    same numbers, so uniqueness only holds inside that window. A single
+    process refuses to wrap onto ids it already issued.
+    """
+
+    SPACE = 10**10
+
+    def __init__(self, node_id: int):
+        if not 0 <= node_id < 100:
+            raise ValueError("STAN node id must be 0-99")
+        self.prefix = node_id * self.SPACE
+        self.next = time.time_ns() // 1000 % self.SPACE
+        self.left = self.SPACE
+        self.lock = threading.Lock()
+
+    def __call__(self, size: int) -> int:
+        with self.lock:
+            start = self.next
+            # a block must not run into the next node id's range
+            skip = self.SPACE - start if start + size > self.SPACE else 0
+            if skip + size > self.left:
+                raise RuntimeError("local STAN sequence exhausted; use STAN_BACKEND=mongo or redis")
+            start = (start + skip) % self.SPACE
+            self.next = start + size
+            self.left -= skip + size
+        return self.prefix + start
+
+
+class StanAllocator:
+    """
+    Hands out 12-digit STANs from leased blocks. The current block is a map
+    of preformatted strings over a range, so the hot path is one C-level
+    next() (atomic under the GIL); only a refill takes the lock and calls
+    the lease function.
+    """
+
+    __slots__ = ("lease", "block_size", "lock", "ids")
+
+    def __init__(self, lease: Callable[[int], int], block_size: int = DEFAULT_BLOCK):
+        if block_size <= 0:
+            raise ValueError("block_size must be positive")
+        self.lease = lease
+        self.block_size = block_size
+        self.lock = threading.Lock()
+        self.ids = iter(())
+
+    def _refill(self, stale) -> None:
+        with self.lock:
+            if self.ids is not stale:
+                return  # another thread already refilled
+            start = self.lease(self.block_size) % STAN_SPACE
+            # never let a block straddle the wrap point
+            end = min(start + self.block_size, STAN_SPACE)
+            self.ids = map("%012d".__mod__, range(start, end))
+
+    def __call__(self) -> str:
+        while True:
+            ids = self.ids
+            for stan in ids:
+                return stan
+            self._refill(ids)
+
+
+def build_allocator(db=None, redis_client=None) -> StanAllocator:
+    """
+    Pick the lease backend from STAN_BACKEND (mongo | redis | local).
+    """
+    backend = os.getenv("STAN_BACKEND", "mongo").lower()
+    if backend == "mongo" and db is not None:
+        return StanAllocator(MongoBlockLease(db["counters"]))
+    if backend == "redis":
+        if redis_client is None:
+            import redis
+
+            redis_client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return StanAllocator(RedisBlockLease(redis_client))
+    return StanAllocator(LocalBlockLease(int(os.getenv("STAN_NODE_ID", "0"))))
+
+
+# ---------- benchmark / cross-process stress test ----------
+# python -m mcp_2.stan bench
+# STAN_BACKEND=mongo|redis|local python -m mcp_2.stan stress [workers] [ids_per_worker]
+#
+# The stress test runs the real lease for STAN_BACKEND, with every worker's
+# allocator on the same node (one counter, or one STAN_NODE_ID), which is the
+# case block leases exist for. Against a server (MONGO_URI=mongodb://...,
+# REDIS_URL=redis://...) every worker is a separate process with its own
+# client. The in-process stand-ins (MONGO_URI=mongomock://,
+# REDIS_URL=fakeredis://) cannot be shared across processes, so there the
+# workers are threads on one client. The local lease is per process by
+# design (one STAN_NODE_ID per process), so its workers are threads sharing
+# one LocalBlockLease.
+
+def _stress_in_process(backend: str) -> bool:
+    if backend == "mongo":
+        return os.getenv("MONGO_URI", "mongodb://localhost:27017").startswith("mongomock://")
+    if backend == "redis":
+        return os.getenv("REDIS_URL", "redis://localhost:6379/0").startswith("fakeredis://")
+    return True
+
+
+def _stress_lease(backend: str, key: str, shared=None) -> Callable[[int], int]:
+    if backend == "mongo":
+        if shared is None:
+            from pymongo import MongoClient
+
+            shared = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+        return MongoBlockLease(shared[os.getenv("MONGO_DB", "fransa_demo")]["counters"], key)
+    if backend == "redis":
+        if shared is None:
+            import redis
+
+            shared = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisBlockLease(shared, "fransa:" + key)
+    return shared
+
+
+def _serialized(lease: Callable[[int], int], lock: threading.Lock) -> Callable[[int], int]:
+    def call(size: int) -> int:
+        with lock:
+            return lease(size)
+    return call
+
+
+def _stress_worker(backend: str, key: str, n: int, out, shared=None, lock=None):
+    lease = _stress_lease(backend, key, shared)
+    if lock is not None:
+        lease = _serialized(lease, lock)
+    alloc = StanAllocator(lease, block_size=1000)
+    out.put([alloc() for _ in range(n)])
+
+
+def _bench(n: int = 2_000_000, rounds: int = 3) -> float:
+    best = 0.0
+    for _ in range(rounds):
+        alloc = StanAllocator(LocalBlockLease(0))
+        t0 = time.perf_counter()
+        for _ in range(n):
+            alloc()
+        best = max(best, n / (time.perf_counter() - t0))
+    return best
+
+
+def _stress(workers: int = 8, per_worker: int = 200_000) -> Optional[str]:
+    import multiprocessing as mp
+    import queue
+    import uuid
+
+    backend = os.getenv("STAN_BACKEND", "mongo").lower()
+    key = f"stan-stress-{uuid.uuid4().hex[:8]}"  # fresh counter, leaves the real one alone
+    if _stress_in_process(backend):
+        lock = None
+        if backend == "mongo":
+            import mongomock
+
+            shared = mongomock.MongoClient()
+            # mongomock runs find_one_and_update as a find then an update; the
+            # server applies it atomically, so only the stand-in is serialized
+            lock = threading.Lock()
+        elif backend == "redis":
+            import fakeredis
+
+            shared = fakeredis.FakeRedis()
+        else:
+            shared = LocalBlockLease(int(os.getenv("STAN_NODE_ID", "0")))
+        out = queue.Queue()
+        runners = [threading.Thread(target=_stress_worker, args=(backend, key, per_worker, out, shared, lock))
+                   for _ in range(workers)]
+    else:
+        out = mp.Queue()
+        runners = [mp.Process(target=_stress_worker, args=(backend, key, per_worker, out))
+                   for _ in range(workers)]
+    for r in runners:
+        r.start()
+    seen = set()
+    total = 0
+    for _ in runners:
+        batch = out.get()
+        total += len(batch)
+        seen.update(batch)
+    for r in runners:
+        r.join()
+    kind = "threads" if isinstance(out, queue.Queue) else "processes"
+    print(f"{backend}: {total:,} STANs from {workers} {kind} on one node")
+    if total != workers * per_worker:
+        return f"expected {workers * per_worker:,} STANs, got {total:,}"
+    if len(seen) != total:
+        return f"{total - len(seen)} duplicate STANs across {workers} {kind}"
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if cmd == "bench":
+        print(f"{_bench():,.0f} STANs/sec (single thread, best of 3)")
+    elif cmd == "stress":
+        args = [int(a) for a in sys.argv[2:4]]
+        err = _stress(*args)
+        print(err or "OK: no duplicates")
+        sys.exit(1 if err else 0)
+    else:
+        sys.exit(f"unknown command: {cmd}")
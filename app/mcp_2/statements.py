@@ -0,0 +1,257 @@
+import csv
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, Optional
+
+from mcp_2 import rollups
+
+# Statement export: one pass over a card's transactions for a date range,
+# streamed from an aggregation cursor straight into a file (NDJSON or CSV).
+# Memory use does not depend on the number of rows; running balances and
+# per-currency totals are accumulated on the way through. The tool returns a
+# handle (statementId + summary); the file is read back in fixed-size parts.
+#
+# Opening balance = current availableBalance minus the net movement since
+# fromDate, taken from the spending rollups (no extra pass over the rows).
+#
+# Retention: the meta file carries an expiresAt (STATEMENT_TTL_SECONDS after
+# export); expired statements are no longer served and are deleted by
+# sweep(). sweep() also removes .tmp files left by exports that crashed
+# (older than STATEMENT_TMP_GRACE_SECONDS) and data files whose meta is gone.
+# export() runs it at most every STATEMENT_SWEEP_SECONDS.
+
+STATEMENT_DIR = os.getenv("STATEMENT_DIR", "statements")
+STATEMENT_PART_BYTES = int(os.getenv("STATEMENT_PART_BYTES", str(256 * 1024)))
+CURSOR_BATCH = int(os.getenv("STATEMENT_CURSOR_BATCH", "1000"))
+STATEMENT_TTL_SECONDS = float(os.getenv("STATEMENT_TTL_SECONDS", str(24 * 3600)))
+STATEMENT_TMP_GRACE_SECONDS = float(os.getenv("STATEMENT_TMP_GRACE_SECONDS", "3600"))
+STATEMENT_SWEEP_SECONDS = float(os.getenv("STATEMENT_SWEEP_SECONDS", "300"))
+
+# transaction types that add to the card balance; everything else is a debit
+CREDIT_TYPES = {"AC", "WC", "23"}
+
+COLUMNS = [
+    "date", "time", "transactionType", "transactionTypeDescription", "terminalLocation",
+    "referenceNumber", "currency", "debit", "credit", "runningBalance",
+]
+
+
+def _day_key(d: date) -> str:
+    return d.strftime("%Y%m%d")
+
+
+def _signed(ttype: str, amount: float) -> float:
+    return amount if ttype in CREDIT_TYPES else -amount
+
+
+def iter_transactions(cards, cardToken: str, start: date, end: date,
+                      batch_size: int = CURSOR_BATCH) -> Iterator[Dict[str, Any]]:
+    """
+    Transactions of one card with start <= date <= end, oldest first.
+    """
+    pipeline = [
+        {"$match": {"cardToken": cardToken}},
+        {"$project": {"_id": 0, "transactions": 1}},
+        {"$unwind": {"path": "$transactions", "includeArrayIndex": "seq"}},
+        {"$addFields": {"day": {"$concat": [
+            {"$substrBytes": ["$transactions.date", 4, 4]},
+            {"$substrBytes": ["$transactions.date", 2, 2]},
+            {"$substrBytes": ["$transactions.date", 0, 2]},
+        ]}}},
+        {"$match": {"day": {"$gte": _day_key(start), "$lte": _day_key(end)}}},
+        {"$sort": {"day": 1, "transactions.time": 1, "seq": 1}},
+    ]
+    for doc in cards.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+        yield doc["transactions"]
+
+
+def opening_balances(spending_rollups, card: Dict[str, Any], start: date) -> Dict[str, float]:
+    since = rollups.summarize(spending_rollups, card["cardToken"], start, date.today())
+    balances = {str(card.get("currency", "")): float(card.get("availableBalance", 0.0))}
+    for ttype, by_cur in since["totals"].items():
+        for cur, agg in by_cur.items():
+            balances[cur] = balances.get(cur, 0.0) - _signed(ttype, agg["amount"])
+    return balances
+
+
+class _NdjsonWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+
+class _CsvWriter:
+    def __init__(self, f):
+        self.w = csv.DictWriter(f, fieldnames=COLUMNS)
+        self.w.writeheader()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self.w.writerow(row)
+
+
+def _paths(statementId: str) -> Optional[Dict[str, str]]:
+    if not statementId.isalnum():
+        return None
+    base = os.path.join(STATEMENT_DIR, statementId)
+    return {"meta": base + ".meta.json", "ndjson": base + ".ndjson", "csv": base + ".csv"}
+
+
+def export(cards, spending_rollups, card: Dict[str, Any], start: date, end: date,
+           fmt: str = "ndjson") -> Dict[str, Any]:
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError("format must be ndjson or csv")
+    _maybe_sweep()
+    balances = opening_balances(spending_rollups, card, start)
+    opening = {cur: round(v, 2) for cur, v in balances.items()}
+    totals: Dict[str, Dict[str, Any]] = {}
+    statementId = uuid.uuid4().hex
+    os.makedirs(STATEMENT_DIR, exist_ok=True)
+    paths = _paths(statementId)
+    tmp = paths[fmt] + ".tmp"
+    rows = 0
+    offsets = [0]  # byte offset where each part starts; parts end on row boundaries
+    try:
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            out = _CsvWriter(f) if fmt == "csv" else _NdjsonWriter(f)
+            for t in iter_transactions(cards, card["cardToken"], start, end):
+                ttype = str(t.get("transactionType", ""))
+                cur = str(t.get("currency", ""))
+                amount = float(t.get("transactionAmount", 0.0))
+                signed = _signed(ttype, amount)
+                balances[cur] = balances.get(cur, 0.0) + signed
+                tot = totals.setdefault(cur, {"debits": 0.0, "credits": 0.0, "count": 0})
+                tot["credits" if signed >= 0 else "debits"] += amount
+                tot["count"] += 1
+                rows += 1
+                out.write({
+                    "date": t.get("date", ""), "time": t.get("time", ""),
+                    "transactionType": ttype,
+                    "transactionTypeDescription": t.get("transactionTypeDescription", ""),
+                    "terminalLocation": t.get("terminalLocation", ""),
+                    "referenceNumber": t.get("referenceNumber", ""),
+                    "currency": cur,
+                    "debit": f"{amount:.2f}" if signed < 0 else "",
+                    "credit": f"{amount:.2f}" if signed >= 0 else "",
+                    "runningBalance": f"{balances[cur]:.2f}",
+                })
+                pos = f.tell()
+                if pos - offsets[-1] >= STATEMENT_PART_BYTES:
+                    offsets.append(pos)
+            size = f.tell()
+    except BaseException:
+        os.remove(tmp)
+        raise
+    if offsets[-1] == size and size:
+        offsets.pop()
+    os.replace(tmp, paths[fmt])
+    expires = time.time() + STATEMENT_TTL_SECONDS
+    summary = {
+        "statementId": statementId,
+        "format": fmt,
+        "expiresAt": datetime.fromtimestamp(expires, timezone.utc).isoformat(timespec="seconds"),
+        "rowCount": rows,
+        "bytes": size,
+        "parts": len(offsets),
+        "openingBalances": {cur: f"{v:.2f}" for cur, v in opening.items()},
+        "closingBalances": {cur: f"{v:.2f}" for cur, v in balances.items()},
+        "totals": [
+            {"currency": cur, "debits": f"{t['debits']:.2f}", "credits": f"{t['credits']:.2f}",
+             "transactionCount": str(t["count"])}
+            for cur, t in sorted(totals.items())
+        ],
+    }
+    # atomically, so a concurrent sweep never sees a half-written meta
+    with open(paths["meta"] + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({**summary, "offsets": offsets, "expires": expires}, f)
+    os.replace(paths["meta"] + ".tmp", paths["meta"])
+    return summary
+
+
+def load_meta(statementId: str) -> Optional[Dict[str, Any]]:
+    paths = _paths(statementId)
+    if paths is None:
+        return None
+    try:
+        with open(paths["meta"], encoding="utf-8") as f:
+            meta = json.load(f)
+        # statements exported before expiresAt existed age from the meta's mtime
+        expires = meta.get("expires") or os.path.getmtime(paths["meta"]) + STATEMENT_TTL_SECONDS
+    except (OSError, ValueError):
+        return None
+    if expires <= time.time():
+        return None
+    return meta
+
+
+_sweep_lock = threading.Lock()
+_next_sweep = 0.0
+
+
+def _maybe_sweep() -> None:
+    global _next_sweep
+    now = time.time()
+    with _sweep_lock:
+        if now < _next_sweep:
+            return
+        _next_sweep = now + STATEMENT_SWEEP_SECONDS
+    try:
+        sweep(now)
+    except OSError as e:
+        print(f"[statements] sweep failed: {e}")
+
+
+def sweep(now: Optional[float] = None) -> int:
+    """
+    Deletes expired statements, stale .tmp files and data files without a
+    meta file; returns the number of files removed.
+    """
+    now = time.time() if now is None else now
+    try:
+        names = os.listdir(STATEMENT_DIR)
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    live = set()
+    for name in names:
+        if name.endswith(".meta.json"):
+            sid = name[:-len(".meta.json")]
+            if load_meta(sid) is not None:
+                live.add(sid)
+    for name in names:
+        path = os.path.join(STATEMENT_DIR, name)
+        sid = name.split(".", 1)[0]
+        try:
+            if name.endswith(".tmp"):
+                # an export still writing touches its .tmp continuously
+                stale = now - os.path.getmtime(path) > STATEMENT_TMP_GRACE_SECONDS
+            elif name.endswith(".meta.json"):
+                stale = sid not in live
+            else:
+                # data file: goes with its meta; an orphan gets the tmp grace first
+                stale = sid not in live and now - os.path.getmtime(path) > STATEMENT_TMP_GRACE_SECONDS
+            if stale:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+def read_part(statementId: str, part: int) -> Optional[str]:
+    """
+    Part `part` (0-based) of an exported statement. Parts split on row
+    boundaries, so each one parses on its own (CSV header only in part 0).
+    """
+    meta = load_meta(statementId)
+    if meta is None or not 0 <= part < meta["parts"]:
+        return None
+    offsets = meta["offsets"] + [meta["bytes"]]
+    with open(_paths(statementId)[meta["format"]], "rb") as f:
+        f.seek(offsets[part])
+        return f.read(offsets[part + 1] - offsets[part]).decode("utf-8")
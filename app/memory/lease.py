@@ -0,0 +1,257 @@
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+
+import metrics
+import resilience
+from memory.checkpoint import end_turn
+
+# Per-thread turn lease.
+#
+# Two turns of one thread_id must not run at once: both would start from the
+# same checkpoint and the later write would silently drop the other turn.
+# Every turn runs inside turn(saver, config), which holds the thread's lease.
+# A conflicting turn waits in a per-thread FIFO queue; it is never rejected.
+# It only fails with LeaseTimeout after LEASE_WAIT_SECONDS.
+#
+# LEASE_BACKEND=redis (default) works across workers, so no sticky sessions:
+#   <prefix>:<thread_id>        lock, value = fencing token, PX LEASE_TTL_MS,
+#                               renewed while the turn runs
+#   <prefix>:<thread_id>:fence  last token handed out (INCR)
+#   <prefix>:<thread_id>:wake   pushed on release to wake one waiting worker
+# Turns from the same process queue locally first, so only one of them polls
+# Redis. Fencing tokens grow per thread and are used twice:
+#   - If the token is not the successor of the one this process last held,
+#     another worker ran turns in between. The tiered saver's hot copy of the
+#     thread is then stale and is dropped, so the checkpoint reloads from Redis.
+#   - The tiered saver writes the thread only while the fence still holds its
+#     token. A worker whose lease expired mid-turn (GC pause, partition)
+#     cannot overwrite the newer holder's checkpoints.
+# The lease is released only after the turn's checkpoints are flushed.
+#
+# If Redis is unreachable at startup, or LEASE_BACKEND=memory, the lease is
+# process-local (single worker).
+
+LEASE_BACKEND = os.getenv("LEASE_BACKEND", "redis").lower()
+LEASE_TTL_MS = int(os.getenv("LEASE_TTL_MS", "30000"))
+LEASE_WAIT_SECONDS = float(os.getenv("LEASE_WAIT_SECONDS", "300"))
+# how long a fence counter outlives the thread's last turn (matches checkpoint TTL)
+FENCE_TTL_SECONDS = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 86400)))
+
+
+class LeaseTimeout(TimeoutError):
+    pass
+
+
+class Lease:
+    def __init__(self, thread_id: str, token: int, fence_key: Optional[str] = None, foreign: bool = False):
+        self.thread_id = thread_id
+        self.token = token
+        self.fence_key = fence_key
+        # another worker held the thread since this process last did
+        self.foreign = foreign
+
+
+class LocalLeases:
+    """
+    FIFO per thread_id within this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queues: Dict[str, Deque[threading.Event]] = {}
+        self.tokens = itertools.count(1)
+
+    def _enter(self, thread_id: str, timeout: float) -> None:
+        ev = threading.Event()
+        with self.lock:
+            q = self.queues.setdefault(thread_id, deque())
+            q.append(ev)
+            if len(q) == 1:
+                ev.set()
+        if ev.wait(timeout):
+            return
+        with self.lock:
+            if ev.is_set():  # granted while timing out: take it after all
+                return
+            q.remove(ev)
+        raise LeaseTimeout(f"thread {thread_id} busy for {timeout:.0f}s")
+
+    def _leave(self, thread_id: str) -> None:
+        with self.lock:
+            q = self.queues[thread_id]
+            q.popleft()
+            if q:
+                q[0].set()
+            else:
+                del self.queues[thread_id]
+
+    def acquire(self, thread_id: str, timeout: float = LEASE_WAIT_SECONDS) -> Lease:
+        self._enter(thread_id, timeout)
+        return Lease(thread_id, next(self.tokens))
+
+    def release(self, lease: Lease) -> None:
+        self._leave(lease.thread_id)
+
+    def queued(self) -> int:
+        with self.lock:
+            return sum(len(q) - 1 for q in self.queues.values())
+
+
+_ACQUIRE = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+local t = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[1], t, 'PX', ARGV[1])
+return t
+"""
+
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+_RELEASE = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+redis.call('DEL', KEYS[1])
+redis.call('RPUSH', KEYS[2], 1)
+redis.call('PEXPIRE', KEYS[2], 1000)
+return 1
+"""
+
+
+class RedisLeases(LocalLeases):
+    """
+    Cross-worker lease on top of the local FIFO.
+    """
+
+    def __init__(self, client, ttl_ms: int = LEASE_TTL_MS, prefix: str = "fransa:lease"):
+        super().__init__()
+        self.r = client
+        self.ttl_ms = ttl_ms
+        self.prefix = prefix
+        self._acquire = client.register_script(_ACQUIRE)
+        self._renew = client.register_script(_RENEW)
+        self._release = client.register_script(_RELEASE)
+        self.held: Dict[str, Lease] = {}
+        # thread_id -> last token this process held (bounded; a miss only costs a reload)
+        self.last: "OrderedDict[str, int]" = OrderedDict()
+        self.renewer = threading.Thread(target=self._renew_loop, name="lease-renewer", daemon=True)
+        self.renewer.start()
+
+    def _keys(self, thread_id: str):
+        base = f"{self.prefix}:{thread_id}"
+        return base, base + ":fence", base + ":wake"
+
+    def acquire(self, thread_id: str, timeout: float = LEASE_WAIT_SECONDS) -> Lease:
+        deadline = time.monotonic() + timeout
+        self._enter(thread_id, timeout)
+        lock_key, fence_key, wake_key = self._keys(thread_id)
+        try:
+            while True:
+                token = int(self._acquire(keys=[lock_key, fence_key], args=[self.ttl_ms, FENCE_TTL_SECONDS]))
+                if token:
+                    break
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise LeaseTimeout(f"thread {thread_id} held by another worker for {timeout:.0f}s")
+                # woken by the holder's release; the poll bound covers a holder that died
+                self.r.blpop([wake_key], timeout=min(left, 1.0))
+        except BaseException:
+            self._leave(thread_id)
+            raise
+        with self.lock:
+            prev = self.last.pop(thread_id, None)
+            self.last[thread_id] = token
+            while len(self.last) > 4096:
+                self.last.popitem(last=False)
+            lease = Lease(thread_id, token, fence_key, foreign=prev != token - 1)
+            self.held[thread_id] = lease
+        return lease
+
+    def release(self, lease: Lease) -> None:
+        lock_key, _, wake_key = self._keys(lease.thread_id)
+        with self.lock:
+            self.held.pop(lease.thread_id, None)
+        try:
+            if not self._release(keys=[lock_key, wake_key], args=[lease.token]):
+                metrics.incr("lease.lost")
+                print(f"[lease] thread {lease.thread_id} lease {lease.token} had expired before release")
+        finally:
+            self._leave(lease.thread_id)
+
+    def _renew_loop(self) -> None:
+        while True:
+            time.sleep(self.ttl_ms / 3000)
+            with self.lock:
+                held = list(self.held.values())
+            for lease in held:
+                try:
+                    if not self._renew(keys=[self._keys(lease.thread_id)[0]], args=[lease.token, self.ttl_ms]):
+                        # the fence now rejects this turn's checkpoint writes
+                        metrics.incr("lease.expired")
+                        print(f"[lease] thread {lease.thread_id} lease {lease.token} expired mid-turn")
+                except Exception as e:
+                    print(f"[lease] renewing {lease.thread_id} failed: {e!r}")
+
+
+_leases: Optional[LocalLeases] = None
+_leases_lock = threading.Lock()
+
+
+def get_leases() -> LocalLeases:
+    global _leases
+    with _leases_lock:
+        if _leases is None:
+            _leases = _build_leases()
+            metrics.gauge("lease.queued", _leases.queued)
+        return _leases
+
+
+def _build_leases() -> LocalLeases:
+    if LEASE_BACKEND == "redis":
+        import redis
+
+        url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        client = redis.Redis.from_url(url)
+        try:
+            client.ping()
+            print(f"[lease] per-thread leases in Redis at {url}")
+            return RedisLeases(client)
+        except redis.RedisError as e:
+            print(f"[lease] Redis unavailable ({e}); per-thread leases are process-local")
+    return LocalLeases()
+
+
+@contextmanager
+def turn(saver: Any, config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    with lease.turn(saver, config) as config: app.invoke(..., config=config)
+
+    Waits for the thread's lease, runs the turn and releases the lease once
+    the turn's checkpoints are written.
+    """
+    leases = get_leases()
+    thread_id = config["configurable"]["thread_id"]
+    t0 = time.perf_counter()
+    # waiting for the lease spends the turn's budget like any other call
+    lease = leases.acquire(thread_id, resilience.remaining(LEASE_WAIT_SECONDS, config))
+    waited = (time.perf_counter() - t0) * 1000
+    metrics.observe("lease.wait_ms", waited)
+    if waited >= 1:
+        metrics.incr("lease.contended")
+    try:
+        if lease.fence_key is not None and hasattr(saver, "fence"):
+            if lease.foreign:
+                saver.forget(thread_id)
+            # stays set after release: records still pending then are written under this token
+            saver.fence(thread_id, lease.fence_key, lease.token)
+        yield {**config, "configurable": {**config["configurable"], "lease_token": lease.token}}
+        # the next holder may be another worker: it must find this turn in Redis
+        end_turn(saver, config, force=lease.fence_key is not None)
+    finally:
+        leases.release(lease)
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import ensure_config
+from langgraph.store.base import (
+    BaseStore, GetOp, Item, ListNamespacesOp, Op, PutOp, Result, SearchItem, SearchOp,
+)
+
+import metrics
+
+# Long-term, per-client memory shared by every conversation of that client.
+#
+# Namespace ("clients", <clientId>) holds:
+#   "cards"        card summaries from the last listClientCards (no balances)
+#   "preferences"  small facts worth carrying across sessions (last card used)
+#
+# Entries expire after CLIENT_MEMORY_TTL_MINUTES. The MCP server drops
+# "cards" when a card is created or changes status, renewal or limit profile,
+# so a summary is either fresh or absent (renewals by the expiry sweeper are
+# only bounded by the TTL). Agents read the namespace before
+# calling the model and hand it over as a system note: the model no longer
+# has to ask for the clientId or call listClientCards first, which saves a
+# tool call and the model round trip after it in most sessions.
+#
+# MEMORY_STORE=redis (default) keeps entries in Redis so every process and
+# the MCP server see the same memory; if Redis is unreachable at startup, or
+# MEMORY_STORE=memory, entries live in process memory.
+
+MEMORY_STORE = os.getenv("MEMORY_STORE", "redis").lower()
+CLIENT_MEMORY_TTL_MINUTES = float(os.getenv("CLIENT_MEMORY_TTL_MINUTES", "30"))
+
+CARD_FIELDS = ["cardToken", "last4", "status", "type", "productType", "currency", "expiryDate", "limitProfile"]
+
+_CLIENT_ID = re.compile(r"\bclient(?:\s*id)?\s*(?:#|:|is|=)?\s*(\d{3,})", re.IGNORECASE)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class _MemoryBackend:
+    """
+    Process-local entries: (namespace, key) -> (Item, expires_at monotonic).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: Dict[Tuple[Tuple[str, ...], str], Tuple[Item, Optional[float]]] = {}
+
+    def _live(self, k, now: float) -> Optional[Item]:
+        hit = self.entries.get(k)
+        if hit is None:
+            return None
+        if hit[1] is not None and hit[1] <= now:
+            del self.entries[k]
+            return None
+        return hit[0]
+
+    def get(self, namespace: Tuple[str, ...], key: str, refresh: Optional[float]) -> Optional[Item]:
+        now = time.monotonic()
+        with self.lock:
+            item = self._live((namespace, key), now)
+            if item is not None and refresh:
+                self.entries[(namespace, key)] = (item, now + refresh)
+            return item
+
+    def put(self, item: Item, ttl: Optional[float]) -> None:
+        with self.lock:
+            old = self._live((item.namespace, item.key), time.monotonic())
+            if old is not None:
+                item = Item(value=item.value, key=item.key, namespace=item.namespace,
+                            created_at=old.created_at, updated_at=item.updated_at)
+            self.entries[(item.namespace, item.key)] = (item, time.monotonic() + ttl if ttl else None)
+
+    def delete(self, namespace: Tuple[str, ...], key: str) -> None:
+        with self.lock:
+            self.entries.pop((namespace, key), None)
+
+    def items(self, prefix: Tuple[str, ...]) -> List[Item]:
+        now = time.monotonic()
+        with self.lock:
+            keys = [k for k in self.entries if k[0][:len(prefix)] == prefix]
+            return [item for item in (self._live(k, now) for k in keys) if item is not None]
+
+    def namespaces(self) -> List[Tuple[str, ...]]:
+        now = time.monotonic()
+        with self.lock:
+            return sorted({k[0] for k in list(self.entries) if self._live(k, now) is not None})
+
+
+class _RedisBackend:
+    """
+    One string key per entry (JSON, EX ttl) plus a set of keys per namespace
+    for search/list. Set members whose entry expired are pruned on read.
+    """
+
+    def __init__(self, client, prefix: str = "fransa:store"):
+        self.r = client
+        self.prefix = prefix
+
+    def _ns(self, namespace: Tuple[str, ...]) -> str:
+        return "|".join(namespace)
+
+    def _key(self, namespace: Tuple[str, ...], key: str) -> str:
+        return f"{self.prefix}:{self._ns(namespace)}:{key}"
+
+    def _index(self, namespace: Tuple[str, ...]) -> str:
+        return f"{self.prefix}:idx:{self._ns(namespace)}"
+
+    def _item(self, namespace: Tuple[str, ...], key: str, raw: Optional[bytes]) -> Optional[Item]:
+        if raw is None:
+            return None
+        rec = json.loads(raw)
+        return Item(value=rec["value"], key=key, namespace=namespace,
+                    created_at=datetime.fromisoformat(rec["created_at"]),
+                    updated_at=datetime.fromisoformat(rec["updated_at"]))
+
+    def get(self, namespace: Tuple[str, ...], key: str, refresh: Optional[float]) -> Optional[Item]:
+        k = self._key(namespace, key)
+        if refresh:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.get(k)
+            pipe.expire(k, int(refresh))
+            raw = pipe.execute()[0]
+        else:
+            raw = self.r.get(k)
+        return self._item(namespace, key, raw)
+
+    def put(self, item: Item, ttl: Optional[float]) -> None:
+        k = self._key(item.namespace, item.key)
+        old = self.r.get(k)
+        created = json.loads(old)["created_at"] if old else item.created_at.isoformat()
+        rec = json.dumps({"value": item.value, "created_at": created, "updated_at": item.updated_at.isoformat()},
+                         separators=(",", ":"), default=str)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.set(k, rec, ex=int(ttl) if ttl else None)
+        pipe.sadd(self._index(item.namespace), item.key)
+        pipe.sadd(f"{self.prefix}:namespaces", self._ns(item.namespace))
+        pipe.execute()
+
+    def delete(self, namespace: Tuple[str, ...], key: str) -> None:
+        pipe = self.r.pipeline(transaction=False)
+        pipe.delete(self._key(namespace, key))
+        pipe.srem(self._index(namespace), key)
+        pipe.execute()
+
+    def _members(self) -> List[Tuple[str, ...]]:
+        return [tuple(m.decode().split("|")) for m in self.r.smembers(f"{self.prefix}:namespaces")]
+
+    def items(self, prefix: Tuple[str, ...]) -> List[Item]:
+        out: List[Item] = []
+        for namespace in self._members():
+            if namespace[:len(prefix)] != prefix:
+                continue
+            keys = sorted(m.decode() for m in self.r.smembers(self._index(namespace)))
+            if not keys:
+                continue
+            raws = self.r.mget([self._key(namespace, k) for k in keys])
+            gone = [k for k, raw in zip(keys, raws) if raw is None]
+            if gone:
+                self.r.srem(self._index(namespace), *gone)
+            out.extend(self._item(namespace, k, raw) for k, raw in zip(keys, raws) if raw is not None)
+        return out
+
+    def namespaces(self) -> List[Tuple[str, ...]]:
+        return sorted(ns for ns in self._members() if self.r.scard(self._index(ns)))
+
+
+class ClientStore(BaseStore):
+    """
+    BaseStore over a Redis or in-memory backend, with per-entry TTL (minutes,
+    as in LangGraph's TTLConfig). Search supports exact-match filters only;
+    there is no vector index.
+    """
+
+    supports_ttl = True
+
+    def __init__(self, backend, default_ttl: Optional[float] = CLIENT_MEMORY_TTL_MINUTES):
+        self.backend = backend
+        self.default_ttl = default_ttl
+
+    def _seconds(self, ttl: Optional[float]) -> Optional[float]:
+        return ttl * 60 if ttl else None
+
+    def batch(self, ops: Iterable[Op]) -> List[Result]:
+        results: List[Result] = []
+        for op in ops:
+            if isinstance(op, GetOp):
+                refresh = self._seconds(self.default_ttl) if op.refresh_ttl else None
+                item = self.backend.get(op.namespace, op.key, refresh)
+                metrics.incr("store.hits" if item is not None else "store.misses")
+                results.append(item)
+            elif isinstance(op, PutOp):
+                if op.value is None:
+                    self.backend.delete(op.namespace, op.key)
+                else:
+                    now = _now()
+                    ttl = self.default_ttl if op.ttl is None else op.ttl
+                    self.backend.put(Item(value=dict(op.value), key=op.key, namespace=op.namespace,
+                                          created_at=now, updated_at=now), self._seconds(ttl))
+                results.append(None)
+            elif isinstance(op, SearchOp):
+                items = self.backend.items(op.namespace_prefix)
+                if op.filter:
+                    items = [i for i in items if all(i.value.get(k) == v for k, v in op.filter.items())]
+                items.sort(key=lambda i: i.updated_at, reverse=True)
+                results.append([
+                    SearchItem(namespace=i.namespace, key=i.key, value=i.value,
+                               created_at=i.created_at, updated_at=i.updated_at)
+                    for i in items[op.offset:op.offset + op.limit]
+                ])
+            elif isinstance(op, ListNamespacesOp):
+                namespaces = self.backend.namespaces()
+                for cond in op.match_conditions or ():
+                    n = len(cond.path)
+                    part = (lambda ns: ns[:n]) if cond.match_type == "prefix" else (lambda ns: ns[-n:])
+                    namespaces = [ns for ns in namespaces
+                                  if len(ns) >= n and all(p == "*" or p == q for p, q in zip(cond.path, part(ns)))]
+                if op.max_depth is not None:
+                    namespaces = sorted({ns[:op.max_depth] for ns in namespaces})
+                results.append(namespaces[op.offset:op.offset + op.limit])
+            else:
+                raise ValueError(f"unsupported store op: {type(op).__name__}")
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> List[Result]:
+        return await asyncio.to_thread(self.batch, list(ops))
+
+
+_store: Optional[ClientStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ClientStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = _build_store()
+        return _store
+
+
+def _build_store() -> ClientStore:
+    if MEMORY_STORE == "redis":
+        import redis
+
+        url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        client = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=1)
+        try:
+            client.ping()
+            print(f"[store] client memory in Redis at {url}")
+            return ClientStore(_RedisBackend(client))
+        except redis.RedisError as e:
+            print(f"[store] Redis unavailable ({e}); client memory kept in process")
+    return ClientStore(_MemoryBackend())
+
+
+# ---------- per-client helpers ----------
+
+def _namespace(clientId: str) -> Tuple[str, ...]:
+    return ("clients", str(clientId))
+
+
+def _safe(fn, *args):
+    # memory is an optimisation: a store failure must never fail the turn or the tool
+    try:
+        return fn(*args)
+    except Exception as e:
+        metrics.incr("store.errors")
+        print(f"[store] {fn.__name__} failed: {e!r}")
+        return None
+
+
+def remember_cards(clientId: str, cards: List[Dict[str, Any]]) -> None:
+    summary = [{k: c.get(k, "") for k in CARD_FIELDS} for c in cards]
+    _safe(get_store().put, _namespace(clientId), "cards", {"cards": summary})
+
+
+def forget_cards(clientId: str) -> None:
+    _safe(get_store().delete, _namespace(clientId), "cards")
+
+
+def remember_preferences(clientId: str, prefs: Dict[str, Any]) -> None:
+    store = get_store()
+    old = _safe(store.get, _namespace(clientId), "preferences")
+    _safe(store.put, _namespace(clientId), "preferences", {**(old.value if old else {}), **prefs})
+
+
+def recall(clientId: str) -> Dict[str, Any]:
+    """
+    {"cards": [...], "preferences": {...}}, each present only if remembered.
+    """
+    found = _safe(get_store().batch, [GetOp(_namespace(clientId), "cards"), GetOp(_namespace(clientId), "preferences")])
+    cards, prefs = found or (None, None)
+    out: Dict[str, Any] = {}
+    if cards is not None:
+        out["cards"] = cards.value["cards"]
+    if prefs is not None:
+        out["preferences"] = prefs.value
+    return out
+
+
+def client_id_of(messages: List[BaseMessage]) -> Optional[str]:
+    """
+    clientId for this turn: configurable["client_id"] when the channel knows
+    it, else the most recent one the user mentioned.
+    """
+    cid = ensure_config().get("configurable", {}).get("client_id")
+    if cid:
+        return str(cid)
+    for m in reversed(messages):
+        if getattr(m, "type", "") == "human" and isinstance(m.content, str):
+            hit = _CLIENT_ID.search(m.content)
+            if hit:
+                return hit.group(1)
+    return None
+
+
+def with_client_memory(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    The model input for a specialist: the conversation, preceded by what is
+    remembered about the client. Nothing is written to graph state.
+    """
+    clientId = client_id_of(messages)
+    if clientId is None:
+        return messages
+    known = recall(clientId)
+    if not known:
+        return messages
+    metrics.incr("store.recalled")
+    note = (f"Known about client {clientId} (use it instead of asking or listing cards again): "
+            + json.dumps(known, separators=(",", ":"), ensure_ascii=False))
+    return [SystemMessage(content=note)] + list(messages)
@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+import ormsgpack
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+import metrics
+
+# Checkpointer with an in-memory hot tier and write-behind to Redis.
+#
+# Active threads live in InMemorySaver's dicts, bounded to CHECKPOINT_HOT_THREADS
+# threads (LRU). Every put/put_writes also produces an immutable record that
+# a background flusher writes to Redis in pipelined batches:
+#   key   <prefix>:<thread_id>  (hash, TTL CHECKPOINT_TTL_SECONDS)
+#   field c|<ns>|<checkpoint_id>                -> checkpoint, metadata, parent, new blobs
+#   field w|<ns>|<checkpoint_id>|<task>|<idx>   -> one pending write
+# Records never change once written, so batches may land in any order.
+# A thread that is not resident is loaded with one HGETALL on first access.
+#
+# CHECKPOINT_DURABILITY:
+#   turn  (default) writes are async; flush(thread_id) at the end of a turn blocks
+#         until that thread is in Redis, so a crash loses at most the current turn
+#   step  every put() is written before it returns (old behaviour, but pipelined)
+#   async never blocks; a crash loses whatever was not flushed yet
+#
+# Under a distributed turn lease (memory/lease.py) a thread carries a fence:
+# its records are written only while the fence key in Redis still holds this
+# worker's token, so a worker that lost its lease cannot overwrite the next
+# holder's checkpoints. Rejected records are dropped with the hot copy.
+
+_FENCED_HSET = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') > tonumber(ARGV[1]) then return 0 end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def _record_key(thread_id: str, prefix: str) -> str:
+    return f"{prefix}:{thread_id}"
+
+
+class TieredSaver(InMemorySaver):
+    def __init__(self, client, *, max_threads: int = 2048, durability: str = "turn",
+                 flush_interval: float = 0.05, ttl: int = 7 * 86400, prefix: str = "fransa:ckpt"):
+        super().__init__()
+        if durability not in ("turn", "step", "async"):
+            raise ValueError(f"unknown checkpoint durability: {durability}")
+        self.client = client
+        self.max_threads = max_threads
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.prefix = prefix
+        self.lock = threading.RLock()
+        self.resident: "OrderedDict[str, None]" = OrderedDict()
+        self.pending: Dict[str, Dict[str, bytes]] = {}
+        self.inflight: Dict[str, int] = {}  # threads with a batch being written
+        self.fences: Dict[str, Tuple[str, int]] = {}  # thread_id -> (fence key, token)
+        self._fenced_hset = client.register_script(_FENCED_HSET)
+        self.wake = threading.Event()
+        self.closed = False
+        self.flusher = threading.Thread(target=self._run, name="checkpoint-flusher", daemon=True)
+        self.flusher.start()
+
+    # ---------- hot tier ----------
+
+    def _touch(self, thread_id: str) -> None:
+        with self.lock:
+            if thread_id in self.resident:
+                self.resident.move_to_end(thread_id)
+                return
+        # miss: read Redis outside the lock so other threads keep going
+        t0 = time.perf_counter()
+        raw = self.client.hgetall(_record_key(thread_id, self.prefix))
+        metrics.observe("checkpoint.load_ms", (time.perf_counter() - t0) * 1000)
+        with self.lock:
+            if thread_id in self.resident:
+                return
+            if raw:
+                metrics.incr("checkpoint.loaded")
+                self._install(thread_id, raw)
+            self.resident[thread_id] = None
+            self._evict(keep=thread_id)
+
+    def _evict(self, keep: str) -> None:
+        # caller holds the lock; unflushed threads stay until the flusher has written them
+        for victim in list(self.resident):
+            if len(self.resident) <= self.max_threads:
+                break
+            if victim != keep and victim not in self.pending and victim not in self.inflight:
+                del self.resident[victim]
+                self.fences.pop(victim, None)
+                super().delete_thread(victim)
+                metrics.incr("checkpoint.evicted")
+
+    def _install(self, thread_id: str, raw: Dict[Any, bytes]) -> None:
+        for field, value in raw.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            rec = ormsgpack.unpackb(value)
+            if field.startswith("c|"):
+                ns, cid = rec[0], rec[1]
+                self.storage[thread_id][ns][cid] = ((rec[2], rec[3]), (rec[4], rec[5]), rec[6])
+                for channel, version, btype, bval in rec[7]:
+                    self.blobs[(thread_id, ns, channel, version)] = (btype, bval)
+            else:
+                ns, cid, task_id, idx, channel, vtype, vval, task_path = rec
+                self.writes[(thread_id, ns, cid)][(task_id, idx)] = (task_id, channel, (vtype, vval), task_path)
+
+    def _queue(self, thread_id: str, field: str, record: list) -> None:
+        self.pending.setdefault(thread_id, {})[field] = ormsgpack.packb(record)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._touch(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs: Any) -> Iterator[CheckpointTuple]:
+        # without a config only resident threads are listed
+        if config:
+            self._touch(config["configurable"]["thread_id"])
+        return super().list(config, **kwargs)
+
+    def get_delta_channel_history(self, *, config: RunnableConfig, channels: Sequence[str]):
+        self._touch(config["configurable"]["thread_id"])
+        return super().get_delta_channel_history(config=config, channels=channels)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        self._touch(thread_id)
+        with self.lock:
+            out = super().put(config, checkpoint, metadata, new_versions)
+            ns, cid = out["configurable"]["checkpoint_ns"], out["configurable"]["checkpoint_id"]
+            c, m, parent = self.storage[thread_id][ns][cid]
+            blobs = [[k, v, *self.blobs[(thread_id, ns, k, v)]] for k, v in new_versions.items()]
+            self._queue(thread_id, f"c|{ns}|{cid}", [ns, cid, c[0], c[1], m[0], m[1], parent, blobs])
+        if self.durability == "step":
+            self.flush(thread_id)
+        else:
+            self.wake.set()
+        return out
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        conf = config["configurable"]
+        thread_id, ns, cid = conf["thread_id"], conf.get("checkpoint_ns", ""), conf["checkpoint_id"]
+        self._touch(thread_id)
+        with self.lock:
+            super().put_writes(config, writes, task_id, task_path)
+            for (tid, idx), (_, channel, value, path) in self.writes[(thread_id, ns, cid)].items():
+                if tid == task_id:
+                    self._queue(thread_id, f"w|{ns}|{cid}|{tid}|{idx}",
+                                [ns, cid, tid, idx, channel, value[0], value[1], path])
+        if self.durability == "step":
+            self.flush(thread_id)
+        else:
+            self.wake.set()
+
+    def fence(self, thread_id: str, key: str, token: int) -> None:
+        with self.lock:
+            self.fences[thread_id] = (key, token)
+
+    def forget(self, thread_id: str) -> None:
+        """
+        Drop the hot copy (another worker has moved the thread on); the next
+        access reloads it from Redis.
+        """
+        with self.lock:
+            super().delete_thread(thread_id)
+            self.resident.pop(thread_id, None)
+            self.pending.pop(thread_id, None)
+            self.fences.pop(thread_id, None)
+        metrics.incr("checkpoint.forgotten")
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            super().delete_thread(thread_id)
+            self.resident.pop(thread_id, None)
+            self.pending.pop(thread_id, None)
+            self.fences.pop(thread_id, None)
+        self.client.delete(_record_key(thread_id, self.prefix))
+
+    # ---------- write-behind ----------
+
+    def _take(self, thread_id: Optional[str] = None) -> Dict[str, Dict[str, bytes]]:
+        with self.lock:
+            if thread_id is None:
+                batch, self.pending = self.pending, {}
+            else:
+                fields = self.pending.pop(thread_id, None)
+                batch = {thread_id: fields} if fields else {}
+            for t in batch:
+                self.inflight[t] = self.inflight.get(t, 0) + 1
+        return batch
+
+    def _write(self, batch: Dict[str, Dict[str, bytes]]) -> None:
+        t0 = time.perf_counter()
+        with self.lock:
+            fences = {t: self.fences[t] for t in batch if t in self.fences}
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for thread_id, fields in batch.items():
+                key = _record_key(thread_id, self.prefix)
+                if thread_id in fences:
+                    fence_key, token = fences[thread_id]
+                    flat = [x for kv in fields.items() for x in kv]
+                    self._fenced_hset(keys=[key, fence_key], args=[token, self.ttl, *flat], client=pipe)
+                else:
+                    pipe.hset(key, mapping=fields)
+                    pipe.expire(key, self.ttl)
+            results = iter(pipe.execute())
+        except Exception:
+            with self.lock:
+                for thread_id, fields in batch.items():
+                    # newer records for the same fields are identical, so order does not matter
+                    self.pending.setdefault(thread_id, {}).update(fields)
+            raise
+        finally:
+            with self.lock:
+                for t in batch:
+                    self.inflight[t] -= 1
+                    if not self.inflight[t]:
+                        del self.inflight[t]
+        for thread_id in batch:
+            if thread_id in fences:
+                if not next(results):
+                    metrics.incr("checkpoint.fenced_out")
+                    print(f"[checkpoint] thread {thread_id}: lease {fences[thread_id][1]} superseded, records dropped")
+                    self.forget(thread_id)
+            else:
+                next(results), next(results)
+        metrics.observe("checkpoint.flush_ms", (time.perf_counter() - t0) * 1000)
+        metrics.incr("checkpoint.flushed_records", sum(len(f) for f in batch.values()))
+
+    def flush(self, thread_id: Optional[str] = None) -> None:
+        """
+        Write pending records now (one thread, or all) and return once they
+        are in Redis. Call at the end of a turn in "turn" durability.
+        """
+        batch = self._take(thread_id)
+        if batch:
+            self._write(batch)
+
+    def _run(self) -> None:
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            # coalesce whatever arrives within one interval into a single pipeline
+            time.sleep(self.flush_interval)
+            batch = self._take()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                metrics.incr("checkpoint.flush_errors")
+                print(f"[checkpoint] flush of {len(batch)} threads failed, will retry: {e}")
+                time.sleep(1.0)
+
+    def pending_count(self) -> int:
+        with self.lock:
+            return sum(len(f) for f in self.pending.values())
+
+    def close(self) -> None:
+        self.closed = True
+        self.wake.set()
+        self.flusher.join(timeout=5)
+        self.flush()
+
+
+def build_tiered_saver(redis_url: str) -> TieredSaver:
+    import redis
+
+    saver = TieredSaver(
+        redis.Redis.from_url(redis_url),
+        max_threads=int(os.getenv("CHECKPOINT_HOT_THREADS", "2048")),
+        durability=os.getenv("CHECKPOINT_DURABILITY", "turn"),
+        flush_interval=float(os.getenv("CHECKPOINT_FLUSH_MS", "50")) / 1000,
+        ttl=int(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 86400))),
+    )
+    metrics.gauge("checkpoint.pending_records", saver.pending_count)
+    metrics.gauge("checkpoint.resident_threads", lambda: len(saver.resident))
+    return saver
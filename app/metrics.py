@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+# In-process metrics sink shared by the graph workers and the MCP server.
+# Names are flat strings; labels are folded in as name{k=v,...}.
+# snapshot() is what gets exported (MCP resource metrics://server, logs, ...).
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = defaultdict(float)
+_timings: Dict[str, list] = {}  # name -> [count, total, max]
+_gauges: Dict[str, Callable[[], Any]] = {}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in sorted(labels.items())) + "}"
+
+
+def incr(name: str, value: float = 1, **labels: Any) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    key = _key(name, labels)
+    with _lock:
+        t = _timings.get(key)
+        if t is None:
+            _timings[key] = [1, value, value]
+        else:
+            t[0] += 1
+            t[1] += value
+            if value > t[2]:
+                t[2] = value
+
+
+class timer:
+    """
+    with metrics.timer("mongo.ms", tool="setPin"): ...   (records milliseconds)
+    """
+
+    def __init__(self, name: str, **labels: Any):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, (time.perf_counter() - self.t0) * 1000, **self.labels)
+        return False
+
+
+def gauge(name: str, fn: Callable[[], Any]) -> None:
+    """
+    Register a value computed at snapshot time (sizes, ratios, ...).
+    """
+    _gauges[name] = fn
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        counters = dict(_counters)
+        timings = {
+            k: {"count": c, "avg": round(total / c, 3), "max": round(mx, 3)}
+            for k, (c, total, mx) in _timings.items()
+        }
+    gauges = {}
+    for name, fn in list(_gauges.items()):
+        try:
+            gauges[name] = fn()
+        except Exception as e:
+            gauges[name] = f"error: {e}"
+    return {"counters": counters, "timings": timings, "gauges": gauges}
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _timings.clear()
@@ -0,0 +1,327 @@
+"""
+Opt-in per-turn profiling.
+
+A turn is profiled when its thread_id matches PROFILE_THREAD_ID or it wins
+a PROFILE_SAMPLE_RATE coin flip. For a profiled turn we record:
+  - trace spans: graph node -> LLM call -> tool -> Mongo command
+    (LangChain callbacks + a pymongo CommandListener)
+  - stack samples of every thread the turn touched (PROFILE_SAMPLE_INTERVAL_MS)
+and write <PROFILE_DIR>/<thread_id>-<ts>.speedscope.json (open in
+speedscope.app) plus a .folded file for flamegraph.pl.
+
+When nothing is selected, turn() costs one attribute check and no callback
+is attached. Settings can change without a restart: call configure() (admin
+hook), or edit the JSON file at PROFILE_CONTROL_FILE, e.g.
+    {"thread_id": "user_123", "sample_rate": 0.01}
+which is re-read at most once per second.
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from pymongo import monitoring
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_CONTROL_FILE = os.getenv("PROFILE_CONTROL_FILE", "")
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+
+
+class _Settings:
+    def __init__(self):
+        self.thread_id = os.getenv("PROFILE_THREAD_ID", "")
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.enabled = bool(self.thread_id or self.sample_rate)
+        self.control_mtime = 0.0
+        self.next_check = 0.0
+
+
+_settings = _Settings()
+
+
+def configure(thread_id: Optional[str] = None, sample_rate: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Admin hook: change the selection at runtime. Empty thread_id and a zero
+    sample_rate switch profiling off.
+    """
+    if thread_id is not None:
+        _settings.thread_id = thread_id
+    if sample_rate is not None:
+        _settings.sample_rate = float(sample_rate)
+    _settings.enabled = bool(_settings.thread_id or _settings.sample_rate)
+    return {"thread_id": _settings.thread_id, "sample_rate": _settings.sample_rate}
+
+
+def _reload_control_file(now: float) -> None:
+    _settings.next_check = now + 1.0
+    try:
+        mtime = os.stat(PROFILE_CONTROL_FILE).st_mtime
+    except OSError:
+        return
+    if mtime == _settings.control_mtime:
+        return
+    _settings.control_mtime = mtime
+    try:
+        with open(PROFILE_CONTROL_FILE, encoding="utf-8") as f:
+            conf = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[profiling] bad control file {PROFILE_CONTROL_FILE}: {e}")
+        return
+    configure(conf.get("thread_id", ""), conf.get("sample_rate", 0))
+
+
+def _selected(thread_id: str) -> bool:
+    if PROFILE_CONTROL_FILE:
+        now = time.monotonic()
+        if now >= _settings.next_check:
+            _reload_control_file(now)
+    if not _settings.enabled:
+        return False
+    if _settings.thread_id and thread_id == _settings.thread_id:
+        return True
+    return _settings.sample_rate > 0 and random.random() < _settings.sample_rate
+
+
+# ---------- trace ----------
+
+class Trace:
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.t0 = time.perf_counter()
+        self.lock = threading.Lock()
+        # (thread ident, name, start, end)
+        self.spans: List[Tuple[int, str, float, float]] = []
+        self.open: Dict[Any, Tuple[int, str, float]] = {}
+        self.threads = {threading.get_ident()}
+        self.stacks: Dict[int, Dict[Tuple[str, ...], int]] = {}
+
+    def start(self, key: Any, name: str) -> None:
+        ident = threading.get_ident()
+        with self.lock:
+            self.threads.add(ident)
+            self.open[key] = (ident, name, time.perf_counter())
+
+    def end(self, key: Any) -> None:
+        t = time.perf_counter()
+        with self.lock:
+            opened = self.open.pop(key, None)
+            if opened is not None:
+                self.spans.append((opened[0], opened[1], opened[2], t))
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("profiling_trace", default=None)
+
+
+def active() -> bool:
+    """
+    True inside a profiled turn.
+    """
+    return _current.get() is not None
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Manual span for code outside LangChain callbacks; no-op when not profiling.
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    key = object()
+    trace.start(key, name)
+    try:
+        yield
+    finally:
+        trace.end(key)
+
+
+class TraceCallback(BaseCallbackHandler):
+    """
+    Spans for graph nodes, model calls and tool calls of one turn.
+    """
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # only the node run itself, not the writers/routers it spawns
+        if node and kwargs.get("name") == node:
+            self.trace.start(run_id, f"node:{node}")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.trace.end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.trace.end(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or (serialized or {}).get("name", "llm")
+        self.trace.start(run_id, f"llm:{model}")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.trace.start(run_id, f"llm:{(serialized or {}).get('name', 'llm')}")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.trace.end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.trace.end(run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.trace.start(run_id, f"tool:{(serialized or {}).get('name', 'tool')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.trace.end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.trace.end(run_id)
+
+
+class MongoSpanListener(monitoring.CommandListener):
+    """
+    pymongo CommandListener: a span per Mongo command of a profiled turn.
+    Register with MongoClient(event_listeners=[MongoSpanListener()]).
+    """
+
+    def started(self, event) -> None:
+        trace = _current.get()
+        if trace is not None:
+            trace.start(("mongo", event.request_id), f"mongo:{event.command_name}")
+
+    def succeeded(self, event) -> None:
+        trace = _current.get()
+        if trace is not None:
+            trace.end(("mongo", event.request_id))
+
+    def failed(self, event) -> None:
+        self.succeeded(event)
+
+
+# ---------- sampler ----------
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, trace: Trace, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.trace = trace
+        self.interval = interval
+        self.stop_event = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            with self.trace.lock:
+                idents = [i for i in self.trace.threads if i != me]
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                key = tuple(reversed(stack))
+                per_thread = self.trace.stacks.setdefault(ident, {})
+                per_thread[key] = per_thread.get(key, 0) + 1
+
+
+# ---------- output ----------
+
+def _speedscope(trace: Trace, interval_ms: float) -> Dict[str, Any]:
+    frames: List[Dict[str, str]] = []
+    index: Dict[str, int] = {}
+
+    def fid(name: str) -> int:
+        if name not in index:
+            index[name] = len(frames)
+            frames.append({"name": name})
+        return index[name]
+
+    profiles = []
+    by_thread: Dict[int, list] = {}
+    for ident, name, start, end in trace.spans:
+        by_thread.setdefault(ident, []).append((name, (start - trace.t0) * 1000, (end - trace.t0) * 1000))
+    for n, (ident, spans) in enumerate(sorted(by_thread.items())):
+        events = []
+        for name, s, e in spans:
+            events.append((s, 0, -e, "O", fid(name)))
+            events.append((e, 1, -s, "C", fid(name)))
+        # opens before closes at the same instant; outer spans open first, close last
+        events.sort()
+        end = max(e for _, _, e in spans)
+        profiles.append({
+            "type": "evented", "name": f"spans thread {n}", "unit": "milliseconds",
+            "startValue": 0, "endValue": end,
+            "events": [{"type": t, "frame": f, "at": at} for at, _, _, t, f in events],
+        })
+    for n, (ident, stacks) in enumerate(sorted(trace.stacks.items())):
+        samples = [[fid(name) for name in stack] for stack in stacks]
+        weights = [count * interval_ms for count in stacks.values()]
+        profiles.append({
+            "type": "sampled", "name": f"samples thread {n}", "unit": "milliseconds",
+            "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+        })
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"turn {trace.thread_id}",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+    }
+
+
+def _folded(trace: Trace) -> str:
+    merged: Dict[Tuple[str, ...], int] = {}
+    for stacks in trace.stacks.values():
+        for stack, count in stacks.items():
+            merged[stack] = merged.get(stack, 0) + count
+    return "".join(";".join(stack) + f" {count}\n" for stack, count in merged.items())
+
+
+def _write(trace: Trace) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in trace.thread_id) or "turn"
+    base = os.path.join(PROFILE_DIR, f"{safe}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}")
+    with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+        json.dump(_speedscope(trace, SAMPLE_INTERVAL * 1000), f)
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        f.write(_folded(trace))
+    return base
+
+
+@contextmanager
+def turn(config: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Wrap one graph turn:
+        with profiling.turn(config) as config:
+            app.invoke(inputs, config=config)
+    Yields the config unchanged unless the turn is selected for profiling.
+    """
+    thread_id = str(config.get("configurable", {}).get("thread_id", ""))
+    if not (_settings.enabled or PROFILE_CONTROL_FILE) or not _selected(thread_id):
+        yield config
+        return
+    trace = Trace(thread_id)
+    callbacks = list(config.get("callbacks") or []) + [TraceCallback(trace)]
+    token = _current.set(trace)
+    sampler = _Sampler(trace)
+    sampler.start()
+    try:
+        yield {**config, "callbacks": callbacks}
+    finally:
+        sampler.stop_event.set()
+        sampler.join()
+        _current.reset(token)
+        base = _write(trace)
+        print(f"[profiling] turn {thread_id}: {base}.speedscope.json")
@@ -0,0 +1,202 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.runnables.config import ensure_config
+
+import metrics
+
+# Deadlines, circuit breakers and hedged calls for the graph's dependencies
+# (Ollama, Mongo). Shared by the graph workers and the MCP server.
+#
+# Deadlines: with_budget() stamps an absolute time.monotonic() "deadline" on a
+# turn's config (TURN_BUDGET_MS). Every guarded call waits at most
+# remaining(per_call_default); LangGraph carries the config into nodes and
+# in-process tools, so the budget shrinks as the turn goes on. Outside a turn
+# (MCP server process) only the per-call default applies.
+#
+# Breakers: one per dependency. BREAKER_FAILURES consecutive failures open it.
+# While open, calls fail fast (callers turn that into a degraded reply).
+# After BREAKER_OPEN_MS a single probe call is let through (half-open): its
+# success closes the breaker, its failure re-opens it. An error the breaker's
+# is_failure() does not count (e.g. a call shed by our own queue) is neither:
+# the probe slot is handed back.
+#
+# Hedging: run(fn, hedge=...) starts the hedge after hedge_after seconds, or
+# at once if fn fails, and returns whichever succeeds first. Only for
+# idempotent reads.
+
+TURN_BUDGET_MS = float(os.getenv("TURN_BUDGET_MS", "30000"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_OPEN_MS = float(os.getenv("BREAKER_OPEN_MS", "5000"))
+RESILIENCE_WORKERS = int(os.getenv("RESILIENCE_WORKERS", "64"))
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def with_budget(config: Dict[str, Any], budget_ms: float = TURN_BUDGET_MS) -> Dict[str, Any]:
+    """
+    Config for one turn: every call in it must finish within budget_ms of now.
+    The LLM scheduler's queue deadline is capped to the same instant.
+    """
+    conf = dict(config.get("configurable", {}))
+    deadline = time.monotonic() + budget_ms / 1000
+    conf["deadline"] = deadline
+    conf["llm_deadline"] = min(conf.get("llm_deadline", deadline), deadline)
+    return {**config, "configurable": conf}
+
+
+def remaining(default: float, config: Optional[Dict[str, Any]] = None) -> float:
+    """
+    Seconds a call may take: the per-call default, cut to what is left of the
+    turn budget. Raises DeadlineExceeded once the budget is spent.
+    """
+    deadline = ensure_config(config).get("configurable", {}).get("deadline")
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    if left <= 0:
+        metrics.incr("deadline.exhausted")
+        raise DeadlineExceeded("turn budget exhausted")
+    return min(default, left)
+
+
+class Breaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, open_seconds: float = BREAKER_OPEN_MS / 1000,
+                 is_failure: Callable[[BaseException], bool] = lambda e: True):
+        self.name = name
+        self.failures = failures
+        self.open_seconds = open_seconds
+        self.is_failure = is_failure
+        self.lock = threading.Lock()
+        self.state = "closed"  # closed | open | half_open
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        """
+        True if a call may go ahead. In half-open only one probe is in flight;
+        its outcome must be reported with success()/failure().
+        """
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                metrics.incr("breaker.probes", dependency=self.name)
+                return True
+        metrics.incr("breaker.rejected", dependency=self.name)
+        return False
+
+    def success(self) -> None:
+        with self.lock:
+            if self.state != "closed":
+                print(f"[breaker] {self.name} closed")
+            self.state = "closed"
+            self.consecutive = 0
+            self.probing = False
+
+    def failure(self) -> None:
+        with self.lock:
+            self.consecutive += 1
+            self.probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                metrics.incr("breaker.opened", dependency=self.name)
+                print(f"[breaker] {self.name} open after {self.consecutive} failures")
+
+    def abandon(self) -> None:
+        """
+        The allowed call never reached the dependency: frees a half-open
+        probe without changing the state.
+        """
+        with self.lock:
+            self.probing = False
+
+    def record(self, error: Optional[BaseException]) -> None:
+        if error is None:
+            self.success()
+        elif self.is_failure(error):
+            self.failure()
+        else:
+            self.abandon()
+
+
+_breakers: Dict[str, Breaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, **kwargs: Any) -> Breaker:
+    with _breakers_lock:
+        b = _breakers.get(name)
+        if b is None:
+            b = _breakers[name] = Breaker(name, **kwargs)
+            metrics.gauge(f"breaker.{name}", lambda: b.state)
+        return b
+
+
+_pool = ThreadPoolExecutor(max_workers=RESILIENCE_WORKERS, thread_name_prefix="resilience")
+
+
+def _submit(fn: Callable[[], Any]) -> Future:
+    # each attempt runs in a copy of the caller's context (LangGraph config, pymongo.timeout, traces)
+    return _pool.submit(contextvars.copy_context().run, fn)
+
+
+def run(fn: Callable[[], Any], timeout: float, hedge: Optional[Callable[[], Any]] = None,
+        hedge_after: float = 0.0, breaker: Optional[Breaker] = None, charge_timeout: bool = True) -> Any:
+    """
+    fn() with at most `timeout` seconds of waiting; a call still running then
+    is abandoned (it ends on its client timeout). The breaker, if given, is
+    told how fn itself did; the hedge's outcome is not held against it.
+    charge_timeout=False when `timeout` was cut short by the caller's budget:
+    running out of it then says nothing about the dependency.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    hedge_at = start + hedge_after
+    primary = _submit(fn)
+    futures = {primary: "primary"}
+    error: Optional[BaseException] = None
+    while True:
+        now = time.monotonic()
+        if hedge is not None and (now >= hedge_at or not futures):
+            futures[_submit(hedge)] = "hedge"
+            hedge = None
+            metrics.incr("hedge.fired")
+        if not futures:
+            raise error
+        if now >= deadline:
+            if breaker is not None and primary in futures:
+                breaker.failure() if charge_timeout else breaker.abandon()
+            metrics.incr("deadline.exceeded")
+            raise DeadlineExceeded(f"no reply within {timeout:.2f}s")
+        until = min(deadline, hedge_at) if hedge is not None else deadline
+        done, _ = wait(list(futures), timeout=until - now, return_when=FIRST_COMPLETED)
+        for f in done:
+            who = futures.pop(f)
+            exc = f.exception()
+            if f is primary and breaker is not None:
+                breaker.record(exc)
+            if exc is None:
+                if who == "hedge":
+                    metrics.incr("hedge.won")
+                    if breaker is not None and primary in futures:
+                        # settle a half-open probe once the slow primary ends
+                        primary.add_done_callback(lambda p: breaker.record(p.exception()))
+                return f.result()
+            if error is None or f is primary:
+                error = exc
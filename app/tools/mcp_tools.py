@@ -1,8 +1,13 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import base64
+import json
+import os
 
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 
+from memory.store import remember_cards, remember_preferences
+
 from mcp_2.fransa_mcp import (
     set_pin,
     retrieve_card_details,
@@ -12,8 +17,104 @@ from mcp_2.fransa_mcp import (
 )
 
 
-@tool
-def change_pin_tool(clientId: str, cardToken: str, new_pin: str) -> Dict[str, Any]:
+# ---------- result shaping ----------
+# Tools return (compact, full) via response_format="content_and_artifact":
+# the model only sees the compact JSON string, the full MCP response stays on
+# the ToolMessage.artifact in graph state (the agents' ToolNode appends the
+# ToolMessages, see graph/tool_loop.py).
+#
+# Per MCP tool: "fields" is the allowlist (None = scalar, list = allowed
+# fields of a nested dict / rows of a list), "defaults" are values not worth
+# sending. Lists become {"cols": [...], "rows": [[...]]} and are cut at
+# TOOL_RESULT_MAX_ROWS with a "more" count.
+
+TOOL_RESULT_MAX_ROWS = int(os.getenv("TOOL_RESULT_MAX_ROWS", "20"))
+
+_STATUS = {"responseCode": None, "responseDescription": None}
+
+TOOL_SHAPES: Dict[str, Dict[str, Any]] = {
+    "set_pin": {"fields": _STATUS},
+    "update_card_status": {"fields": _STATUS},
+    "create_new_card": {
+        "fields": {**_STATUS, "cardToken": None, "cardNumber": None, "cardExpiryDate": None},
+    },
+    "list_client_cards": {
+        "fields": {**_STATUS, "cards": [
+            "cardToken", "last4", "status", "type", "productType",
+            "currency", "expiryDate", "availableBalance", "limitProfile",
+        ]},
+    },
+    "retrieve_card_details": {
+        "fields": {**_STATUS, "cardDetails": [
+            "cardNumber", "status", "expiryDate", "currency",
+            "availableBalance", "cashback", "paymentPercentage",
+        ]},
+        "defaults": {"cashback": "0.00", "paymentPercentage": "10"},
+    },
+}
+
+# dropped everywhere
+_GLOBAL_DEFAULTS = {"responseDescription": "Success"}
+
+
+def _empty(value: Any, key: str, defaults: Dict[str, Any]) -> bool:
+    if value is None or value == "" or value == [] or value == {}:
+        return True
+    if key in defaults and value == defaults[key]:
+        return True
+    return key in _GLOBAL_DEFAULTS and value == _GLOBAL_DEFAULTS[key]
+
+
+def _rows(items: List[Dict[str, Any]], cols: List[str], defaults: Dict[str, Any], max_rows: int) -> Dict[str, Any]:
+    shown = items[:max_rows]
+    # keep only columns that carry a value in at least one shown row
+    cols = [c for c in cols if any(not _empty(r.get(c), c, defaults) for r in shown)]
+    out: Dict[str, Any] = {
+        "cols": cols,
+        "rows": [["" if _empty(r.get(c), c, defaults) else r.get(c) for c in cols] for r in shown],
+    }
+    if len(items) > max_rows:
+        out["more"] = len(items) - max_rows
+    return out
+
+
+def compact_result(tool_name: str, resp: Dict[str, Any], max_rows: int = TOOL_RESULT_MAX_ROWS) -> str:
+    shape = TOOL_SHAPES.get(tool_name, {})
+    fields = shape.get("fields") or {k: None for k in resp}
+    defaults = shape.get("defaults", {})
+    out: Dict[str, Any] = {}
+    for key, sub in fields.items():
+        value = resp.get(key)
+        if isinstance(value, list):
+            if value and isinstance(value[0], dict):
+                out[key] = _rows(value, sub or list(value[0]), defaults, max_rows)
+            elif value:
+                out[key] = value[:max_rows]
+                if len(value) > max_rows:
+                    out[key].append(f"...{len(value) - max_rows} more")
+        elif isinstance(value, dict):
+            nested = {k: value.get(k) for k in (sub or value)}
+            nested = {k: v for k, v in nested.items() if not _empty(v, k, defaults)}
+            if nested:
+                out[key] = nested
+        elif not _empty(value, key, defaults):
+            out[key] = value
+    return json.dumps(out, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _shaped(tool_name: str, resp: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    return compact_result(tool_name, resp), resp
+
+
+def _channel(config: Optional[RunnableConfig]) -> str:
+    # the MCP channel bucket (mcp_2/admission.py) is per conversation, not one
+    # shared "MCP-CHANNEL" bucket for every user of the assistant
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    return f"MCP:{thread_id}" if thread_id else "MCP-CHANNEL"
+
+
+@tool(response_format="content_and_artifact")
+def change_pin_tool(clientId: str, cardToken: str, new_pin: str, config: RunnableConfig = None) -> Tuple[str, Dict[str, Any]]:
     """"
     Change the PIN for a given card based on the request of the user
     """
@@ -24,19 +125,22 @@ def change_pin_tool(clientId: str, cardToken: str, new_pin: str) -> Dict[str, An
     pin_b64 = base64.b64encode(raw.encode()).decode()
 
     resp = set_pin(
-        channelId="MCP-CHANNEL",
+        channelId=_channel(config),
         clientId=str(clientId),
         cardToken=str(cardToken),
         pin=pin_b64,
     )
-    return resp
+    if resp.get("responseCode") == "000":
+        remember_preferences(str(clientId), {"lastCardToken": str(cardToken)})
+    return _shaped("set_pin", resp)
 
 
-@tool
+@tool(response_format="content_and_artifact")
 def view_card_details_tool(
     cardToken: Optional[str] = None,
     clientId: Optional[str] = None,
-) -> Dict[str, Any]:
+    config: RunnableConfig = None,
+) -> Tuple[str, Dict[str, Any]]:
     """
     View card information.
 
@@ -49,21 +153,23 @@ def view_card_details_tool(
     """
     if cardToken:
         resp = retrieve_card_details(
-            channel="MCP-CHANNEL",
+            channel=_channel(config),
             cardToken=str(cardToken),
         )
+        return _shaped("retrieve_card_details", resp)
     elif clientId:
         resp = list_client_cards(
-            channelId="MCP-CHANNEL",
+            channelId=_channel(config),
             clientId=str(clientId),
         )
+        if resp.get("responseCode") == "000":
+            remember_cards(str(clientId), resp.get("cards", []))
+        return _shaped("list_client_cards", resp)
     else:
         raise ValueError("Provide either cardToken or clientId")
 
-    return resp
-
 
-@tool
+@tool(response_format="content_and_artifact")
 def create_card_tool(
     clientId: str,
     firstName: str,
@@ -83,7 +189,8 @@ def create_card_tool(
     cardLimit: str = "0",
     minimumPercentage: str = "10",
     design: str = "",
-) -> Dict[str, Any]:
+    config: RunnableConfig = None,
+) -> Tuple[str, Dict[str, Any]]:
     """
     Create a new card for an existing client.
 
@@ -104,7 +211,7 @@ def create_card_tool(
         MaritalStatus=MaritalStatus,
         gender=gender,
         email=email,
-        channelId="MCP-CHANNEL",
+        channelId=_channel(config),
         type=type,
         productType=productType,
         currency=currency,
@@ -114,15 +221,16 @@ def create_card_tool(
         design=design,
     )
 
-    return resp
+    return _shaped("create_new_card", resp)
 
 
-@tool
+@tool(response_format="content_and_artifact")
 def stop_card_tool(
     cardToken: str,
     status: str = "S",
     reason: str = "User requested card block",
-) -> Dict[str, Any]:
+    config: RunnableConfig = None,
+) -> Tuple[str, Dict[str, Any]]:
     """
     Stop / block a card by updating its status.
 
@@ -132,9 +240,9 @@ def stop_card_tool(
         reason: Optional human-readable reason.
     """
     resp = update_card_status(
-        channelId="MCP-CHANNEL",
+        channelId=_channel(config),
         cardToken=str(cardToken),
         status=status,
         reason=reason,
     )
-    return resp
\ No newline at end of file
+    return _shaped("update_card_status", resp)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+import sys
 import random
 import string
 import calendar
@@ -9,6 +10,13 @@ from dotenv import load_dotenv
 from pymongo import MongoClient
 import bcrypt
 
+# same imports as the app: mcp_2.* and its top-level modules (metrics, ...) live under app/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "app"))
+from mcp_2.stan import build_allocator
+from mcp_2.rollups import rebuild as rebuild_rollups
+from mcp_2.qr import ensure_indexes as ensure_qr_indexes
+from mcp_2.expiry import ensure_indexes as ensure_expiry_indexes, parse_expiry
+
 load_dotenv()
 MONGODB_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 DB_NAME = os.getenv("MONGO_DB", "fransa_demo")
@@ -17,9 +25,10 @@ mongo = MongoClient(MONGODB_URI)[DB_NAME]
 users = mongo["users"]
 cards = mongo["cards"]
 limit_profiles = mongo["limit_profiles"]
+spending_rollups = mongo["spending_rollups"]
+qr_withdrawals = mongo["qr_withdrawals"]
 
-def _stan() -> str:
-    return datetime.utcnow().strftime("%H%M%S%f")[-12:]
+_stan = build_allocator(mongo)
 
 def _fmt(amount: float) -> str:
     return f"{float(amount):.2f}"
@@ -105,6 +114,7 @@ def _card_doc(
         "limitProfile": limitProfile,      # must match an entry in limit_profiles
         "status": status,
         "expiryDate": expiry,              # ddmmyyyy
+        "expiresAt": parse_expiry(expiry), # same day as a date, indexed for the renewal sweeper
         "cvv2": f"{random.randint(0, 999):03d}",
         "pinHash": bcrypt.hashpw(b"0000", bcrypt.gensalt()).decode(),
         "availableBalance": float(avail),
@@ -145,6 +155,8 @@ def main():
     users.delete_many({})
     cards.delete_many({})
     limit_profiles.delete_many({})
+    qr_withdrawals.delete_many({})
+    ensure_qr_indexes(qr_withdrawals)
 
     limit_profiles_seed = [
         {
@@ -201,7 +213,6 @@ def main():
             "email": "rami.k@example.com",
             "wallets": {"840": 150.00, "422": 2_000_000.00, "978": 0.00},
             "accounts": {"840": 2500.00, "422": 0.00, "978": 0.00},
-            "qr_withdrawals": [],
         },
         {
             "clientId": "1002",
@@ -211,7 +222,6 @@ def main():
             "email": "sara.n@example.com",
             "wallets": {"840": 20.00, "978": 500.00},
             "accounts": {"840": 10.00, "978": 2000.00},
-            "qr_withdrawals": [],
         },
     ]
     users.insert_many(users_seed)
@@ -328,6 +338,9 @@ def main():
     )
 
     cards.insert_many(card_docs)
+    ensure_expiry_indexes(cards)
+    # seeded txns bypass the MCP tools, so build their rollups in one pass
+    rebuild_rollups(cards, spending_rollups)
 
     # Print a compact summary that’s actually useful
     ucount = users.count_documents({})